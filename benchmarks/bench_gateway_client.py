@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+"""
+Appels passerelle contre un serveur de test local : ancien chemin vs nouveau.
+
+  ancien : requests.post(...) à chaque appel (nouvelle connexion TCP, timeout=30)
+  nouveau : models/gateway_client (session keep-alive partagée, délais
+            connexion/lecture, retry borné avec jitter, métriques)
+
+Le serveur local simule la création de session Wave ; --fail-rate fait
+répondre 503 à une partie des appels pour exercer les nouvelles tentatives.
+
+Usage (odoo importable, comme pour le module) :
+    python3 benchmarks/bench_gateway_client.py --calls 500 --threads 8 --fail-rate 0.05
+"""
+import argparse
+import importlib.util
+import json
+import os
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load_gateway_client():
+    path = os.path.join(HERE, '..', 'models', 'gateway_client.py')
+    spec = importlib.util.spec_from_file_location('gateway_client', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def make_stub_server(fail_rate):
+    class WaveStub(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if random.random() < fail_rate:
+                status, body = 503, b'{"code": "service-unavailable"}'
+            else:
+                status = 200
+                body = json.dumps({
+                    'id': 'cos-%s' % random.getrandbits(32),
+                    'wave_launch_url': 'https://pay.wave.com/c/stub',
+                    'checkout_status': 'open',
+                    'payment_status': 'processing',
+                }).encode()
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), WaveStub)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def old_call(base_url, i):
+    return requests.post(base_url + '/v1/checkout/sessions', json={'amount': 1000, 'currency': 'XOF'},
+                         headers={'Authorization': 'Bearer stub'}, timeout=30).status_code
+
+
+def new_call(client, i):
+    return client.post('/v1/checkout/sessions', json={'amount': 1000, 'currency': 'XOF'},
+                       headers={'Authorization': 'Bearer stub'}, idempotency_key='bench-%s' % i).status_code
+
+
+def run(label, fn, calls, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        statuses = list(pool.map(fn, range(calls)))
+    elapsed = time.perf_counter() - started
+    failed = sum(1 for s in statuses if s != 200)
+    print("%-8s %5d appels, %2d threads : %7.3f s  %8.1f appels/s  %4d en échec"
+          % (label, calls, threads, elapsed, calls / elapsed, failed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--calls', type=int, default=500)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--fail-rate', type=float, default=0.0)
+    args = parser.parse_args()
+
+    server = make_stub_server(args.fail_rate)
+    base_url = 'http://127.0.0.1:%s' % server.server_address[1]
+    gateway_client = _load_gateway_client()
+    client = gateway_client.GatewayClient('wave', base_url=base_url, pool_maxsize=args.threads)
+
+    run('ancien', lambda i: old_call(base_url, i), args.calls, args.threads)
+    run('nouveau', lambda i: new_call(client, i), args.calls, args.threads)
+    print(json.dumps(client.metrics.snapshot(), indent=2))
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Débit de vérification des mots de passe au login : ancien chemin vs nouveau.
+
+  ancien : is_hashed_password + check_password, chacun avec un CryptContext
+           construit à l'appel (cf. auth.py avant le contexte partagé)
+  nouveau : controllers/password_hasher (contexte partagé, une seule
+            vérification, créneaux bornés)
+
+Usage (passlib et odoo importables, comme pour le module) :
+    python3 benchmarks/bench_login_password.py --logins 200 --threads 8
+"""
+import argparse
+import importlib.util
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.context import CryptContext
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def _load_password_hasher():
+    path = os.path.join(HERE, '..', 'controllers', 'password_hasher.py')
+    spec = importlib.util.spec_from_file_location('password_hasher', path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def old_login(password, stored):
+    def ctx():
+        return CryptContext(schemes=["pbkdf2_sha512", "md5_crypt"], deprecated="md5_crypt")
+    if ctx().identify(stored):
+        return ctx().verify(password, stored)
+    return stored == password
+
+
+def new_login(hasher, password, stored):
+    if hasher.is_hashed_password(stored):
+        return hasher.verify_password(password, stored)[0]
+    return stored == password
+
+
+def run(label, fn, logins, threads):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=threads) as pool:
+        results = list(pool.map(lambda _i: fn(), range(logins)))
+    elapsed = time.perf_counter() - started
+    assert all(results), "%s : vérification en échec" % label
+    print("%-8s %5d logins, %2d threads : %7.3f s  %8.1f logins/s  %6.2f ms/login"
+          % (label, logins, threads, elapsed, logins / elapsed, 1000.0 * elapsed / logins))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--logins', type=int, default=200)
+    parser.add_argument('--threads', type=int, default=8)
+    args = parser.parse_args()
+
+    hasher = _load_password_hasher()
+    password = 'correct horse battery staple'
+    stored = hasher.hash_password(password)
+
+    run('ancien', lambda: old_login(password, stored), args.logins, args.threads)
+    run('nouveau', lambda: new_login(hasher, password, stored), args.logins, args.threads)
+
+
+if __name__ == '__main__':
+    main()
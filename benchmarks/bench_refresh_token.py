@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""
+Rafraîchissements de tokens par seconde : ancien chemin ORM vs rotation SQL.
+
+  ancien : fetch_by_refresh_token + update_access_token (search / unlink / create / write)
+  nouveau : rotate_refresh_token (une instruction CTE)
+
+À exécuter dans un shell Odoo sur une base où le module est installé
+(`env` fourni par le shell) ; tout est annulé à la fin :
+    odoo-bin shell -d <base> --no-http < benchmarks/bench_refresh_token.py
+Variable d'environnement BENCH_REFRESHES : nombre de rafraîchissements (défaut 2000).
+"""
+import os
+import time
+
+from odoo.addons.res_api_magasin.controllers.main import generate_token
+from odoo.addons.res_api_magasin.controllers.simple_token_store import SimpleTokenStore
+
+REFRESHES = int(os.environ.get('BENCH_REFRESHES', 2000))
+
+
+def bench_old(env, store, refresh_token):
+    started = time.perf_counter()
+    for _i in range(REFRESHES):
+        data = store.fetch_by_refresh_token(env, refresh_token)
+        store.update_access_token(env, old_access_token=data['access_token'], new_access_token=generate_token(),
+                                  expires_in=3600, refresh_token=refresh_token, user_id=data['user_id'])
+        env.flush_all()
+    return time.perf_counter() - started
+
+
+def bench_new(env, store, refresh_token):
+    started = time.perf_counter()
+    for _i in range(REFRESHES):
+        new_refresh_token = generate_token()
+        result = store.rotate_refresh_token(env, refresh_token, generate_token(), 3600, new_refresh_token)
+        assert result['status'] == 'ok', result
+        refresh_token = new_refresh_token
+    return time.perf_counter() - started
+
+
+def main(env):
+    store = SimpleTokenStore()
+    for label, bench in (('ancien', bench_old), ('nouveau', bench_new)):
+        refresh_token = generate_token()
+        store.save_all_tokens(env, access_token=generate_token(), expires_in=3600,
+                              refresh_token=refresh_token, refresh_expires_in=7200, user_id=env.uid)
+        env.flush_all()
+        elapsed = bench(env, store, refresh_token)
+        print("%-8s %6d rafraîchissements : %7.3f s  %8.1f /s" % (label, REFRESHES, elapsed, REFRESHES / elapsed))
+    env.cr.rollback()
+
+
+main(env)  # noqa: F821 (fourni par odoo-bin shell)
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Livraison de l'outbox webhook contre un récepteur local (ThreadingHTTPServer).
+
+Exerce rest.api.webhook.event._cron_dispatch(session=...) de bout en bout :
+  1. livraison : débit (événements/s) ; le récepteur vérifie chaque signature
+     HMAC (X-Webhook-Signature) et l'écart d'horodatage
+  2. backoff : le récepteur répond 503 ; les événements restent 'pending',
+     attempts incrémenté, next_attempt_at repoussé dans la fenêtre attendue
+  3. dead-letter : nouvel échec à max_attempts -> état 'dead', last_error renseigné
+
+À exécuter dans un shell Odoo sur une base où le module est installé
+(`env` fourni par le shell) ; tout est annulé à la fin :
+    odoo-bin shell -d <base> --no-http < benchmarks/bench_webhook_outbox.py
+Variable d'environnement BENCH_EVENTS : nombre d'événements livrés (défaut 2000).
+"""
+import hmac
+import json
+import os
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from odoo import fields
+from odoo.addons.res_api_magasin.models.rest_api_webhook import (
+    WEBHOOK_BACKOFF_BASE, webhook_signature,
+)
+
+EVENTS = int(os.environ.get('BENCH_EVENTS', 2000))
+SECRET = 'bench-secret'
+MAX_TIMESTAMP_SKEW = 300
+
+
+def make_receiver():
+    class Receiver(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            timestamp = self.headers.get('X-Webhook-Timestamp') or '0'
+            expected = 'sha256=%s' % webhook_signature(SECRET, timestamp, body)
+            server = self.server
+            with server.lock:
+                if not hmac.compare_digest(expected, self.headers.get('X-Webhook-Signature') or ''):
+                    server.bad_signatures += 1
+                elif abs(time.time() - int(timestamp)) > MAX_TIMESTAMP_SKEW:
+                    server.bad_signatures += 1
+                else:
+                    server.received += len(json.loads(body)['events'])
+            status = server.status
+            self.send_response(status)
+            self.send_header('Content-Length', '0')
+            self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Receiver)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.status = 200
+    server.received = server.bad_signatures = 0
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def make_due(env, events):
+    """Rend les événements dus pour le now() SQL (début de la transaction du shell)."""
+    events.write({'next_attempt_at': env.cr.now() - timedelta(seconds=1)})
+    env.flush_all()
+
+
+def main(env):
+    server = make_receiver()
+    Event = env['rest.api.webhook.event']
+    webhook = env['rest.api.webhook'].create({
+        'name': 'bench',
+        'url': 'http://127.0.0.1:%s/hook' % server.server_address[1],
+        'secret': SECRET,
+        'batch_size': 50,
+        'max_attempts': 2,
+    })
+    partner = env.user.partner_id
+    session = requests.Session()
+
+    def create_events(count):
+        return Event.create([{
+            'webhook_id': webhook.id,
+            'event_type': 'invoice.posted',
+            'res_model': 'res.partner',
+            'res_id': partner.id,
+            'payload': json.dumps({'id': i, 'amount_total': 1000.0}),
+        } for i in range(count)])
+
+    # 1. livraison
+    events = create_events(EVENTS)
+    make_due(env, events)
+    started = time.perf_counter()
+    stats = Event._cron_dispatch(session=session, auto_commit=False)
+    elapsed = time.perf_counter() - started
+    assert stats['sent'] == EVENTS, stats
+    assert server.received == EVENTS and not server.bad_signatures, (server.received, server.bad_signatures)
+    assert set(events.mapped('state')) == {'done'}
+    print("livraison  %6d événements : %7.3f s  %8.1f /s" % (EVENTS, elapsed, EVENTS / elapsed))
+
+    # 2. backoff
+    server.status = 503
+    events = create_events(10)
+    make_due(env, events)
+    before = fields.Datetime.now()
+    stats = Event._cron_dispatch(session=session, auto_commit=False)
+    assert stats == {'sent': 0, 'retried': 10, 'dead': 0}, stats
+    assert set(events.mapped('state')) == {'pending'} and set(events.mapped('attempts')) == {1}
+    for event in events:
+        delay = (event.next_attempt_at - before).total_seconds()
+        assert WEBHOOK_BACKOFF_BASE - 1 <= delay <= WEBHOOK_BACKOFF_BASE * 1.1 + 1, delay
+    print("backoff    %6d événements reportés de ~%s s" % (len(events), WEBHOOK_BACKOFF_BASE))
+
+    # 3. dead-letter (max_attempts = 2)
+    make_due(env, events)
+    stats = Event._cron_dispatch(session=session, auto_commit=False)
+    assert stats == {'sent': 0, 'retried': 0, 'dead': 10}, stats
+    assert set(events.mapped('state')) == {'dead'} and all(e.last_error.startswith('HTTP 503') for e in events)
+    print("dead       %6d événements en échec définitif" % len(events))
+
+    server.shutdown()
+    env.cr.rollback()
+
+
+main(env)  # noqa: F821 (fourni par odoo-bin shell)
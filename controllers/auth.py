@@ -2,11 +2,14 @@
 from .main import *  # error_response, successful_response, error_resp, error_response_401__invalid_token, token_store, generate_token, rest_cors_value, logging, json, werkzeug, request
 import sys
 import time
-import re
-from passlib.context import CryptContext
 from odoo import http, fields
 import logging
 
+from . import password_hasher
+from .password_hasher import PasswordHasherBusy
+from .rental_api import partner_rental_summary
+from .rate_limit import rate_limited, by_ip, by_username
+
 _logger = logging.getLogger(__name__)
 
 # =========================
@@ -16,6 +19,17 @@ OUT__auth_gettokens__SUCCESS_CODE = 200
 OUT__auth_refreshtoken__SUCCESS_CODE = 200
 OUT__auth_deletetokens__SUCCESS_CODE = 200
 
+# Utilisateur technique porteur des tokens API : login ou xmlid (ir.config_parameter)
+TECHNICAL_USER_PARAM = 'rest_api.technical_user'
+TECHNICAL_USER_DEFAULT = 'base.user_admin'
+# Résolu une fois par worker : (db, valeur du paramètre) -> uid
+_technical_uids = {}
+
+# Rotation des refresh tokens : demandée par le client ("rotate_refresh_token": true,
+# applications qui enregistrent le refresh_token renvoyé) ou imposée à tous quand
+# le paramètre vaut 'always' (une fois les anciennes applications retirées).
+REFRESH_ROTATION_PARAM = 'rest_api.refresh_token_rotation'
+
 
 class ControllerREST(http.Controller):
     # ---------------------------------------------------------
@@ -68,23 +82,32 @@ class ControllerREST(http.Controller):
 
     def _authenticate_odoo_user(self):
         """
-        Ouvre une session Odoo technique pour obtenir un uid valide côté /api.
-        Tu peux paramétrer ces identifiants dans ir.config_parameter si besoin.
+        uid de l'utilisateur technique auquel les tokens sont rattachés, sans
+        session Odoo ni second contrôle de mot de passe. Paramètre
+        rest_api.technical_user : login ou xmlid (défaut base.user_admin) ;
+        résolu une fois par worker et par valeur du paramètre, l'état actif
+        étant revérifié à chaque appel (lecture par clé primaire).
         """
-        # DEV
-        # email_admin = 'ccbmtech@ccbm.sn'
-        # password_admin = 'password'
-
-        # PROD (décommente si besoin)
-        email_admin = 'ccbmtech@ccbm.sn'
-        password_admin = 'ccbmtecH@987'
-
-        try:
-            request.session.authenticate(self._get_db_name(), email_admin, password_admin)
-            return request.session.uid
-        except Exception as e:
-            _logger.error(f"Odoo authentication failed: {str(e)}")
-            return None
+        env = request.env(su=True)
+        ref = (env['ir.config_parameter'].get_param(TECHNICAL_USER_PARAM) or TECHNICAL_USER_DEFAULT).strip()
+        key = (env.cr.dbname, ref)
+        uid = _technical_uids.get(key)
+        if uid is not None:
+            env.cr.execute("SELECT 1 FROM res_users WHERE id = %s AND active", (uid,))
+            if not env.cr.fetchone():
+                # archivé (ou supprimé) depuis la mise en cache
+                _technical_uids.pop(key, None)
+                uid = None
+        if uid is None:
+            user = env['res.users'].search([('login', '=', ref)], limit=1)
+            if not user and '@' not in ref and '.' in ref:
+                user = env.ref(ref, raise_if_not_found=False)
+                user = user if user and user._name == 'res.users' else env['res.users']
+            if not user or not user.active:
+                _logger.error("Utilisateur technique API introuvable ou inactif (%s=%s)", TECHNICAL_USER_PARAM, ref)
+                return None
+            uid = _technical_uids[key] = user.id
+        return uid
 
     # ---------------------------------------------------------
     # Helpers validation/inputs
@@ -116,29 +139,6 @@ class ControllerREST(http.Controller):
     # ---------------------------------------------------------
     # Helpers Partner/Company/Parent
     # ---------------------------------------------------------
-    def _normalize_phone(self, raw):
-        """
-        Normalise un téléphone pour la recherche:
-        - enlève espaces, tirets, points, parenthèses
-        - gère +221 / 00221 / 221
-        - conserve uniquement les chiffres finaux utiles
-        """
-        if not raw:
-            return None
-        s = str(raw).strip()
-        s = re.sub(r'[\s\-\.\(\)]', '', s)
-        s = s.replace('+', '')
-        # Supprime préfixes 00221 / 221
-        if s.startswith('00221'):
-            s = s[5:]
-        elif s.startswith('221'):
-            s = s[3:]
-        # Supprimer zéros en tête superflus (ex: 0078...)
-        s = re.sub(r'^0+', '', s)
-        # Version longue avec 221 pour comparer aussi stockages complets
-        with_cc = f'221{s}' if not s.startswith('221') else s
-        return s, with_cc
-
     def _get_parent_data(self, user_partner):
         if user_partner.parent_id:
             return {
@@ -160,56 +160,40 @@ class ControllerREST(http.Controller):
     # ---------------------------------------------------------
     # Password helpers
     # ---------------------------------------------------------
+    # Contexte partagé et créneaux bornés : cf. password_hasher
     def hash_password(self, password):
-        pwd_context = CryptContext(schemes=["pbkdf2_sha512", "md5_crypt"], deprecated="md5_crypt")
-        return pwd_context.hash(password)
+        return password_hasher.hash_password(password)
 
     def check_password(self, password, hashed_password):
-        pwd_context = CryptContext(schemes=["pbkdf2_sha512", "md5_crypt"], deprecated="md5_crypt")
-        return pwd_context.verify(password, hashed_password)
+        return password_hasher.verify_password(password, hashed_password)[0]
 
     def is_hashed_password(self, password):
-        if not password:
-            return False
-        pwd_context = CryptContext(schemes=["pbkdf2_sha512", "md5_crypt"], deprecated="md5_crypt")
-        return bool(pwd_context.identify(password))
+        return password_hasher.is_hashed_password(password)
 
     # ---------------------------------------------------------
     # Lookup Partner & init password
     # ---------------------------------------------------------
     def _get_user_partner(self, username):
         """
-        Recherche par email exact OU téléphone normalisé (champ phone OU mobile).
-        IMPORTANT: domaine Odoo nécessite les opérateurs '|' pour OR.
+        Recherche par email normalisé OU téléphone E.164 (champ phone OU mobile),
+        en égalité exacte sur des colonnes indexées.
         """
         self._authenticate_admin()
 
-        # Cas email ?
-        is_email = '@' in username
-        if is_email:
-            domain = [('email', '=', username)]
+        Partner = request.env['res.partner'].sudo()
+        if '@' in username:
+            partner = Partner._find_by_email(username)
         else:
-            short, with_cc = self._normalize_phone(username) or (None, None)
-            # Si rien d'exploitable
-            if not short and not with_cc:
-                return request.env['res.partner'].sudo().browse([])
-            # phone OU mobile (short) OU (221+short)
-            domain = ['|', '|',
-                      ('phone', 'ilike', short),
-                      ('mobile', 'ilike', short),
-                      ('phone', 'ilike', with_cc)]
-            # on ajoute le mobile avec cc
-            domain = ['|'] + domain + [('mobile', 'ilike', with_cc)]
-
-        partner = request.env['res.partner'].sudo().search(domain, limit=1)
-        _logger.info("Partner lookup with domain %s -> %s", domain, partner and partner.id)
+            partner = Partner._find_by_phone(username)
+        _logger.info("Partner lookup for %s -> %s", '@' in username and 'email' or 'phone', partner and partner.id)
         return partner
 
     def _verify_partner_password(self, user_partner, password):
         """
         - Si pas de mot de passe: initialiser (première connexion)
         - Si mdp en clair: valider et migrer vers hash
-        - Si hashé: vérifier
+        - Si hashé: vérifier (une seule vérification pbkdf2), re-hacher si le
+          schéma est déprécié (md5_crypt) ou si le nombre de tours a changé
         """
         if user_partner and not getattr(user_partner, 'password', None):
             hashed = self.hash_password(password)
@@ -219,7 +203,10 @@ class ControllerREST(http.Controller):
 
         stored = user_partner.password
         if self.is_hashed_password(stored):
-            return self.check_password(password, stored)
+            ok, new_hash = password_hasher.verify_password(password, stored)
+            if ok and new_hash:
+                user_partner.sudo().write({'password': new_hash})
+            return ok
 
         # stocké en clair (ancien) ?
         if stored == password:
@@ -254,10 +241,11 @@ class ControllerREST(http.Controller):
         }
 
     def _create_successful_response(self, uid, tokens, user_data, company_data, parent_data):
+        user_env = request.env(user=uid, su=True) if uid else None
         payload = {
             'uid': uid,
-            'user_context': request.session.context if uid else {},
-            'company_id': request.env.user.company_id.id if uid else None,
+            'user_context': dict(user_env['res.users'].context_get(), uid=uid) if user_env else {},
+            'company_id': user_env.user.company_id.id if user_env else None,
             'user_info': user_data,
             'is_verified': user_data.get('is_verified', False),
             'company': company_data,
@@ -267,82 +255,17 @@ class ControllerREST(http.Controller):
         return self._no_cookie_response(OUT__auth_gettokens__SUCCESS_CODE, payload)
 
     # ---------------------------------------------------------
-    # ====== RENTAL HELPERS (résumés locatifs) ======
+    # USER DATA (profil minimal ; bloc locatif sur demande)
     # ---------------------------------------------------------
-    def _serialize_property_short(self, p):
-        return {
-            "id": p.id,
-            "name": p.name,
-            "status": p.status,
-            "building_id": p.building_id.id if p.building_id else None,
-            "building_name": p.building_id.name if p.building_id else None,
-            "monthly_rent": float(p.monthly_rent or 0.0),
-        }
-
-    def _serialize_invoice_short(self, inv):
-        total = float(inv.amount_total or 0.0)
-        residual = float(inv.amount_residual or 0.0)
-        return {
-            "id": inv.id,
-            "code": inv.name,
-            "status": inv.payment_state,  # paid / partial / not_paid / in_payment
-            "amount_total": total,
-            "amount_residual": residual,
-            "partner_id": inv.partner_id.id if inv.partner_id else None,
-            "due_date": str(inv.invoice_date_due) if inv.invoice_date_due else None,
-            "currency": inv.currency_id.name if inv.currency_id else None,
-        }
-
-    def _get_partner_rental_summary(self, user_partner):
-        RentalContract = request.env["rental.contract"].sudo()
-        AccountMove = request.env["account.move"].sudo()
-        Schedule = request.env["rental.payment.schedule"].sudo()
-
-        contracts = RentalContract.search([("tenant_id", "=", user_partner.id)])
-        active_contracts = contracts.filtered(lambda c: c.state == "active")
-
-        invoices = AccountMove.search([
-            ("rental_contract_id", "in", contracts.ids),
-            ("move_type", "=", "out_invoice"),
-            ("state", "=", "posted"),
-        ])
-        unpaid = invoices.filtered(lambda inv: inv.payment_state in ("not_paid", "partial"))
-        unpaid_total = sum(unpaid.mapped("amount_residual"))
-
-        current_properties = active_contracts.mapped("property_id")
+    def _get_includes(self, jdata):
+        """?include=rental[,...] -> ensemble des blocs optionnels demandés."""
+        return {i.strip() for i in str(jdata.get('include') or '').split(',') if i.strip()}
 
-        last_invoices = invoices.sorted(
-            key=lambda m: (m.invoice_date or m.date or m.id), reverse=True
-        )[:5]
-
-        today = fields.Date.today()
-        next_schedules = Schedule.search([
-            ("contract_id", "in", active_contracts.ids),
-        ]).filtered(
-            lambda s: (not s.invoice_id) and (s.due_date and s.due_date >= today)
-        ).sorted(key=lambda s: s.due_date)[:5]
-
-        return {
-            "active_contract_count": len(active_contracts),
-            "total_contract_count": len(contracts),
-            "unpaid_invoice_count": len(unpaid),
-            "total_unpaid_rent": float(unpaid_total or 0.0),
-            "current_properties": [self._serialize_property_short(p) for p in current_properties],
-            "last_invoices": [self._serialize_invoice_short(inv) for inv in last_invoices],
-            "next_due_schedules": [{
-                "id": s.id,
-                "contract_id": s.contract_id.id if s.contract_id else None,
-                "due_date": str(s.due_date) if s.due_date else None,
-                "amount": float(s.amount or 0.0),
-                "state": s.state,
-                "invoice_id": s.invoice_id.id if s.invoice_id else None,
-            } for s in next_schedules],
-        }
-
-    # ---------------------------------------------------------
-    # USER DATA (enrichi avec rental)
-    # ---------------------------------------------------------
-    def _get_user_data(self, user_partner, uid):
+    def _get_user_data(self, user_partner, uid, include_rental=False):
+        """
+        Profil minimal. Le résumé locatif n'est calculé qu'avec include=rental ;
+        sinon l'application le charge en parallèle via rental_summary_url.
+        """
         data = {
             'id': user_partner.id,
             'uid': uid,
@@ -364,12 +287,14 @@ class ControllerREST(http.Controller):
             'preferred_payment_method': getattr(user_partner, 'preferred_payment_method', None),
         }
 
-        try:
-            if data['is_tenant']:
-                data['rental'] = self._get_partner_rental_summary(user_partner)
-        except Exception as e:
-            _logger.exception("rental summary error: %s", e)
-            data['rental'] = {}
+        if data['is_tenant']:
+            data['rental_summary_url'] = '/api/rent/partner/%s/summary' % user_partner.id
+            if include_rental:
+                try:
+                    data['rental'] = partner_rental_summary(user_partner)
+                except Exception as e:
+                    _logger.exception("rental summary error: %s", e)
+                    data['rental'] = {}
 
         return data
 
@@ -384,27 +309,37 @@ class ControllerREST(http.Controller):
         if not refresh_token:
             return error_response(400, 'no_refresh_token', "No refresh token was provided in request!")
 
-        refresh_token_data = token_store.fetch_by_refresh_token(request.env, refresh_token)
-        if not refresh_token_data:
-            return error_response_401__invalid_token()
-
-        old_access_token = refresh_token_data['access_token']
         new_access_token = generate_token()
+        new_refresh_token = generate_token()
         expires_in = self.define_token_expires_in('access', jdata)
-        uid = refresh_token_data['user_id']
+        rotate = str(jdata.get('rotate_refresh_token') or '').lower() in ('1', 'true', 'yes') or (
+            request.env['ir.config_parameter'].sudo().get_param(REFRESH_ROTATION_PARAM) == 'always')
 
-        token_store.update_access_token(
+        # Rotation atomique : nouveau couple access / refresh, l'ancien refresh est retiré.
+        # Sans rotation (anciennes applications) : nouvel access token, même refresh token.
+        result = token_store.rotate_refresh_token(
             request.env,
-            old_access_token=old_access_token,
+            refresh_token=refresh_token,
             new_access_token=new_access_token,
             expires_in=expires_in,
-            refresh_token=refresh_token,
-            user_id=uid
+            new_refresh_token=new_refresh_token,
+            rotate=rotate,
         )
+        if result['status'] == 'concurrent':
+            return error_response(409, 'refresh_in_progress', "Refresh token already rotated by a concurrent request!")
+        if result['status'] == 'reused':
+            return error_response(401, 'refresh_token_reused', "Refresh token reuse detected, session revoked!")
+        if result['status'] != 'ok':
+            return error_response_401__invalid_token()
 
         return self._no_cookie_response(
             OUT__auth_refreshtoken__SUCCESS_CODE,
-            {'access_token': new_access_token, 'expires_in': expires_in}
+            {
+                'access_token': new_access_token,
+                'expires_in': expires_in,
+                'refresh_token': new_refresh_token if result['rotated'] else refresh_token,
+                'refresh_expires_in': result['refresh_expires_in'],
+            }
         )
 
     # ---------------------------------------------------------
@@ -424,6 +359,7 @@ class ControllerREST(http.Controller):
     # AUTH: Login (GET tokens)
     # ---------------------------------------------------------
     @http.route('/api/auth/get_tokens', methods=['GET'], type='http', auth='public', cors='*', csrf=False)
+    @rate_limited(('login_ip', by_ip), ('login_user', by_username))
     def api_auth_gettokens(self, **kw):
         try:
             jdata = self._get_request_data()
@@ -445,7 +381,7 @@ class ControllerREST(http.Controller):
                 return error_response(401, 'odoo_user_authentication_failed', "Odoo User authentication failed!")
 
             tokens = self._generate_and_save_tokens(uid)
-            user_data = self._get_user_data(user_partner, uid)
+            user_data = self._get_user_data(user_partner, uid, include_rental='rental' in self._get_includes(jdata))
             company_data = self._get_company_data(user_partner)
             parent_data = self._get_parent_data(user_partner)
 
@@ -453,6 +389,11 @@ class ControllerREST(http.Controller):
 
         except ValueError as ve:
             return error_response(400, 'bad_request', str(ve))
+        except PasswordHasherBusy:
+            _logger.warning("Vérification de mot de passe saturée, connexion refusée")
+            resp = error_response(503, 'server_busy', "Service momentanément saturé, veuillez réessayer.")
+            resp.headers['Retry-After'] = '2'
+            return resp
         except Exception as e:
             _logger.exception("Error in api_auth_gettokens: %s", e)
             return error_response(500, 'internal_server_error', str(e))
@@ -461,6 +402,7 @@ class ControllerREST(http.Controller):
     # AUTH: Login (POST)
     # ---------------------------------------------------------
     @http.route('/api/auth/login', methods=['POST'], type='http', auth='none', cors='*', csrf=False)
+    @rate_limited(('login_ip', by_ip), ('login_user', by_username))
     def api_auth_login_post(self, **kw):
         try:
             jdata = self._get_request_data()
@@ -481,7 +423,7 @@ class ControllerREST(http.Controller):
                 return error_response(401, 'odoo_user_authentication_failed', "Odoo User authentication failed!")
 
             tokens = self._generate_and_save_tokens(uid)
-            user_data = self._get_user_data(user_partner, uid)
+            user_data = self._get_user_data(user_partner, uid, include_rental='rental' in self._get_includes(jdata))
             company_data = self._get_company_data(user_partner)
             parent_data = self._get_parent_data(user_partner)
 
@@ -489,6 +431,11 @@ class ControllerREST(http.Controller):
 
         except ValueError as ve:
             return error_response(400, 'bad_request', str(ve))
+        except PasswordHasherBusy:
+            _logger.warning("Vérification de mot de passe saturée, connexion refusée")
+            resp = error_response(503, 'server_busy', "Service momentanément saturé, veuillez réessayer.")
+            resp.headers['Retry-After'] = '2'
+            return resp
         except Exception as e:
             _logger.exception("Error in api_auth_login_post: %s", e)
             return error_response(500, 'internal_server_error', str(e))
@@ -496,15 +443,20 @@ class ControllerREST(http.Controller):
     # ---------------------------------------------------------
     # /api/me (profil courant)
     # ---------------------------------------------------------
-    @http.route('/api/me', methods=['GET'], type='http', auth='public', cors='*', csrf=False)
+    @http.route('/api/me', methods=['GET'], type='http', auth='none', cors='*', csrf=False)
     def api_me(self, **kw):
+        """Profil de l'utilisateur porteur du token (en-tête access_token, comme check_permissions)."""
         try:
-            uid = request.session.uid or None
-            if not uid:
+            access_token = request.httprequest.headers.get('access_token')
+            if not access_token:
                 return error_response(401, 'unauthorized', 'Not logged')
+            access_token_data = token_store.fetch_by_access_token(request.env, access_token)
+            if not access_token_data:
+                return error_response_401__invalid_token()
+            uid = access_token_data['user_id']
 
-            user_partner = request.env['res.partner'].sudo().browse(request.env.user.partner_id.id)
-            user_data = self._get_user_data(user_partner, uid)
+            user_partner = request.env(user=uid, su=True).user.partner_id
+            user_data = self._get_user_data(user_partner, uid, include_rental='rental' in self._get_includes(self._get_request_data()))
             company_data = self._get_company_data(user_partner)
             parent_data = self._get_parent_data(user_partner)
 
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+
+import time
+import logging
+import threading
+
+_logger = logging.getLogger(__name__)
+
+
+class SimpleCacheStore(object):
+    """Petit cache mémoire (par worker) avec TTL, partagé par les contrôleurs."""
+
+    def __init__(self, max_entries=2048):
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if not entry:
+                return default
+            expiry_time, value = entry
+            if expiry_time is not None and expiry_time < time.time():
+                del self._data[key]
+                return default
+            return value
+
+    def set(self, key, value, expires_in=None):
+        expiry_time = time.time() + expires_in if expires_in else None
+        with self._lock:
+            if key not in self._data and len(self._data) >= self.max_entries:
+                self._evict()
+            self._data[key] = (expiry_time, value)
+        return value
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_prefix(self, prefix):
+        """Supprime toutes les clés tuple commençant par `prefix` (tuple)."""
+        size = len(prefix)
+        with self._lock:
+            for key in [k for k in self._data if isinstance(k, tuple) and k[:size] == prefix]:
+                del self._data[key]
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def _evict(self):
+        # Purge des entrées expirées, sinon de la plus ancienne insérée
+        current_time = time.time()
+        expired = [k for k, (exp, _v) in self._data.items() if exp is not None and exp < current_time]
+        for key in expired:
+            del self._data[key]
+        if len(self._data) >= self.max_entries:
+            self._data.pop(next(iter(self._data)))
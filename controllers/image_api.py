@@ -0,0 +1,95 @@
+# -*- coding: utf-8 -*-
+# controllers/image_api.py
+#
+# Images servies hors JSON : les payloads portent des URL versionnées (write_date),
+# l'endpoint lit la pièce jointe du champ image (variantes redimensionnées
+# stockées une fois par Odoo) directement depuis le filestore.
+
+import logging
+
+from odoo import http
+from odoo.http import request, Stream
+import werkzeug
+
+_logger = logging.getLogger(__name__)
+
+IMAGE_SIZES = (128, 256, 512, 1920)
+# Cache-Control sans ?unique= (revalidation par ETag au-delà)
+IMAGE_MAX_AGE = 86400
+
+# modèle -> {taille: champ image} ; une variante absente du modèle installé
+# (gestion.magasin vient d'un autre module) est servie par le champ principal
+IMAGE_FIELDS = {
+    'res.partner': {128: 'image_128', 256: 'image_256', 512: 'image_512', 1920: 'image_1920'},
+    'gestion.magasin': {128: 'logo_128', 256: 'logo_256', 512: 'logo_512', 1920: 'logo'},
+}
+
+
+def _base_url():
+    return request.env['ir.config_parameter'].sudo().get_param('web.base.url', '').rstrip('/')
+
+
+def image_url(record, size, base_url=None):
+    """URL publique d'une variante d'image ; `unique` change à chaque modification de l'enregistrement."""
+    if base_url is None:
+        base_url = _base_url()
+    unique = record.write_date.strftime('%Y%m%d%H%M%S') if record.write_date else '0'
+    return '%s/api/images/%s/%s/%s?unique=%s' % (base_url, record._name, record.id, size, unique)
+
+
+def _ids_with_image(record, field_name):
+    """
+    Ids ayant une image parmi ceux du lot de prefetch de `record` : une requête
+    pour toute une liste sérialisée, mémorisée pour la requête HTTP en cours.
+    """
+    cache = request.__dict__.setdefault('_rest_api_image_ids', {})
+    checked, present = cache.setdefault((record._name, field_name), (set(), set()))
+    if record.id not in checked:
+        ids = {rid for rid in record._prefetch_ids if isinstance(rid, int)} - checked
+        ids.add(record.id)
+        for row in request.env['ir.attachment'].sudo().search_read([
+                ('res_model', '=', record._name), ('res_field', '=', field_name), ('res_id', 'in', list(ids)),
+        ], ['res_id']):
+            present.add(row['res_id'])
+        checked |= ids
+    return present
+
+
+def image_urls(record, field_name, base_url=None):
+    """
+    {'128': url, ..., '1920': url} si le champ image principal est renseigné, sinon None.
+    Le test passe par le stockage (pièce jointe) sans charger le binaire.
+    """
+    if not record.id or record.id not in _ids_with_image(record, field_name):
+        return None
+    if base_url is None:
+        base_url = _base_url()
+    return {str(size): image_url(record, size, base_url) for size in IMAGE_SIZES}
+
+
+class ImageApi(http.Controller):
+
+    @http.route('/api/images/<string:model>/<int:res_id>/<int:size>', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
+    def image(self, model, res_id, size, **kw):
+        """
+        GET /api/images/<res.partner|gestion.magasin>/<id>/<128|256|512|1920>
+        Réponse binaire avec ETag (checksum) ; 304 si If-None-Match correspond.
+        Avec ?unique=..., Cache-Control long et immutable.
+        """
+        fields_by_size = IMAGE_FIELDS.get(model, {})
+        field_name = fields_by_size.get(size)
+        if not field_name or model not in request.env:
+            raise werkzeug.exceptions.NotFound()
+        if field_name not in request.env[model]._fields:
+            field_name = fields_by_size[max(IMAGE_SIZES)]
+            if field_name not in request.env[model]._fields:
+                raise werkzeug.exceptions.NotFound()
+        attachment = request.env['ir.attachment'].sudo().search([
+            ('res_model', '=', model), ('res_field', '=', field_name), ('res_id', '=', res_id),
+        ], limit=1)
+        if not attachment:
+            raise werkzeug.exceptions.NotFound()
+        stream = Stream.from_attachment(attachment)
+        if not kw.get('unique'):
+            stream.max_age = IMAGE_MAX_AGE
+        return stream.get_response(immutable=bool(kw.get('unique')))
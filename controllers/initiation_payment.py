@@ -3,7 +3,10 @@ from odoo import http
 from odoo.http import request
 import json
 import logging
-import re
+import uuid
+
+from ..models.contact_keys import normalize_phone
+from ..models.gateway_client import get_gateway_client, gateway_metrics
 
 _logger = logging.getLogger(__name__)
 
@@ -24,23 +27,6 @@ class PaymentController(http.Controller):
             return self._json(data, status=status)
         return request.make_response(str(data), status=status)
 
-    def _normalize_phone(self, raw, default_cc='221'):
-        s = (raw or '').strip().replace(' ', '')
-        if not s:
-            return None
-        # enlève tout sauf + et digits
-        s = re.sub(r'[^+\d]', '', s)
-        if s.startswith('+'):
-            return s
-        # Numéros SN courants : 77/78/76/70/75 etc.
-        if len(s) == 9 and s[0] in '76570':  # ex: 778112233
-            return f'+{default_cc}{s}'
-        if len(s) == 12 and s.startswith(default_cc):  # ex: 221778112233
-            return f'+{s}'
-        if len(s) == 8:  # ex: 78112233 -> suppose 7x/76/70/75, on préfixe 0
-            return f'+{default_cc}0{s}'
-        return f'+{default_cc}{s}'
-
     def _invoice_amounts(self, move):
         # On paie le restant dû si dispo, sinon total
         amount = float(move.amount_residual) if move.amount_residual else float(move.amount_total)
@@ -118,18 +104,19 @@ class PaymentController(http.Controller):
                     'existe': True
                 }, 200)
 
-            # créer l'ordre via la config
-            created = config.create_payment_invoice(
-                amount=payload['amount'],
-                currency=payload.get('currency', 'XOF'),
-                account_move_id=account_move.id,
-                transaction_id=payload['transaction_id'],
-                customer_msisdn=payload['phoneNumber'],
-                description=payload.get('description', 'Payment via Orange Money'),
-                reference=payload.get('reference'),
-                success_url=payload.get('success_url') or f"https://portail.toubasandaga.sn/om-paiement?transaction={payload['transaction_id']}",
-                cancel_url=payload.get('cancel_url') or f"https://portail.toubasandaga.sn/facture-magasin?transaction={account_move.transaction_id}",
-            )
+            # créer l'ordre via la config (appel HTTP porté par orange.money.config : latence mesurée seulement)
+            with get_gateway_client('orange_money').measure():
+                created = config.create_payment_invoice(
+                    amount=payload['amount'],
+                    currency=payload.get('currency', 'XOF'),
+                    account_move_id=account_move.id,
+                    transaction_id=payload['transaction_id'],
+                    customer_msisdn=payload['phoneNumber'],
+                    description=payload.get('description', 'Payment via Orange Money'),
+                    reference=payload.get('reference'),
+                    success_url=payload.get('success_url') or f"https://portail.toubasandaga.sn/om-paiement?transaction={payload['transaction_id']}",
+                    cancel_url=payload.get('cancel_url') or f"https://portail.toubasandaga.sn/facture-magasin?transaction={account_move.transaction_id}",
+                )
 
             if not created or not created.get('success'):
                 return self._make_response({'error': (created or {}).get('message', 'Failed to create Orange Money payment order')}, 400)
@@ -226,7 +213,6 @@ class PaymentController(http.Controller):
                 }, 200)
 
             # Appel API Wave checkout sessions
-            import requests   # local import pour éviter erreurs si non installé ailleurs
             payload_api = {
                 "amount": payload['amount'],
                 "currency": payload.get('currency', 'XOF'),
@@ -237,7 +223,9 @@ class PaymentController(http.Controller):
                 "Authorization": f"Bearer {config.api_key}",
                 "Content-Type": "application/json",
             }
-            resp = requests.post("https://api.wave.com/v1/checkout/sessions", json=payload_api, headers=headers, timeout=30)
+            resp = get_gateway_client('wave').post(
+                "/v1/checkout/sessions", json=payload_api, headers=headers,
+                idempotency_key=uuid.uuid4().hex)  # une clé par initiation, rejouée par les seuls retries
             if resp.status_code not in (200, 201):
                 _logger.error(f"Wave API Error: {resp.status_code} - {resp.text}")
                 return self._make_response(resp.text, 400)
@@ -312,7 +300,7 @@ class PaymentController(http.Controller):
             # Partner & téléphone
             partner = move.partner_id
             raw_phone = partner.whatsapp_number or partner.phone
-            phone = self._normalize_phone(raw_phone) if raw_phone else None
+            phone = normalize_phone(raw_phone)
 
             # Référence & description
             reference = f"INV-{move.name}"
@@ -368,6 +356,15 @@ class PaymentController(http.Controller):
             _logger.exception("Error in api_invoice_by_transaction")
             return self._json({"error": "server_error", "message": str(e)}, status=500)
 
+    # ---------------------------------------------------------------------
+    # Latence des passerelles (worker courant)
+    # ---------------------------------------------------------------------
+    @http.route("/api/payment/gateways/metrics", type="http", auth="user", methods=["GET"], csrf=False)
+    def api_gateway_metrics(self, **kw):
+        if not request.env.user.has_group('base.group_system'):
+            return self._json({"error": "forbidden"}, status=403)
+        return self._json({"gateways": gateway_metrics()}, status=200)
+
     # ---------------------------------------------------------------------
     # (Optionnel) Routes existantes: wrap vers les cœurs
     # ---------------------------------------------------------------------
@@ -743,4 +743,6 @@ else:
         from . import rental_api
         from . import configuration_controller
         from . import initiation_payment
+        from . import tx_events
+        from . import image_api
        
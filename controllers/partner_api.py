@@ -4,13 +4,55 @@
 import json
 import logging
 from datetime import datetime
+from urllib.parse import urlsplit, parse_qs
 
 from odoo import http, fields
 from odoo.http import request
 import werkzeug
 
+from .cache_store import SimpleCacheStore
+from .image_api import image_urls
+from .rate_limit import rate_limited, by_ip, by_field
+
 _logger = logging.getLogger(__name__)
 
+# Payload /api/account-move/by-transaction : clé (db, tx, champs) -> (write_date facture, payload)
+_tx_payload_cache = SimpleCacheStore(max_entries=4096)
+TX_PAYLOAD_CACHE_EXPIRES_IN = 300
+
+# /api/magasins/nearby : rayon en km
+MAGASIN_NEARBY_DEFAULT_RADIUS = 5.0
+MAGASIN_NEARBY_MAX_RADIUS = 50.0
+
+# /api/payments : pagination par curseur
+PAYMENTS_DEFAULT_LIMIT = 100
+PAYMENTS_MAX_LIMIT = 500
+
+# Champs exposés par type de payload (validation de ?fields= / ?fields[<type>]=)
+PAYLOAD_FIELDS = {
+    'partner': (
+        'id', 'name', 'email', 'partner_id', 'company_id', 'company_name', 'partner_city',
+        'partner_phone', 'country_id', 'country_name', 'country_code', 'country_phone_code',
+        'is_verified', 'avatar', 'image_url', 'image_urls', 'function', 'role', 'parent_id',
+        'rental', 'magasins',
+    ),
+    'contract': (
+        'id', 'name', 'state', 'start_date', 'end_date', 'duration_months', 'monthly_rent',
+        'currency', 'payment_day', 'payment_frequency', 'tenant_id', 'tenant_name', 'property',
+        'invoice_count', 'paid_invoice_count', 'unpaid_invoice_count', 'total_unpaid',
+    ),
+    'property': (
+        'id', 'name', 'type', 'status', 'monthly_rent', 'currency', 'building_id',
+        'building_name', 'surface_area', 'floor', 'address', 'unpaid_total',
+    ),
+    'invoice': (
+        'id', 'code', 'status', 'issue_date', 'due_date', 'currency', 'amount_total',
+        'amount_paid', 'amount_residual', 'payment_state', 'partner_id', 'partner_name',
+        'partner_phone', 'magasin', 'payment_link', 'transaction_id', 'rental', 'items',
+        'payments', 'move_type', 'invoice_lines',
+    ),
+}
+
 # =========================
 # Helpers génériques
 # =========================
@@ -45,6 +87,41 @@ def _require_admin_env():
         admin_user = request.env.ref('base.user_admin')
         request.env = request.env(user=admin_user.id)
 
+def _parse_fields(args, primary):
+    """
+    Sparse fieldsets : ?fields=a,b pour le payload principal de la route,
+    ?fields[<type>]=a,b pour les payloads imbriqués (contract, property...).
+    :return: ({type: frozenset}, None) ou (None, message d'erreur)
+    """
+    fieldsets = {}
+    for key, value in args.items():
+        if key == 'fields':
+            ptype = primary
+        elif key.startswith('fields[') and key.endswith(']'):
+            ptype = key[7:-1]
+        else:
+            continue
+        if ptype not in PAYLOAD_FIELDS:
+            return None, "Type de payload inconnu: %s (autorisés: %s)" % (ptype, ", ".join(sorted(PAYLOAD_FIELDS)))
+        wanted = frozenset(f.strip() for f in (value or '').split(',') if f.strip())
+        unknown = wanted - set(PAYLOAD_FIELDS[ptype])
+        if unknown:
+            return None, "Champs inconnus pour %s: %s (autorisés: %s)" % (
+                ptype, ", ".join(sorted(unknown)), ", ".join(PAYLOAD_FIELDS[ptype]))
+        fieldsets[ptype] = wanted
+    return fieldsets, None
+
+def _wants(fieldsets, ptype, key):
+    """True si `key` est demandé pour `ptype` (tout est demandé sans ?fields)."""
+    wanted = (fieldsets or {}).get(ptype)
+    return wanted is None or key in wanted
+
+def _project(payload, fieldsets, ptype):
+    wanted = (fieldsets or {}).get(ptype)
+    if wanted is None:
+        return payload
+    return {k: v for k, v in payload.items() if k in wanted}
+
 def _mask_phone(p):
     """Masque un numéro (retour '77****34' si possible)."""
     try:
@@ -59,6 +136,27 @@ def _mask_phone(p):
     except Exception:
         return '****'
 
+def _send_otp(partner):
+    """
+    Émet un code OTP pour le partner ; l'envoi SMS / email part en tâche de fond.
+    :return: 'sent', 'rate_limited', 'no_channel' ou 'error'
+    """
+    try:
+        with request.env.cr.savepoint():
+            return request.env['rest.api.otp'].sudo().send_code(partner)
+    except Exception:
+        _logger.exception("Erreur émission OTP partner %s", partner.id)
+        return 'error'
+
+def _verify_otp(partner, code):
+    """Vérifie le code OTP du partner ; True si valide (le code est alors consommé)."""
+    try:
+        with request.env.cr.savepoint():
+            return request.env['rest.api.otp'].sudo().verify_code(partner, code) == 'ok'
+    except Exception:
+        _logger.exception("Erreur vérification OTP partner %s", partner.id)
+        return False
+
 def _money(n):
     try:
         return float(n or 0.0)
@@ -70,11 +168,11 @@ def _money(n):
 # Payload builders
 # ================
 
-def _property_payload(prop):
+def _property_payload(prop, fieldsets=None):
     """Sérialisation minimale d'un rental.property"""
     if not prop:
         return None
-    return {
+    payload = {
         "id": prop.id,
         "name": prop.name,
         "type": prop.property_type,
@@ -86,10 +184,12 @@ def _property_payload(prop):
         "surface_area": prop.surface_area,
         "floor": prop.floor,
         "address": prop.address,
-        "unpaid_total": _money(getattr(prop, 'total_unpaid_invoices', 0.0)),
     }
+    if _wants(fieldsets, 'property', 'unpaid_total'):
+        payload["unpaid_total"] = _money(getattr(prop, 'total_unpaid_invoices', 0.0))
+    return _project(payload, fieldsets, 'property')
 
-def _contract_payload(contract, with_counts=True):
+def _contract_payload(contract, with_counts=True, fieldsets=None):
     """Sérialisation minimale d'un rental.contract"""
     if not contract:
         return None
@@ -106,16 +206,19 @@ def _contract_payload(contract, with_counts=True):
         "payment_frequency": contract.payment_frequency,
         "tenant_id": contract.tenant_id.id if contract.tenant_id else None,
         "tenant_name": contract.tenant_id.name if contract.tenant_id else None,
-        "property": _property_payload(contract.property_id),
     }
+    if _wants(fieldsets, 'contract', 'property'):
+        data["property"] = _property_payload(contract.property_id, fieldsets)
     if with_counts:
-        data.update({
-            "invoice_count": getattr(contract, 'invoice_count', 0),
-            "paid_invoice_count": getattr(contract, 'paid_invoice_count', 0),
-            "unpaid_invoice_count": getattr(contract, 'unpaid_invoice_count', 0),
-            "total_unpaid": _money(getattr(contract, 'total_unpaid', 0.0)),
-        })
-    return data
+        # compteurs calculés : seuls ceux demandés sont évalués
+        for key, field_name in (("invoice_count", 'invoice_count'),
+                                ("paid_invoice_count", 'paid_invoice_count'),
+                                ("unpaid_invoice_count", 'unpaid_invoice_count')):
+            if _wants(fieldsets, 'contract', key):
+                data[key] = getattr(contract, field_name, 0)
+        if _wants(fieldsets, 'contract', 'total_unpaid'):
+            data["total_unpaid"] = _money(getattr(contract, 'total_unpaid', 0.0))
+    return _project(data, fieldsets, 'contract')
 
 def _magasin_payload(m):
     return {
@@ -135,10 +238,15 @@ def _magasin_payload(m):
         'is_default': m.is_default,
         'logo': bool(getattr(m, 'logo', False)),
         'logo_filename': getattr(m, 'logo_filename', None),
+        'logo_url': (image_urls(m, 'logo') or {}).get('256'),
     }
 
-def _partner_payload(partner, with_magasins=True):
-    """Réponse Partner enrichie avec les infos locatives."""
+def _partner_payload(partner, with_magasins=True, fieldsets=None):
+    """
+    Réponse Partner enrichie avec les infos locatives.
+    Avec `fieldsets` (cf. _parse_fields), les blocs non demandés (images, rental,
+    magasins) ne sont pas calculés.
+    """
     payload = {
         'id': partner.id,
         'name': partner.name,
@@ -154,20 +262,37 @@ def _partner_payload(partner, with_magasins=True):
         'country_phone_code': partner.country_id.phone_code if partner.country_id else None,
         'is_verified': getattr(partner, 'is_verified', False) or getattr(partner, 'otp_verified', False),
         'avatar': getattr(partner, 'avatar', None) or None,
-        'image_1920': partner.image_1920.decode('utf-8') if partner.image_1920 else None,
+        'image_url': None,
+        'image_urls': None,
         'function': partner.function or "",
         'role': getattr(partner, 'role', None),
         'parent_id': partner.parent_id.id if partner.parent_id else None,
     }
+    # Images servies par /api/images (plus de base64 dans le JSON)
+    urls = None
+    if _wants(fieldsets, 'partner', 'image_url') or _wants(fieldsets, 'partner', 'image_urls'):
+        urls = image_urls(partner, 'image_1920')
+    if urls:
+        payload['image_url'] = urls['512']
+        payload['image_urls'] = urls
+
+    if _wants(fieldsets, 'partner', 'rental'):
+        payload['rental'] = _partner_rental_payload(partner, fieldsets)
+
+    if with_magasins and _wants(fieldsets, 'partner', 'magasins') and hasattr(partner, 'magasin_ids'):
+        payload['magasins'] = [_magasin_payload(m) for m in partner.magasin_ids]
 
-    # Bloc locatif
+    return _project(payload, fieldsets, 'partner')
+
+def _partner_rental_payload(partner, fieldsets=None):
+    """Bloc locatif du partner (compteurs et locaux en cours)."""
     try:
         current_props = []
         if hasattr(partner, 'current_properties'):
             for p in partner.current_properties:
-                current_props.append(_property_payload(p))
+                current_props.append(_property_payload(p, fieldsets))
 
-        payload['rental'] = {
+        return {
             "is_tenant": bool(getattr(partner, 'is_tenant', False)),
             "preferred_payment_method": getattr(partner, 'preferred_payment_method', None),
             "whatsapp_number": getattr(partner, 'whatsapp_number', None),
@@ -178,7 +303,7 @@ def _partner_payload(partner, with_magasins=True):
             "total_unpaid_rent": _money(getattr(partner, 'total_unpaid_rent', 0.0)),
         }
     except Exception:
-        payload['rental'] = {
+        return {
             "is_tenant": False,
             "preferred_payment_method": None,
             "whatsapp_number": None,
@@ -189,11 +314,6 @@ def _partner_payload(partner, with_magasins=True):
             "total_unpaid_rent": 0.0,
         }
 
-    if with_magasins and hasattr(partner, 'magasin_ids'):
-        payload['magasins'] = [_magasin_payload(m) for m in partner.magasin_ids]
-
-    return payload
-
 def _invoice_line_payload(line):
     return {
         'id': line.id,
@@ -213,32 +333,24 @@ def _payment_basic_payload(pay):
         'amount': _money(pay.amount),
         'currency': (pay.currency_id.name if pay.currency_id
                      else (pay.company_id.currency_id.name if pay.company_id else None)),
-        'paid_at': pay.date or pay.payment_date,
-        'method': (pay.payment_method_line_id.name if pay.payment_method_line_id
-                   else (pay.payment_method_id.name if hasattr(pay, 'payment_method_id') and pay.payment_method_id else None)),
-        'reference': pay.ref or pay.communication or pay.name,
+        'paid_at': pay.date,
+        'method': pay.payment_method_line_id.name if pay.payment_method_line_id else None,
+        'reference': pay.ref or pay.name,
         'state': pay.state,        # posted / draft / cancelled
         'status': 'posted' if pay.state == 'posted' else pay.state,
     }
 
-def _payment_with_invoices_payload(pay):
+def _payment_with_invoices_payload(pay, graph):
+    """Paiement + factures lettrées ; `graph` = rental.payment.history._load_payment_graph()."""
     data = _payment_basic_payload(pay)
-    try:
-        invoice_moves = set()
-        for line in pay.move_id.line_ids:
-            for m in line.matched_debit_ids:
-                if m.debit_move_id and m.debit_move_id.move_id.move_type in ('out_invoice', 'out_refund'):
-                    invoice_moves.add(m.debit_move_id.move_id)
-            for m in line.matched_credit_ids:
-                if m.credit_move_id and m.credit_move_id.move_id.move_type in ('out_invoice', 'out_refund'):
-                    invoice_moves.add(m.credit_move_id.move_id)
-        data['invoice_ids'] = [m.id for m in invoice_moves]
-        data['invoice_codes'] = [m.name for m in invoice_moves]
-    except Exception:
-        data['invoice_ids'] = []
-        data['invoice_codes'] = []
+    linked = graph['invoices_by_payment'].get(pay.id, [])
+    data['invoice_ids'] = [inv_id for inv_id, _name in linked]
+    data['invoice_codes'] = [name for _inv_id, name in linked]
     return data
 
+def _load_payment_graph(invoices):
+    return request.env['rental.payment.history'].sudo()._load_payment_graph(invoices)
+
 def _invoice_status(inv):
     if inv.payment_state == 'paid':
         return 'paid'
@@ -246,7 +358,7 @@ def _invoice_status(inv):
         return 'posted'
     return inv.state
 
-def _invoice_payload(inv, with_lines=False, with_payments=False):
+def _invoice_payload(inv, with_lines=False, with_payments=False, payment_graph=None, fieldsets=None):
     amount_total = _money(inv.amount_total)
     amount_paid = amount_total - _money(inv.amount_residual)
     payload = {
@@ -274,45 +386,102 @@ def _invoice_payload(inv, with_lines=False, with_payments=False):
     }
 
     # Bloc locatif sur la facture (contrat + local)
-    try:
-        contract = getattr(inv, 'rental_contract_id', False)
-        payload['rental'] = {
-            "contract": _contract_payload(contract) if contract else None,
-        }
-    except Exception:
-        payload['rental'] = None
-
-    if with_lines:
-        payload['items'] = [_invoice_line_payload(l) for l in inv.invoice_line_ids]
-    if with_payments:
-        pays = []
+    if _wants(fieldsets, 'invoice', 'rental'):
         try:
-            receivables = inv.line_ids.filtered(lambda l: l.account_id.internal_type in ('receivable', 'payable'))
-            for line in receivables:
-                for m in (line.matched_debit_ids | line.matched_credit_ids):
-                    pay_move = m.debit_move_id.move_id if m.debit_move_id else m.credit_move_id.move_id
-                    pay = request.env['account.payment'].sudo().search([('move_id', '=', pay_move.id)], limit=1)
-                    if pay:
-                        pays.append(_payment_with_invoices_payload(pay))
+            contract = getattr(inv, 'rental_contract_id', False)
+            payload['rental'] = {
+                "contract": _contract_payload(contract, fieldsets=fieldsets) if contract else None,
+            }
         except Exception:
-            pass
+            payload['rental'] = None
+
+    if with_lines and _wants(fieldsets, 'invoice', 'items'):
+        payload['items'] = [_invoice_line_payload(l) for l in inv.invoice_line_ids]
+    if with_payments and _wants(fieldsets, 'invoice', 'payments'):
+        # graphe factures <-> paiements : préchargé par l'appelant pour un lot de factures
+        graph = payment_graph if payment_graph is not None else _load_payment_graph(inv)
+        payments = {p.id: p for p in graph['payments']}
+        pays = [_payment_with_invoices_payload(payments[pid], graph)
+                for pid in graph['payment_ids_by_invoice'].get(inv.id, [])]
         payload['payments'] = pays
 
-    return payload
+    return _project(payload, fieldsets, 'invoice')
 
 
 # =========================
 # Utilitaires de recherche
 # =========================
 
+def _normalize_tx(tx):
+    """Accepte un transaction_id ou un lien de paiement (?transaction=<uuid>)."""
+    tx = (tx or '').strip()
+    if '://' in tx or '?' in tx:
+        values = parse_qs(urlsplit(tx).query).get('transaction')
+        tx = (values[0] if values else '').strip()
+    return tx
+
+
+# Recherche par l'index unique account_move_transaction_id_uniq
+_INVOICE_BY_TX_QUERY = """
+    SELECT id, write_date
+      FROM account_move
+     WHERE transaction_id = %s
+       AND move_type IN ('out_invoice', 'out_refund')
+     LIMIT 1
+"""
+
+
+def _lookup_invoice_by_tx(tx):
+    """Retourne (id, write_date) de la facture liée à `tx`, ou (None, None)."""
+    tx = _normalize_tx(tx)
+    if not tx:
+        return None, None
+    request.env['account.move'].flush_model(['transaction_id', 'move_type'])
+    request.env.cr.execute(_INVOICE_BY_TX_QUERY, (tx,))
+    row = request.env.cr.fetchone()
+    return row if row else (None, None)
+
+
 def _find_invoice_by_tx(tx):
-    """Recherche une facture par transaction_id ou payment_link."""
-    domain = [
-        ('move_type', 'in', ('out_invoice', 'out_refund')),
-        '|', ('transaction_id', '=', tx),
-             ('payment_link', '=', tx),
-    ]
-    return request.env['account.move'].sudo().search(domain, limit=1)
+    """Recherche une facture par transaction_id (ou lien de paiement contenant ?transaction=)."""
+    move_id, _write_date = _lookup_invoice_by_tx(tx)
+    return request.env['account.move'].sudo().browse(move_id) if move_id else request.env['account.move']
+
+
+def _front_status(inv):
+    """
+    Statut attendu côté front (facture publique) :
+      paid | not_paid | partial | overdue | posted | draft
+    """
+    ps = (inv.payment_state or "").lower()
+    if ps == "paid":
+        return "paid"
+    if ps in ("not_paid", "invoicing_legacy"):
+        if inv.invoice_date_due and inv.invoice_date_due < fields.Date.context_today(inv):
+            return "overdue"
+        return "not_paid"
+    if ps in ("partial", "in_payment"):
+        return "partial"
+    if inv.state in ("posted", "draft"):
+        return inv.state
+    return ps or inv.state or "draft"
+
+
+def _transaction_invoice_payload(inv, fieldsets=None):
+    """Payload public de /api/account-move/by-transaction (lignes + paiements)."""
+    payload = _invoice_payload(inv, with_lines=True, with_payments=True, fieldsets=fieldsets)
+    if _wants(fieldsets, 'invoice', 'status'):
+        payload['status'] = _front_status(inv)
+    if _wants(fieldsets, 'invoice', 'move_type'):
+        payload['move_type'] = inv.move_type
+    if _wants(fieldsets, 'invoice', 'invoice_lines'):
+        payload['invoice_lines'] = [{
+            'name': l.name or "",
+            'quantity': float(l.quantity or 0.0),
+            'price_unit': _money(l.price_unit),
+            'subtotal': _money(l.price_subtotal),
+        } for l in inv.invoice_line_ids]
+    return payload
 
 
 # ==============================
@@ -328,6 +497,9 @@ class GestionPartner(http.Controller):
         data = _parse_body()
         if not data:
             return _json_message("Données invalides", 400)
+        fieldsets, error = _parse_fields(_parse_args(), 'partner')
+        if error:
+            return _json_message(error, 400)
 
         name = data.get('name')
         email = data.get('email')
@@ -341,7 +513,7 @@ class GestionPartner(http.Controller):
         _require_admin_env()
 
         country = request.env['res.country'].sudo().search([('id', '=', 204)], limit=1)
-        if request.env['res.partner'].sudo().search([('email', '=', email)], limit=1):
+        if request.env['res.partner'].sudo()._find_by_email(email):
             return _json_message("Un utilisateur avec cet email existe déjà", 400)
 
         company_choice = request.env['res.company'].sudo().search([('id', '=', 1)], limit=1)
@@ -362,33 +534,32 @@ class GestionPartner(http.Controller):
             'is_verified': False,
         })
         if partner:
-            # envoi OTP initial (si la méthode existe)
-            try:
-                send_otp = getattr(partner, 'send_otp', None)
-                if callable(send_otp):
-                    send_otp()
-                else:
-                    _logger.warning("Méthode 'send_otp' inexistante sur le modèle %s", partner._name)
-            except Exception:
-                _logger.exception("Erreur lors de l'envoi OTP initial")
-            return _json(_partner_payload(partner), 201)
+            # envoi OTP initial
+            _send_otp(partner)
+            return _json(_partner_payload(partner, fieldsets=fieldsets), 201)
 
         return _json_message("Compte client non créé, veuillez réessayer", 400)
 
     @http.route('/api/partnerByEmail/<email>', methods=['GET'], type='http', auth='none', cors="*")
-    def api_partner_get_by_email(self, email):
-        partner = request.env['res.partner'].sudo().search([('email', '=', email)], limit=1)
+    def api_partner_get_by_email(self, email, **kw):
+        fieldsets, error = _parse_fields(_parse_args(), 'partner')
+        if error:
+            return _json_message(error, 400)
+        partner = request.env['res.partner'].sudo()._find_by_email(email)
         if not partner:
             return _json_message("Compte client non trouvé", 404)
-        return _json(_partner_payload(partner), 200)
+        return _json(_partner_payload(partner, fieldsets=fieldsets), 200)
 
     @http.route('/api/partner/compte/<int:id>/details', methods=['GET'], type='http', auth='none', cors="*")
     def api_partner_get_detail_by_id(self, id, **kw):
         _require_admin_env()
+        fieldsets, error = _parse_fields(_parse_args(), 'partner')
+        if error:
+            return _json_message(error, 400)
         partner = request.env['res.partner'].sudo().browse(id)
         if not partner.exists():
             return _json_message("Compte client non trouvé", 404)
-        return _json(_partner_payload(partner), 200)
+        return _json(_partner_payload(partner, fieldsets=fieldsets), 200)
 
     @http.route('/api/partner/<int:partner_id>/update', methods=['PUT'], type='http', auth='public', cors="*", csrf=False)
     def api_partner_update(self, partner_id, **kw):
@@ -420,7 +591,7 @@ class GestionPartner(http.Controller):
         if data is None:
             return _json_message("Données invalides", 400)
 
-        partner = request.env['res.partner'].sudo().search([('email', '=', email)], limit=1)
+        partner = request.env['res.partner'].sudo()._find_by_email(email)
         if not partner:
             return _json_message("Compte client non trouvé", 404)
 
@@ -432,25 +603,31 @@ class GestionPartner(http.Controller):
         vals['is_verified'] = False
 
         partner.write(vals)
-        try:
-            send_otp = getattr(partner, 'send_otp', None)
-            if callable(send_otp):
-                send_otp()
-            else:
-                _logger.warning("Méthode 'send_otp' inexistante sur le modèle %s", partner._name)
-        except Exception:
-            _logger.exception("Erreur lors du renvoi OTP /create-update")
+        _send_otp(partner)
         return _json_message("Compte mis à jour, OTP envoyé pour vérification", 200)
 
-    @http.route('/api/partner/update-partner', methods=['GET'], type='http', auth='none', cors="*")
+    @http.route('/api/partner/update-partner', methods=['GET', 'POST'], type='http', auth='none', cors="*", csrf=False)
     def api_partner_bulk_update_children(self, **kw):
+        """
+        Marque vérifiés tous les contacts enfants, en tâche de fond.
+        Réponse 202 immédiate : { job_id, state, status_url }
+        """
+        _require_admin_env()
+        job = request.env['rest.api.job']._enqueue('partner_verify_children', "Vérification des contacts enfants")
+        return _json({
+            "job_id": job.id,
+            "state": job.state,
+            "status_url": "/api/jobs/%s" % job.id,
+        }, 202)
+
+    @http.route('/api/jobs/<int:job_id>', methods=['GET'], type='http', auth='none', cors="*", csrf=False)
+    def api_job_status(self, job_id, **kw):
+        """Avancement d'un traitement de fond : { job_id, state, total, processed, progress, ... }"""
         _require_admin_env()
-        partners = request.env['res.partner'].sudo().search([('parent_id', '!=', False)])
-        for p in partners:
-            # Exemple d’update massif ; adapte si besoin
-            p.write({'is_verified': True})
-            _logger.info("Partenaire mis à jour: %s", p.name)
-        return _json_message("Partenaires mis à jour", 200)
+        job = request.env['rest.api.job'].sudo().browse(job_id)
+        if not job.exists():
+            return _json_message("Traitement introuvable", 404)
+        return _json(job._status_payload(), 200)
 
     # ---------- OTP PARTNER ----------
 
@@ -460,45 +637,33 @@ class GestionPartner(http.Controller):
         partner = request.env['res.partner'].sudo().browse(partner_id)
         if not partner.exists():
             return _json_message("Compte client non trouvé", 404)
-        try:
-            send_otp = getattr(partner, 'send_otp', None)
-            if callable(send_otp):
-                code = send_otp()
-                _logger.info("OTP %s for %s", code, partner.email or partner.phone)
-            else:
-                # Ne pas bloquer le processus si la méthode n'existe pas
-                _logger.warning("Méthode 'send_otp' inexistante sur le modèle %s", partner._name)
-        except Exception:
-            _logger.exception("Erreur send_otp partner")
-            # Ne pas renvoyer d'erreur bloquante, juste logguer
+        if _send_otp(partner) == 'rate_limited':
+            return _json_message("Trop de demandes de code, veuillez réessayer plus tard", 429)
         return _json_message("Code OTP envoyé avec succès", 200)
 
     @http.route('/api/partner/<email>/otp-resend', methods=['GET'], type='http', auth='none', cors="*")
     def api_partner_resend_otp(self, email, **kw):
         _require_admin_env()
-        partner = request.env['res.partner'].sudo().search([('email', '=', email)], limit=1)
+        partner = request.env['res.partner'].sudo()._find_by_email(email)
         if not partner:
             return _json_message("Compte client non trouvé", 404)
-        try:
-            send_otp = getattr(partner, 'send_otp', None)
-            if callable(send_otp):
-                send_otp()
-            else:
-                # Ne pas bloquer le processus si la méthode n'existe pas
-                _logger.warning("Méthode 'send_otp' inexistante sur le modèle %s", partner._name)
-        except Exception:
-            _logger.exception("Erreur resend_otp partner")
-            # Ne pas renvoyer d'erreur bloquante, juste logguer
+        if _send_otp(partner) == 'rate_limited':
+            return _json_message("Trop de demandes de code, veuillez réessayer plus tard", 429)
         return _json_message("Code OTP renvoyé avec succès", 200)
 
     
     @http.route('/api/partner/otp-verification', methods=['POST'], type='http', auth='none', cors="*", csrf=False)
+    @rate_limited(('otp_ip', by_ip), ('otp_identity', by_field('email')))
     def api_partner_otp_verify(self, **kw):
         _require_admin_env()
         data = _parse_body()
         if data is None:
             return _json_message("Données invalides", 400)
 
+        fieldsets, error = _parse_fields(_parse_args(), 'partner')
+        if error:
+            return _json_message(error, 400)
+
         # Normalisations
         raw_code = data.get('code')
         email = (data.get('email') or '').strip()
@@ -512,26 +677,15 @@ class GestionPartner(http.Controller):
             return _json_message("Code OTP invalide ou expiré", 400)
         code = code.zfill(4)
 
-        partner = request.env['res.partner'].sudo().search([('email', 'ilike', email)], limit=1)
+        partner = request.env['res.partner'].sudo()._find_by_email(email)
         if not partner:
             return _json_message("Compte client non trouvé", 404)
 
-        try:
-            verify_otp = getattr(partner, 'verify_otp', None)
-            if callable(verify_otp):
-                ok = verify_otp(code)
-            else:
-                _logger.warning("Méthode 'verify_otp' inexistante sur le modèle %s", partner._name)
-                ok = False
-        except Exception:
-            _logger.exception("Erreur verify_otp partner")
-            ok = False
-
-        if not ok:
+        if not _verify_otp(partner, code):
             return _json_message("Code OTP invalide ou expiré", 400)
 
         partner.sudo().write({'is_verified': True})
-        return _json({"success": True, "partner": _partner_payload(partner)}, 200)
+        return _json({"success": True, "partner": _partner_payload(partner, fieldsets=fieldsets)}, 200)
 
     # ---------- OTP via FACTURE ----------
 
@@ -558,21 +712,12 @@ class GestionPartner(http.Controller):
         if not phone:
             return _json_message("Aucun numéro de téléphone associé au compte", 400)
 
-        try:
-            send_otp = getattr(partner, 'send_otp', None)
-            if callable(send_otp):
-                code = send_otp()
-                _logger.info("OTP (invoice) %s for partner %s (inv %s)", code, partner.id, inv.id)
-            else:
-                # Ne pas bloquer le processus si la méthode n'existe pas
-                _logger.warning("Méthode 'send_otp' inexistante sur le modèle %s", partner._name)
-        except Exception:
-            _logger.exception("Erreur envoi OTP facture")
-            # Ne pas renvoyer d'erreur bloquante, juste logguer
-
+        if _send_otp(partner) == 'rate_limited':
+            return _json_message("Trop de demandes de code, veuillez réessayer plus tard", 429)
         return _json({"success": True, "maskedPhone": _mask_phone(phone)}, 200)
 
     @http.route('/api/invoices/verify-otp', methods=['POST'], type='http', auth='none', cors="*", csrf=False)
+    @rate_limited(('otp_ip', by_ip), ('otp_identity', by_field('transaction')))
     def api_invoice_verify_otp(self, **kw):
         """
         Vérifie un OTP pour la facture.
@@ -584,6 +729,10 @@ class GestionPartner(http.Controller):
         if data is None:
             return _json_message("Données invalides", 400)
 
+        fieldsets, error = _parse_fields(_parse_args(), 'partner')
+        if error:
+            return _json_message(error, 400)
+
         tx = data.get('transaction')
         code = data.get('code')
         if not tx or not code:
@@ -597,47 +746,84 @@ class GestionPartner(http.Controller):
         if not partner:
             return _json_message("Partenaire introuvable", 404)
 
-        ok = False
-        try:
-            verify_otp = getattr(partner, 'verify_otp', None)
-            if callable(verify_otp):
-                ok = verify_otp(code)
-            else:
-                _logger.warning("Méthode 'verify_otp' inexistante sur le modèle %s", partner._name)
-                ok = False
-        except Exception:
-            _logger.exception("Erreur verify_otp (invoice)")
-            ok = False
-
-        if not ok:
+        if not _verify_otp(partner, code):
             return _json({"success": False}, 400)
 
         # sécurité : marque vérifié si pas encore
         if not getattr(partner, 'is_verified', False):
             partner.write({'is_verified': True})
 
-        return _json({"success": True, "partner": _partner_payload(partner)}, 200)
+        return _json({"success": True, "partner": _partner_payload(partner, fieldsets=fieldsets)}, 200)
 
     # ---------- Billing utilitaires publics ----------
 
+    # ---------- Magasins à proximité ----------
+
+    @http.route('/api/magasins/nearby', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
+    def magasins_nearby(self, **kw):
+        """
+        GET ?lat=<float>&lon=<float>&radius=<km, défaut 5, max 50>&limit=<défaut 50>
+        Réponse: [ {...magasin..., "distance_km": float}, ... ] triés par distance
+        """
+        _require_admin_env()
+        args = _parse_args()
+        try:
+            lat = float(args['lat'])
+            lon = float(args['lon'])
+            radius = min(max(float(args.get('radius') or MAGASIN_NEARBY_DEFAULT_RADIUS), 0.0), MAGASIN_NEARBY_MAX_RADIUS)
+            limit = min(max(int(args.get('limit') or 50), 1), 500)
+        except (KeyError, ValueError):
+            return _json_message("Paramètres 'lat' et 'lon' (nombres) requis", 400)
+        if not (-90.0 <= lat <= 90.0 and -180.0 <= lon <= 180.0):
+            return _json_message("Coordonnées invalides", 400)
+        Magasin = request.env['gestion.magasin'].sudo()
+        nearby = Magasin.search_nearby(lat, lon, radius, limit=limit)
+        magasins = {m.id: m for m in Magasin.browse([i for i, _d in nearby])}
+        data = []
+        for magasin_id, distance in nearby:
+            payload = _magasin_payload(magasins[magasin_id])
+            payload['distance_km'] = round(distance, 3)
+            data.append(payload)
+        return _json(data, 200)
+
     @http.route('/api/account-move/by-transaction', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
     def invoice_by_transaction(self, **kw):
+        """
+        GET /api/account-move/by-transaction?transaction=<uuid>[&fields=...][&fields[contract]=...]
+        Réponse: { "invoice": {...lignes + paiements consolidés...} }
+        Le payload est mis en cache par transaction et jeu de champs, et revalidé
+        sur write_date de la facture (modifiée à chaque paiement / lettrage).
+        """
         args = _parse_args()
-        tx = args.get('transaction')
+        tx = _normalize_tx(args.get('transaction'))
         if not tx:
             return _json_message("Paramètre 'transaction' requis", 400)
+        fieldsets, error = _parse_fields(args, 'invoice')
+        if error:
+            return _json_message(error, 400)
 
-        move = _find_invoice_by_tx(tx)
-        if not move:
+        move_id, write_date = _lookup_invoice_by_tx(tx)
+        if not move_id:
             return _json_message("Facture introuvable pour cette transaction", 404)
-        # on renvoie lignes + paiements consolidés
-        return _json({"invoice": _invoice_payload(move, with_lines=True, with_payments=True)}, 200)
+
+        cache_key = (request.env.cr.dbname, tx, tuple(sorted((k, tuple(sorted(v))) for k, v in fieldsets.items())))
+        cached = _tx_payload_cache.get(cache_key)
+        if cached and cached[0] == write_date:
+            return _json({"invoice": cached[1]}, 200)
+
+        move = request.env['account.move'].sudo().browse(move_id)
+        payload = _transaction_invoice_payload(move, fieldsets=fieldsets)
+        _tx_payload_cache.set(cache_key, (write_date, payload), expires_in=TX_PAYLOAD_CACHE_EXPIRES_IN)
+        return _json({"invoice": payload}, 200)
 
     @http.route('/api/payments', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
     def payments_by_partner(self, **kw):
         """
-        Historique de paiements consolidés depuis les reconciles des factures postées.
+        Historique de paiements consolidés depuis les rapprochements des factures postées.
         GET ?partnerId=ID
+            &date_from=YYYY-MM-DD&date_to=YYYY-MM-DD   (optional, date du règlement)
+            &limit=N&cursor=<next_cursor>              (optional, pagination ; sans limit ni cursor : tout)
+        Réponse: { "payments": [...], "next_cursor": str|null }
         """
         _require_admin_env()
         args = _parse_args()
@@ -645,43 +831,23 @@ class GestionPartner(http.Controller):
         if not partner_id:
             return _json_message("Paramètre 'partnerId' requis", 400)
 
-        partner_id = int(partner_id)
-        Move = request.env['account.move'].sudo()
-        domain = [
-            ('move_type', 'in', ['out_invoice', 'out_refund']),
-            ('state', '=', 'posted'),
-            ('partner_id', '=', partner_id),
-        ]
-        rows = []
-        for m in Move.search(domain):
-            code = m.name
-            currency = m.currency_id.name or (m.company_id.currency_id.name if m.company_id else "XOF")
-            try:
-                for p in m._get_reconciled_info_JSON_values():
-                    rows.append({
-                        "id": p.get("payment_id") or p.get("move_id") or p.get("aml_id"),
-                        "invoice_id": m.id,
-                        "invoice_code": code,
-                        "amount": _money(p.get("amount") or p.get("amount_currency")),
-                        "currency": currency,
-                        "method": p.get("journal_name") or p.get("account_name") or "PAYMENT",
-                        "status": "SUCCEEDED",
-                        "paid_at": p.get("date"),
-                    })
-            except Exception:
-                paid = _money(m.amount_total - m.amount_residual)
-                if paid > 0:
-                    rows.append({
-                        "id": f"agg-{m.id}",
-                        "invoice_id": m.id,
-                        "invoice_code": code,
-                        "amount": paid,
-                        "currency": currency,
-                        "method": "PAYMENT",
-                        "status": "SUCCEEDED" if m.payment_state in ('paid', 'in_payment', 'partial') else "PENDING",
-                        "paid_at": str(m.invoice_date or m.date) if m.invoice_date else None,
-                    })
-
-        # tri du plus récent
-        rows.sort(key=lambda r: (r.get("paid_at") or "", r["invoice_id"]), reverse=True)
-        return _json({"payments": rows}, 200)
+        try:
+            partner_id = int(partner_id)
+            limit = args.get('limit')
+            limit = min(max(int(limit), 1), PAYMENTS_MAX_LIMIT) if limit else None
+            cursor = None
+            if args.get('cursor'):
+                cursor_date, cursor_id, cursor_invoice_id = args['cursor'].split(':', 2)
+                cursor = (fields.Date.to_date(cursor_date), int(cursor_id), int(cursor_invoice_id))
+                limit = limit or PAYMENTS_DEFAULT_LIMIT
+            date_from = fields.Date.to_date(args.get('date_from') or None)
+            date_to = fields.Date.to_date(args.get('date_to') or None)
+        except ValueError:
+            return _json_message("Paramètres invalides (partnerId, limit, cursor, date_from, date_to)", 400)
+
+        rows, next_cursor = request.env['rental.payment.history'].get_partner_payments(
+            partner_id, date_from=date_from, date_to=date_to, cursor=cursor, limit=limit)
+        return _json({
+            "payments": rows,
+            "next_cursor": "%s:%s:%s" % next_cursor if next_cursor else None,
+        }, 200)
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+# controllers/password_hasher.py
+#
+# Contexte de hachage partagé par le worker pour les mots de passe partners
+# (res.partner.password) et créneaux de vérification bornés : pbkdf2 est
+# volontairement coûteux en CPU, un pic de connexions ne doit pas occuper
+# tous les threads du serveur.
+#
+# Réglages (fichier de configuration Odoo, section [options]) :
+#   rest_api_pbkdf2_rounds          tours pbkdf2_sha512 des nouveaux hachages
+#   rest_api_password_concurrency   vérifications simultanées par worker
+#   rest_api_password_queue_timeout attente max d'un créneau (secondes)
+
+import logging
+import os
+import threading
+
+from passlib.context import CryptContext
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+PASSWORD_SCHEMES = ["pbkdf2_sha512", "md5_crypt"]
+DEFAULT_PBKDF2_ROUNDS = 25000
+DEFAULT_CONCURRENCY = max(1, (os.cpu_count() or 2) // 2)
+DEFAULT_QUEUE_TIMEOUT = 5.0
+
+
+class PasswordHasherBusy(Exception):
+    """Aucun créneau de vérification libre dans le délai imparti."""
+
+
+def _config_value(key, default, cast):
+    try:
+        value = config.get(key)
+        return cast(value) if value not in (None, '', False) else default
+    except (TypeError, ValueError):
+        _logger.warning("Valeur invalide pour %s : %r, défaut %s utilisé", key, config.get(key), default)
+        return default
+
+
+_context = None
+_slots = None
+_queue_timeout = DEFAULT_QUEUE_TIMEOUT
+_init_lock = threading.Lock()
+
+
+def _ensure_initialized():
+    global _context, _slots, _queue_timeout
+    if _context is not None:
+        return
+    with _init_lock:
+        if _context is not None:
+            return
+        rounds = _config_value('rest_api_pbkdf2_rounds', DEFAULT_PBKDF2_ROUNDS, int)
+        concurrency = max(1, _config_value('rest_api_password_concurrency', DEFAULT_CONCURRENCY, int))
+        _queue_timeout = _config_value('rest_api_password_queue_timeout', DEFAULT_QUEUE_TIMEOUT, float)
+        _slots = threading.BoundedSemaphore(concurrency)
+        _context = CryptContext(
+            schemes=PASSWORD_SCHEMES,
+            deprecated="md5_crypt",
+            pbkdf2_sha512__rounds=rounds,
+        )
+
+
+def get_password_context():
+    _ensure_initialized()
+    return _context
+
+
+class _slot:
+    """Créneau de calcul : attend au plus _queue_timeout, sinon PasswordHasherBusy."""
+
+    def __enter__(self):
+        _ensure_initialized()
+        if not _slots.acquire(timeout=_queue_timeout):
+            raise PasswordHasherBusy()
+        return self
+
+    def __exit__(self, *exc):
+        _slots.release()
+        return False
+
+
+def hash_password(password):
+    with _slot():
+        return _context.hash(password)
+
+
+def verify_password(password, hashed):
+    """
+    Vérifie `password` contre `hashed`.
+    :return: (ok, new_hash) ; new_hash est renseigné si le hachage stocké doit être
+             remplacé (schéma déprécié ou nombre de tours modifié), sinon None
+    """
+    with _slot():
+        return _context.verify_and_update(password, hashed)
+
+
+def is_hashed_password(value):
+    if not value:
+        return False
+    return bool(get_password_context().identify(value))
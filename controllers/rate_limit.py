@@ -0,0 +1,231 @@
+# -*- coding: utf-8 -*-
+# controllers/rate_limit.py
+#
+# Limitation de débit par fenêtre glissante (approximation à deux fenêtres :
+# compteur courant + compteur précédent pondéré), évaluée avant tout accès base
+# ou calcul de hachage.
+#
+# Stockage : mémoire du worker par défaut (limites par processus), ou Redis
+# partagé entre workers si `rest_api_rate_limit_redis_url` est défini dans le
+# fichier de configuration Odoo. En prefork (workers > 0) sans Redis, la limite
+# effective est workers x limite : Redis est requis en production (un
+# avertissement est journalisé au premier appel sinon).
+# Chaque règle peut y être surchargée :
+#   rest_api_rate_limit_<règle> = <requêtes>/<secondes>   (ex. 10/300)
+#
+# Les règles par IP lisent remote_addr : derrière un reverse proxy (nginx…),
+# `proxy_mode = True` est indispensable, sinon tous les clients partagent l'IP
+# du proxy et atteignent ensemble la même limite.
+
+import functools
+import json
+import logging
+import math
+import threading
+import time
+
+import werkzeug
+
+from odoo.http import request
+from odoo.tools import config
+
+from ..models.contact_keys import normalize_phone
+
+try:
+    import redis
+except ImportError:
+    redis = None
+
+_logger = logging.getLogger(__name__)
+
+# règle -> (requêtes autorisées, fenêtre en secondes)
+RATE_LIMITS = {
+    'login_ip': (30, 60),
+    'login_user': (10, 300),
+    'otp_ip': (30, 60),
+    'otp_identity': (5, 300),
+}
+
+
+def _rule(name):
+    value = config.get('rest_api_rate_limit_%s' % name)
+    if value:
+        try:
+            limit, window = str(value).split('/', 1)
+            return int(limit), int(window)
+        except ValueError:
+            _logger.warning("Limite invalide pour %s : %r, défaut utilisé", name, value)
+    return RATE_LIMITS[name]
+
+
+def _estimate(current, previous, window, now):
+    elapsed = (now % window) / window
+    return previous * (1.0 - elapsed) + current
+
+
+class MemoryBackend(object):
+    """Compteurs par worker : clé -> [index de fenêtre, courant, précédent, dernier accès]."""
+
+    def __init__(self, max_entries=50000):
+        self.max_entries = max_entries
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def hit(self, key, limit, window, now):
+        index = int(now // window)
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                if len(self._data) >= self.max_entries:
+                    self._evict(now)
+                entry = self._data[key] = [index, 0, 0, now]
+            elif entry[0] != index:
+                entry[2] = entry[1] if entry[0] == index - 1 else 0
+                entry[1] = 0
+                entry[0] = index
+            entry[3] = now
+            allowed = _estimate(entry[1], entry[2], window, now) < limit
+            if allowed:
+                entry[1] += 1
+            return allowed
+
+    def _evict(self, now):
+        # Purge des compteurs sans activité récente, sinon du plus ancien inséré
+        horizon = now - 2 * max(window for _limit, window in RATE_LIMITS.values())
+        stale = [k for k, entry in self._data.items() if entry[3] < horizon]
+        for key in stale:
+            del self._data[key]
+        if len(self._data) >= self.max_entries:
+            self._data.pop(next(iter(self._data)))
+
+
+class RedisBackend(object):
+    """Compteurs partagés entre workers : une clé Redis par (règle, clé, fenêtre)."""
+
+    def __init__(self, url):
+        self._client = redis.Redis.from_url(url, socket_timeout=0.2, socket_connect_timeout=0.2)
+
+    def hit(self, key, limit, window, now):
+        index = int(now // window)
+        current_key = 'rest_api:rl:%s:%s' % (key, index)
+        previous_key = 'rest_api:rl:%s:%s' % (key, index - 1)
+        current, previous = self._client.mget(current_key, previous_key)
+        if _estimate(int(current or 0), int(previous or 0), window, now) >= limit:
+            return False
+        pipe = self._client.pipeline()
+        pipe.incr(current_key)
+        pipe.expire(current_key, 2 * window)
+        pipe.execute()
+        return True
+
+
+_backend = None
+_backend_lock = threading.Lock()
+
+
+def _get_backend():
+    global _backend
+    if _backend is None:
+        with _backend_lock:
+            if _backend is None:
+                url = config.get('rest_api_rate_limit_redis_url')
+                if url and redis is not None:
+                    _backend = RedisBackend(url)
+                else:
+                    if url:
+                        _logger.warning("rest_api_rate_limit_redis_url défini mais le paquet redis est absent : "
+                                        "limitation en mémoire par worker")
+                    workers = int(config.get('workers') or 0)
+                    if workers > 1:
+                        _logger.warning("Limitation de débit en mémoire avec %s workers : limites effectives "
+                                        "multipliées par %s, définir rest_api_rate_limit_redis_url", workers, workers)
+                    _backend = MemoryBackend()
+                if not config.get('proxy_mode'):
+                    _logger.info("Limitation de débit par IP sans proxy_mode : remote_addr est l'IP du "
+                                 "proxy si Odoo est derrière un reverse proxy")
+    return _backend
+
+
+def check(rule, key):
+    """
+    Compte une requête pour (rule, key).
+    :return: None si autorisée, sinon le délai conseillé (secondes) avant nouvel essai
+    """
+    if not key:
+        return None
+    limit, window = _rule(rule)
+    now = time.time()
+    full_key = '%s:%s' % (rule, key)
+    try:
+        allowed = _get_backend().hit(full_key, limit, window, now)
+    except Exception:
+        # Backend partagé indisponible : ne pas bloquer l'API
+        _logger.exception("Limitation de débit indisponible (%s)", rule)
+        return None
+    if allowed:
+        return None
+    return max(1, int(math.ceil(window - (now % window))))
+
+
+def _request_data():
+    """Arguments + corps JSON de la requête (sans accès base)."""
+    data = request.httprequest.args.to_dict(flat=True)
+    body = request.httprequest.get_json(silent=True)
+    if isinstance(body, dict):
+        data.update(body)
+    return data
+
+
+def client_ip():
+    """IP du client ; derrière un reverse proxy, n'est fiable qu'avec proxy_mode (X-Forwarded-For)."""
+    return request.httprequest.remote_addr or ''
+
+
+def too_many_requests(retry_after):
+    return werkzeug.wrappers.Response(
+        status=429,
+        content_type='application/json; charset=utf-8',
+        headers=[('Retry-After', str(retry_after)), ('Cache-Control', 'no-store')],
+        response=json.dumps({
+            'error': 'too_many_requests',
+            'error_descrip': "Trop de tentatives, veuillez réessayer plus tard.",
+        }),
+    )
+
+
+def rate_limited(*rules):
+    """
+    Décorateur de route : rules = (règle, fonction(data, kwargs) -> clé) ; la
+    première règle dépassée renvoie 429 avec Retry-After, avant le corps de la route.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(self, *args, **kwargs):
+            data = _request_data()
+            for rule, key_func in rules:
+                key = key_func(data, kwargs)
+                retry_after = check(rule, str(key).strip().lower() if key else None)
+                if retry_after:
+                    _logger.warning("Limite %s atteinte pour %s", rule, key)
+                    return too_many_requests(retry_after)
+            return func(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def by_ip(data, kwargs):
+    return client_ip()
+
+
+def by_field(name):
+    def key_func(data, kwargs):
+        return data.get(name) or kwargs.get(name)
+    return key_func
+
+
+def by_username(data, kwargs):
+    """Identifiant de connexion : email tel quel, téléphone ramené au format E.164."""
+    username = str(data.get('username') or '').strip()
+    if not username or '@' in username:
+        return username
+    return normalize_phone(username) or username
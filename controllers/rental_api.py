@@ -2,14 +2,45 @@
 # -*- coding: utf-8 -*-
 from odoo import http, fields, _
 from odoo.http import request
+import base64
+import io
 import json
+import time
 import werkzeug
 import logging
 from dateutil.relativedelta import relativedelta
 import requests  # optional, used for external payment providers (Wave/OM) if configurés
 
+from .cache_store import SimpleCacheStore
+from ..models.rental_sync import SYNC_TOMBSTONE_RETENTION_DAYS
+
 _logger = logging.getLogger(__name__)
 
+# Cache analytique : clé (db, date_from, date_to, building_id) ; revalidé sur
+# l'empreinte des mois clos (écritures antidatées => recalcul complet)
+_analytics_cache = SimpleCacheStore(max_entries=256)
+ANALYTICS_CACHE_EXPIRES_IN = 24 * 3600
+# Le mois courant (et les suivants) sont recalculés au plus toutes les N secondes
+ANALYTICS_CURRENT_MONTH_EXPIRES_IN = 60
+
+# Synchro mobile : le jeton est daté du début de la plus ancienne transaction encore
+# ouverte (write_date = horloge de début de transaction) ; une transaction longue
+# (cron, action de masse) qui commite après la synchro reste donc couverte.
+# Recouvrement supplémentaire de sécurité, les doublons sont fusionnés par id côté client.
+SYNC_TOKEN_OVERLAP_SECONDS = 5
+_SYNC_TOKEN_QUERY = """
+    SELECT LEAST(now(), COALESCE(min(xact_start), now())) AT TIME ZONE 'UTC'
+      FROM pg_stat_activity
+     WHERE datname = current_database()
+       AND pid <> pg_backend_pid()
+       AND xact_start IS NOT NULL
+"""
+
+# Résumé locatif (login include=rental, /api/rent/partner/<id>/summary) :
+# clé (db, partner_id) -> (empreinte des données, résumé)
+_partner_summary_cache = SimpleCacheStore(max_entries=4096)
+PARTNER_SUMMARY_CACHE_EXPIRES_IN = 300
+
 # -------------------------
 # Helpers JSON / util
 # -------------------------
@@ -51,6 +82,16 @@ def _money(v):
     except Exception:
         return 0.0
 
+# Actions de masse sur rental.contract : action -> (méthode, états autorisés)
+CONTRACT_BULK_ACTIONS = {
+    'confirm': ('action_confirm', ('draft',)),
+    'terminate': ('action_terminate', ('active',)),
+    'expire': ('action_expire', ('active',)),
+    'regenerate_schedule': ('_generate_payment_schedule', None),
+}
+CONTRACT_BULK_DEFAULT_CHUNK = 100
+CONTRACT_BULK_MAX_CHUNK = 500
+
 # -------------------------
 # Serializers
 # -------------------------
@@ -176,6 +217,37 @@ def _contract_payload(c, with_schedule=True, with_invoices=False):
         payload["invoices"] = [_invoice_payload(inv) for inv in c.invoice_ids]
     return payload
 
+def _encode_sync_token(partner_id, since):
+    raw = json.dumps({"v": 1, "p": partner_id, "t": fields.Datetime.to_string(since)})
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+def _decode_sync_token(token, partner_id):
+    """Retourne la date du jeton, ou None (jeton absent / invalide / autre partner / expiré)."""
+    if not token:
+        return None
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(token + '=' * (-len(token) % 4)))
+        if raw.get("v") != 1 or raw.get("p") != partner_id:
+            return None
+        since = fields.Datetime.to_datetime(raw["t"])
+    except Exception:
+        return None
+    if since < fields.Datetime.now() - relativedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS):
+        return None
+    return since - relativedelta(seconds=SYNC_TOKEN_OVERLAP_SECONDS)
+
+def partner_rental_summary(partner):
+    """Résumé locatif du partner (rental.partner.summary), via le cache revalidé sur empreinte."""
+    Summary = request.env['rental.partner.summary'].sudo()
+    stamp = Summary._summary_stamp(partner.id)
+    cache_key = (request.env.cr.dbname, partner.id)
+    cached = _partner_summary_cache.get(cache_key)
+    if cached and cached[0] == stamp:
+        return cached[1]
+    summary = Summary.get_summary(partner)
+    _partner_summary_cache.set(cache_key, (stamp, summary), expires_in=PARTNER_SUMMARY_CACHE_EXPIRES_IN)
+    return summary
+
 # -------------------------
 # Controller principal
 # -------------------------
@@ -189,10 +261,11 @@ class RentalApi(http.Controller):
         _require_admin_env()
         args = _parse_args()
         q = (args.get('q') or '').strip()
-        domain = []
         if q:
-            domain += ['|', ('name', 'ilike', q), ('code', 'ilike', q)]
-        buildings = request.env['rental.building'].sudo().search(domain, order='name asc')
+            # q : index trigrammes, résultats classés par similarité
+            buildings = request.env['rental.search'].search_ranked('rental.building', q)
+        else:
+            buildings = request.env['rental.building'].sudo().search([], order='name asc')
         return _json([_building_payload(b) for b in buildings], 200)
 
     @http.route('/api/rent/buildings/<int:building_id>', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
@@ -214,16 +287,25 @@ class RentalApi(http.Controller):
         status = (args.get('status') or '').strip()
         building_id = int(args.get('building_id')) if args.get('building_id') else None
 
+        with_facets = args.get('facets') in ('1', 'true', 'True')
+
         domain = []
-        if q:
-            domain += ['|', ('name', 'ilike', q), ('description', 'ilike', q)]
         if status:
             domain += [('status', '=', status)]
         if building_id:
             domain += [('building_id', '=', building_id)]
 
-        props = request.env['rental.property'].sudo().search(domain, order='name asc')
-        return _json([_property_payload(p, with_contract=True) for p in props], 200)
+        Search = request.env['rental.search']
+        if q:
+            # q : index trigrammes, résultats classés par similarité
+            props = Search.search_ranked('rental.property', q, domain)
+        else:
+            props = request.env['rental.property'].sudo().search(domain, order='name asc')
+        results = [_property_payload(p, with_contract=True) for p in props]
+        if not with_facets:
+            return _json(results, 200)
+        # facets=1 : compteurs par statut / type / immeuble dans la même réponse
+        return _json({"results": results, "facets": Search.facets('rental.property', props)}, 200)
 
     @http.route('/api/rent/properties/<int:prop_id>', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
     def get_property(self, prop_id, **kw):
@@ -343,6 +425,147 @@ class RentalApi(http.Controller):
             return _json_message("Aucune échéance à facturer pour l’instant", 200)
         return _json({"invoice": _invoice_payload(inv)}, 201)
 
+    @http.route('/api/rent/invoicing/auto', type='http', auth='none', methods=['GET', 'POST'], cors="*", csrf=False)
+    def auto_invoicing(self, **kw):
+        """
+        GET  : statistiques du dernier passage du moteur de facturation automatique
+        POST : déclenche le cron en arrière-plan (réponse immédiate)
+        """
+        _require_admin_env()
+        icp = request.env['ir.config_parameter'].sudo()
+        try:
+            last_run = json.loads(icp.get_param('rental.auto_invoice_last_run') or 'null')
+        except ValueError:
+            last_run = None
+        if request.httprequest.method == 'POST':
+            cron = request.env.ref('res_api_magasin.rental_auto_generate_invoices', raise_if_not_found=False)
+            if not cron:
+                return _json_message("Cron de facturation automatique introuvable", 404)
+            cron.sudo()._trigger()
+            return _json({"triggered": True, "last_run": last_run}, 202)
+        return _json({"last_run": last_run}, 200)
+
+    @http.route('/api/rent/contracts/bulk-action', type='http', auth='none', methods=['POST'], cors="*", csrf=False)
+    def bulk_contract_action(self, **kw):
+        """
+        Body:
+          {
+            "action": "confirm" | "terminate" | "expire" | "regenerate_schedule",
+            "ids": [int, ...],          # ou
+            "building_id": int,         # ou (tous les contrats de l'immeuble)
+            "domain": [[...], ...],     # domaine Odoo sur rental.contract
+            "dry_run": bool,            # optional: prévisualisation sans modification
+            "chunk_size": int           # optional (défaut 100, max 500)
+          }
+        Exécution par lots avec un commit par lot ; réponse compacte par id.
+        regenerate_schedule passe par rental.schedule.generator (_generate_payment_schedule
+        du contrat, un savepoint par contrat, écart avant / après par contrat).
+        """
+        _require_admin_env()
+        data = _parse_body()
+        if not data:
+            return _json_message("Données invalides", 400)
+
+        action = data.get('action')
+        if action not in CONTRACT_BULK_ACTIONS:
+            return _json_message("Action invalide, valeurs possibles: %s" % ", ".join(sorted(CONTRACT_BULK_ACTIONS)), 400)
+        method_name, allowed_states = CONTRACT_BULK_ACTIONS[action]
+        dry_run = bool(data.get('dry_run'))
+        try:
+            chunk_size = min(max(int(data.get('chunk_size') or CONTRACT_BULK_DEFAULT_CHUNK), 1), CONTRACT_BULK_MAX_CHUNK)
+        except (TypeError, ValueError):
+            return _json_message("chunk_size invalide", 400)
+
+        Contract = request.env['rental.contract'].sudo()
+        if data.get('ids'):
+            try:
+                contract_ids = list(dict.fromkeys(int(i) for i in data['ids']))
+            except (TypeError, ValueError):
+                return _json_message("ids invalides", 400)
+        elif data.get('building_id'):
+            # ex: révision de loyer sur tout un immeuble
+            try:
+                contract_ids = Contract.search([('property_id.building_id', '=', int(data['building_id']))], order='id').ids
+            except (TypeError, ValueError):
+                return _json_message("building_id invalide", 400)
+        elif isinstance(data.get('domain'), list):
+            try:
+                contract_ids = Contract.search(data['domain'], order='id').ids
+            except Exception as e:
+                return _json_message("Domaine invalide: %s" % e, 400)
+        else:
+            return _json_message("Champs requis: ids, building_id ou domain", 400)
+
+        results = []
+        counters = {'succeeded': 0, 'failed': 0, 'skipped': 0}
+        Generator = request.env['rental.schedule.generator'].sudo()
+        for start in range(0, len(contract_ids), chunk_size):
+            chunk_ids = contract_ids[start:start + chunk_size]
+            contracts = Contract.browse(chunk_ids)
+            existing = set(contracts.exists().ids)
+            eligible = Contract.browse()
+            for c in contracts:
+                if c.id not in existing:
+                    results.append({"id": c.id, "ok": False, "error": "not_found"})
+                    counters['skipped'] += 1
+                    continue
+                if allowed_states and c.state not in allowed_states:
+                    results.append({"id": c.id, "ok": False, "state": c.state, "error": "invalid_state"})
+                    counters['skipped'] += 1
+                    continue
+                if action == 'regenerate_schedule':
+                    eligible |= c
+                    continue
+                method = getattr(c, method_name, None)
+                if not callable(method):
+                    results.append({"id": c.id, "ok": False, "state": c.state, "error": "method_not_available"})
+                    counters['skipped'] += 1
+                    continue
+                if dry_run:
+                    results.append({"id": c.id, "ok": True, "state": c.state, "dry_run": True})
+                    counters['succeeded'] += 1
+                    continue
+                try:
+                    with request.env.cr.savepoint():
+                        method()
+                    results.append({"id": c.id, "ok": True, "state": c.state})
+                    counters['succeeded'] += 1
+                except Exception as e:
+                    request.env.invalidate_all()
+                    _logger.warning("Bulk %s contrat %s en échec: %s", action, c.id, e)
+                    results.append({"id": c.id, "ok": False, "error": str(e)})
+                    counters['failed'] += 1
+
+            if eligible:
+                # Échéanciers : un seul passage du générateur pour tout le lot
+                try:
+                    with request.env.cr.savepoint():
+                        stats = Generator.generate(eligible, dry_run=dry_run)
+                    for cid, st in stats.items():
+                        if 'error' in st:
+                            # contrat ignoré par le générateur (date de début / fréquence)
+                            results.append({"id": cid, "ok": False, "error": st['error']})
+                            counters['skipped'] += 1
+                            continue
+                        results.append({"id": cid, "ok": True, "schedule": st, **({"dry_run": True} if dry_run else {})})
+                        counters['succeeded'] += 1
+                except Exception as e:
+                    request.env.invalidate_all()
+                    _logger.warning("Bulk regenerate_schedule en échec pour %s: %s", eligible.ids, e)
+                    for cid in eligible.ids:
+                        results.append({"id": cid, "ok": False, "error": str(e)})
+                    counters['failed'] += len(eligible)
+            if not dry_run:
+                request.env.cr.commit()
+
+        return _json({
+            "action": action,
+            "dry_run": dry_run,
+            "total": len(contract_ids),
+            **counters,
+            "results": results,
+        }, 200)
+
     # -------------
     # Invoices
     # -------------
@@ -415,57 +638,97 @@ class RentalApi(http.Controller):
         """
         Body:
           {
-            "amount": float,  # optional (default = amount_total)
+            "amount": float,  # optional (default = amount_residual)
             "journal_id": int,  # optional
             "payment_date": "YYYY-MM-DD" optional
           }
-        NOTE: c'est une solution simple pour l'API. En production, utiliser le workflow comptable + paiements enregistrés.
         """
         _require_admin_env()
         jdata = _parse_body() or {}
-        amount = float(jdata.get('amount') or 0.0)
-        payment_date = jdata.get('payment_date') or fields.Date.today()
-        journal_id = jdata.get('journal_id')
 
         inv = request.env['account.move'].sudo().browse(move_id)
         if not inv.exists():
             return _json_message("Facture introuvable", 404)
 
         try:
-            # Default amount = invoice.amount_residual
-            if not amount or amount <= 0:
-                amount = float(inv.amount_residual or inv.amount_total or 0.0)
-
-            # Créer un paiement simple (account.payment) et valider
-            Payment = request.env['account.payment'].sudo()
-            payment_vals = {
-                'payment_type': 'inbound',
-                'partner_id': inv.partner_id.id,
-                'amount': amount,
-                'currency_id': inv.currency_id.id if inv.currency_id else inv.company_id.currency_id.id,
-                'payment_date': payment_date,
-                'communication': inv.name,
-            }
-            if journal_id:
-                payment_vals['journal_id'] = journal_id
-
-            payment = Payment.create(payment_vals)
-            # post payment and reconcile with invoice
-            payment.action_post()
-            # reconcile with invoice's receivable move lines
-            lines = (payment.move_id + inv.line_ids).filtered(lambda r: r.account_id.internal_type in ('receivable', 'payable'))
-            # use Odoo reconcile tools: try full reconcile
-            try:
-                # try partial/full reconcile via write on matched_ids is complex; use invoice._recompute_payment_state
-                inv._compute_invoice_payment_status()
-            except Exception:
-                pass
-
-            return _json({"ok": True, "payment_id": payment.id}, 200)
+            result = request.env['account.move'].sudo()._register_rental_payments([dict(jdata, invoice_id=move_id)])[0]
+            if not result.get('ok'):
+                return _json({"ok": False, "error": result.get('error'), "payment_id": result.get('payment_id')}, 400)
+            return _json({"ok": True, "payment_id": result['payment_id']}, 200)
         except Exception as e:
             _logger.exception("Erreur marquer facture payée: %s", e)
             return _json({"ok": False, "error": str(e)}, 500)
 
+    @http.route('/api/rent/invoices/mark-paid', type='http', auth='none', methods=['POST'], cors="*", csrf=False)
+    def mark_invoices_paid_bulk(self, **kw):
+        """
+        Encaissement en lot (caisse).
+        Body:
+          {
+            "payments": [
+              {"invoice_id": int, "amount": float, "journal_id": int, "payment_date": "YYYY-MM-DD"},
+              ...
+            ]
+          }
+        amount / journal_id / payment_date sont optionnels (défaut : reste à payer,
+        journal d'encaissement configuré, date du jour).
+        Réponse : un résultat par ligne, dans l'ordre reçu.
+        """
+        _require_admin_env()
+        jdata = _parse_body() or {}
+        entries = jdata.get('payments')
+        if not isinstance(entries, list) or not entries:
+            return _json_message("payments (liste) requis", 400)
+        if not all(isinstance(e, dict) for e in entries):
+            return _json_message("Chaque paiement doit être un objet", 400)
+
+        try:
+            results = request.env['account.move'].sudo()._register_rental_payments(entries)
+        except Exception as e:
+            _logger.exception("Erreur encaissement en lot: %s", e)
+            return _json({"ok": False, "error": str(e)}, 500)
+
+        succeeded = sum(1 for r in results if r.get('ok'))
+        return _json({
+            "ok": succeeded == len(results),
+            "total": len(results),
+            "succeeded": succeeded,
+            "failed": len(results) - succeeded,
+            "results": results,
+        }, 200)
+
+    @http.route('/api/rent/settlements/import', type='http', auth='none', methods=['POST'], cors="*", csrf=False)
+    def import_settlement_statement(self, **kw):
+        """
+        Import d'un relevé de règlement CSV (Wave / Orange Money).
+        Query : provider=wave|orange, journal_id (optional), dry_run=1 (optional)
+        Fichier : multipart (champ "file") ou corps brut text/csv.
+        Le fichier est lu en flux ; encaissement + lettrage par lots.
+        """
+        _require_admin_env()
+        args = _parse_args()
+        provider = (args.get('provider') or '').lower()
+        if provider not in ('wave', 'orange'):
+            return _json_message("provider requis (wave|orange)", 400)
+        try:
+            journal_id = int(args.get('journal_id') or 0) or None
+        except ValueError:
+            return _json_message("journal_id invalide", 400)
+        dry_run = args.get('dry_run') in ('1', 'true', 'True')
+
+        upload = request.httprequest.files.get('file')
+        raw = upload.stream if upload else request.httprequest.stream
+        stream = io.TextIOWrapper(raw, encoding='utf-8-sig', errors='replace', newline='')
+        try:
+            stats = request.env['rental.settlement.import'].sudo().import_statement(
+                stream, provider, journal_id=journal_id, dry_run=dry_run)
+        except ValueError as e:
+            return _json_message(str(e), 400)
+        except Exception as e:
+            _logger.exception("Erreur import relevé %s: %s", provider, e)
+            return _json({"ok": False, "error": str(e)}, 500)
+        return _json(stats, 200)
+
     # -------------
     # Partner-specific: exposer tout ce dont le partner a besoin
     # -------------
@@ -519,6 +782,19 @@ class RentalApi(http.Controller):
         }
         return _json(result, 200)
 
+    @http.route('/api/rent/partner/<int:partner_id>/summary', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
+    def partner_summary(self, partner_id, **kw):
+        """
+        Résumé locatif léger (compteurs, impayés, locaux, 5 dernières factures,
+        5 prochaines échéances), chargé par l'application en parallèle du login.
+        Mis en cache et revalidé sur l'empreinte des contrats / factures / échéances.
+        """
+        _require_admin_env()
+        partner = request.env['res.partner'].sudo().browse(partner_id)
+        if not partner.exists():
+            return _json_message("Partner introuvable", 404)
+        return _json(partner_rental_summary(partner), 200)
+
     @http.route('/api/rent/partner/<int:partner_id>/invoices', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
     def partner_invoices(self, partner_id, **kw):
         _require_admin_env()
@@ -552,126 +828,146 @@ class RentalApi(http.Controller):
         props = contracts.mapped('property_id')
         return _json([_property_payload(p, with_contract=True) for p in props], 200)
 
-    @http.route('/api/rent/schedules/<int:schedule_id>', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
-    def get_schedule(self, schedule_id, **kw):
+    @http.route('/api/rent/partner/<int:partner_id>/sync', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
+    def partner_sync(self, partner_id, **kw):
+        """
+        Synchro incrémentale de l'application locataire.
+        GET ?since=<sync_token>   (absent / invalide / expiré => synchro complète)
+        Réponse:
+          {
+            "full": bool, "sync_token": str,
+            "contracts": [...], "invoices": [...], "schedules": [...], "properties": [...],
+            "deleted": {"contracts": [ids], "invoices": [ids], "schedules": [ids], "properties": [ids]}
+          }
+        Les enregistrements sont à fusionner par id côté client (le jeton recouvre
+        les transactions encore ouvertes, un même enregistrement peut revenir deux fois).
+        """
         _require_admin_env()
-        s = request.env['rental.payment.schedule'].sudo().browse(schedule_id)
-        if not s.exists():
-            return _json_message("Échéance introuvable", 404)
+        partner = request.env['res.partner'].sudo().browse(partner_id)
+        if not partner.exists():
+            return _json_message("Partner introuvable", 404)
+
+        since = _decode_sync_token(_parse_args().get('since'), partner.id)
+        request.env.cr.execute(_SYNC_TOKEN_QUERY)
+        token_date = request.env.cr.fetchone()[0]
+        changed = [('write_date', '>', since)] if since else []
 
+        RentalContract = request.env['rental.contract'].sudo()
+        contracts = RentalContract.with_context(active_test=False).search([('tenant_id', '=', partner.id)])
+        changed_contracts = contracts.filtered_domain(changed) if since else contracts
+
+        invoices = request.env['account.move'].sudo().search([
+            ('rental_contract_id', 'in', contracts.ids),
+            ('move_type', '=', 'out_invoice'),
+        ] + changed, order='invoice_date desc, id desc')
+        schedules = request.env['rental.payment.schedule'].sudo().search(
+            [('contract_id', 'in', contracts.ids)] + changed, order='due_date asc')
 
+        # Locaux visibles = locaux des contrats actifs ; un local entre / sort du
+        # périmètre quand lui-même ou son contrat change
+        active_contracts = contracts.filtered(lambda c: c.state == 'active' and getattr(c, 'active', True))
+        properties = active_contracts.mapped('property_id')
+        if since:
+            moved = changed_contracts.mapped('property_id')
+            sent_properties = properties.filtered(lambda p: p in moved or p.write_date > since)
+            gone_properties = moved - properties
+        else:
+            sent_properties, gone_properties = properties, request.env['rental.property']
+
+        deleted = {"contracts": [], "invoices": [], "schedules": [], "properties": gone_properties.ids}
+        archived_contracts = changed_contracts.filtered(lambda c: not getattr(c, 'active', True))
+        deleted["contracts"] += archived_contracts.ids
+        cancelled = invoices.filtered(lambda inv: inv.state == 'cancel')
+        deleted["invoices"] += cancelled.ids
+        if since:
+            collections = {'rental.contract': 'contracts', 'account.move': 'invoices',
+                           'rental.payment.schedule': 'schedules', 'rental.property': 'properties'}
+            for tomb in request.env['rental.sync.tombstone'].sudo().search_read(
+                    [('partner_id', '=', partner.id), ('deleted_at', '>', since)], ['model', 'res_id']):
+                if tomb['model'] in collections:
+                    deleted[collections[tomb['model']]].append(tomb['res_id'])
+
+        return _json({
+            "partner_id": partner.id,
+            "full": not since,
+            "sync_token": _encode_sync_token(partner.id, token_date),
+            "contracts": [_contract_payload(c, with_schedule=False, with_invoices=False)
+                          for c in changed_contracts - archived_contracts],
+            "invoices": [_invoice_payload(inv) for inv in invoices - cancelled],
+            "schedules": [_schedule_payload(sch) for sch in schedules],
+            "properties": [_property_payload(p, with_contract=False) for p in sent_properties],
+            "deleted": deleted,
+        }, 200)
 
-    def _status_from_payment_state(self, move):
+    # -------------
+    # Analytics portefeuille (occupation / facturé / encaissé / arriérés)
+    # -------------
+    @http.route('/api/rent/analytics', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
+    def portfolio_analytics(self, **kw):
         """
-        Mappe le payment_state Odoo vers les statuts attendus côté front :
-          paid | not_paid | partial | overdue | posted | draft
+        GET /api/rent/analytics?date_from=YYYY-MM-DD&date_to=YYYY-MM-DD&building_id=ID
+        Série mensuelle par immeuble. Les mois clos sont servis depuis le cache tant
+        que leur empreinte est inchangée, seul le mois courant (et au-delà) est recalculé.
         """
-        ps = (move.payment_state or "").lower()
-        if ps in ("paid",):
-            return "paid"
-        if ps in ("not_paid", "invoicing_legacy"):
-            return "not_paid"
-        if ps in ("partial", "in_payment"):
-            return "partial"
-        # "overdue" : si non payé et échéance dépassée
+        _require_admin_env()
+        args = _parse_args()
+        Analytics = request.env['rental.analytics'].sudo()
+        current_month = Analytics.current_month_start()
         try:
-            if move.invoice_date_due and move.payment_state not in ("paid",) and move.invoice_date_due < fields.Date.context_today(move):
-                return "overdue"
-        except Exception:
-            pass
-        # fallback sur l'état comptable
-        if move.state == "posted":
-            return "posted"
-        if move.state == "draft":
-            return "draft"
-        return ps or move.state or "draft"
-
-    def _serialize_invoice(self, move):
-        """
-        Normalise la facture pour le front:
-        {
-          id, code, move_type, status, issue_date, due_date, currency,
-          amount_total, amount_paid, amount_residual, partner_id, partner_name,
-          invoice_lines: [{name, quantity, price_unit, subtotal}],
-          items: [{id, description, quantity, unit_price, total}]
-        }
-        """
-        amount_total = float(move.amount_total or 0.0)
-        amount_residual = float(move.amount_residual or 0.0)
-        amount_paid = max(0.0, amount_total - amount_residual)
-
-        # lignes au format API (invoice_lines) + "items" pour ta vue mobile
-        inv_lines = []
-        items = []
-        for idx, line in enumerate(move.invoice_line_ids):
-            row = {
-                "name": line.name or "",
-                "quantity": float(line.quantity or 0.0),
-                "price_unit": float(line.price_unit or 0.0),
-                "subtotal": float(line.price_subtotal or 0.0),
+            date_to = fields.Date.to_date(args.get('date_to')) if args.get('date_to') else fields.Date.context_today(Analytics)
+            date_from = fields.Date.to_date(args.get('date_from')) if args.get('date_from') \
+                else (date_to - relativedelta(months=11)).replace(day=1)
+            building_id = int(args.get('building_id')) if args.get('building_id') else None
+        except (TypeError, ValueError):
+            return _json_message("Paramètres invalides (date_from, date_to, building_id)", 400)
+        if date_from > date_to:
+            return _json_message("date_from doit être antérieure à date_to", 400)
+
+        key = (request.env.cr.dbname, str(date_from), str(date_to), building_id)
+        stamp = Analytics._closed_months_stamp()
+        entry = _analytics_cache.get(key)
+        if entry is None or entry.get('stamp') != stamp:
+            entry = {
+                'rows': Analytics.get_portfolio_series(date_from, date_to, building_id),
+                'refreshed_at': time.time(),
+                'stamp': stamp,
             }
-            inv_lines.append(row)
-            items.append({
-                "id": line.id or idx,
-                "description": line.name or "",
-                "quantity": float(line.quantity or 0.0),
-                "unit_price": float(line.price_unit or 0.0),
-                "total": float(line.price_subtotal or 0.0),
-            })
-
-        data = {
-            "id": move.id,
-            "code": move.name,
-            "move_type": move.move_type,
-            "status": self._status_from_payment_state(move),
-            "issue_date": move.invoice_date.isoformat() if move.invoice_date else None,
-            "due_date": move.invoice_date_due.isoformat() if move.invoice_date_due else None,
-            "currency": move.currency_id.name,
-            "amount_total": amount_total,
-            "amount_paid": amount_paid,
-            "amount_residual": amount_residual,
-            "partner_id": move.partner_id.id if move.partner_id else None,
-            "partner_name": move.partner_id.display_name if move.partner_id else None,
-            "invoice_lines": inv_lines,
-            # en plus (utile pour FactureMagasin.jsx)
-            "items": items,
-        }
-        # si tu veux exposer le lien de paiement/transaction (optionnel)
-        if hasattr(move, "transaction_id"):
-            data["transaction_id"] = move.transaction_id
-        if hasattr(move, "payment_link"):
-            data["payment_link"] = move.payment_link
-        return data
-
-    def _json(self, payload, status=200):
-        return request.make_response(
-            headers=[("Content-Type", "application/json; charset=utf-8")],
-            data=json.dumps(payload),
-            status=status,
-        )
-
-    # --- Endpoint public ---
-
-    @http.route("/api/account-move/by-transaction", type="http", auth="public", methods=["GET"], csrf=False, cors="*")
-    def api_invoice_by_transaction(self, **kw):
-        """
-        GET /api/account-move/by-transaction?transaction=<uuid>
-        Réponse: { "invoice": { ...normalisé... } }
-        """
-        tx = (kw.get("transaction") or "").strip()
-        if not tx:
-            return self._json({"error": "missing_transaction", "message": "Paramètre 'transaction' requis."}, status=400)
-
-        # recherche facture par transaction_id
-        Move = request.env["account.move"].sudo()
-        move = Move.search([("transaction_id", "=", tx), ("move_type", "in", ("out_invoice", "out_refund"))], limit=1)
-        if not move:
-            return self._json({"error": "not_found", "message": "Aucune facture pour cette transaction."}, status=404)
-
-        # sérialisation
-        data = self._serialize_invoice(move)
-        return self._json({"invoice": data}, status=200)
-
-
+            _analytics_cache.set(key, entry, ANALYTICS_CACHE_EXPIRES_IN)
+        elif date_to >= current_month and entry['refreshed_at'] + ANALYTICS_CURRENT_MONTH_EXPIRES_IN < time.time():
+            # Rafraîchissement incrémental : uniquement à partir du mois courant
+            refresh_from = max(current_month, date_from)
+            fresh = {
+                (r['building_id'], r['month']): r
+                for r in Analytics.get_portfolio_series(refresh_from, date_to, building_id)
+            }
+            entry = {
+                'rows': [fresh.get((r['building_id'], r['month']), r) for r in entry['rows']],
+                'refreshed_at': time.time(),
+                'stamp': stamp,
+            }
+            _analytics_cache.set(key, entry, ANALYTICS_CACHE_EXPIRES_IN)
+
+        buildings = []
+        for row in entry['rows']:
+            if not buildings or buildings[-1]['building_id'] != row['building_id']:
+                buildings.append({
+                    'building_id': row['building_id'],
+                    'building_name': row['building_name'],
+                    'series': [],
+                })
+            buildings[-1]['series'].append({k: v for k, v in row.items() if k not in ('building_id', 'building_name')})
+
+        return _json({
+            "date_from": str(date_from),
+            "date_to": str(date_to),
+            "building_id": building_id,
+            "buildings": buildings,
+        }, 200)
 
-   
\ No newline at end of file
+    @http.route('/api/rent/schedules/<int:schedule_id>', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
+    def get_schedule(self, schedule_id, **kw):
+        _require_admin_env()
+        s = request.env['rental.payment.schedule'].sudo().browse(schedule_id)
+        if not s.exists():
+            return _json_message("Échéance introuvable", 404)
+        return _json({"schedule": _schedule_payload(s)}, 200)
@@ -6,6 +6,96 @@ import hashlib
 
 _logger = logging.getLogger(__name__)
 
+# Réutilisation d'un refresh token déjà tourné : tolérée (sans révocation) dans ce
+# délai, le temps que des rafraîchissements concurrents de la même application aboutissent.
+REFRESH_REUSE_GRACE_SECONDS = 10
+
+# Rotation en une instruction : le refresh token courant est retiré (rotated_at),
+# son access token supprimé, puis un nouveau couple inséré dans la même famille.
+# L'expiration absolue du refresh token d'origine est conservée.
+_ROTATE_REFRESH_TOKEN_QUERY = """
+    WITH old AS (
+        SELECT id, access_token, user_id, expiry_time, COALESCE(family, refresh_token) AS family
+          FROM rest_api_refresh_token
+         WHERE refresh_token = %(refresh_token)s
+           AND rotated_at IS NULL
+           AND expiry_time >= %(now)s
+         LIMIT 1
+           FOR UPDATE
+    ),
+    retired AS (
+        UPDATE rest_api_refresh_token r
+           SET rotated_at = %(now)s, family = old.family
+          FROM old
+         WHERE r.id = old.id
+    ),
+    revoked_access AS (
+        DELETE FROM rest_api_access_token a
+         USING old
+         WHERE a.access_token = old.access_token
+    ),
+    new_access AS (
+        INSERT INTO rest_api_access_token (access_token, user_id, expiry_time,
+                                           create_uid, create_date, write_uid, write_date)
+        SELECT %(new_access_token)s, old.user_id, %(access_expiry)s,
+               %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+          FROM old
+    ),
+    new_refresh AS (
+        INSERT INTO rest_api_refresh_token (refresh_token, access_token, user_id, expiry_time, family,
+                                            create_uid, create_date, write_uid, write_date)
+        SELECT %(new_refresh_token)s, %(new_access_token)s, old.user_id, old.expiry_time, old.family,
+               %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+          FROM old
+    )
+    SELECT user_id, expiry_time FROM old
+"""
+
+# Rafraîchissement sans rotation (clients n'ayant pas opté pour la rotation) :
+# le refresh token est conservé, seul l'access token est remplacé.
+_REFRESH_ACCESS_TOKEN_QUERY = """
+    WITH old AS (
+        SELECT id, access_token, user_id, expiry_time
+          FROM rest_api_refresh_token
+         WHERE refresh_token = %(refresh_token)s
+           AND rotated_at IS NULL
+           AND expiry_time >= %(now)s
+         LIMIT 1
+           FOR UPDATE
+    ),
+    revoked_access AS (
+        DELETE FROM rest_api_access_token a
+         USING old
+         WHERE a.access_token = old.access_token
+    ),
+    new_access AS (
+        INSERT INTO rest_api_access_token (access_token, user_id, expiry_time,
+                                           create_uid, create_date, write_uid, write_date)
+        SELECT %(new_access_token)s, old.user_id, %(access_expiry)s,
+               %(uid)s, now() AT TIME ZONE 'UTC', %(uid)s, now() AT TIME ZONE 'UTC'
+          FROM old
+    ),
+    kept_refresh AS (
+        UPDATE rest_api_refresh_token r
+           SET access_token = %(new_access_token)s, write_uid = %(uid)s, write_date = now() AT TIME ZONE 'UTC'
+          FROM old
+         WHERE r.id = old.id
+    )
+    SELECT user_id, expiry_time FROM old
+"""
+
+# Révocation d'une famille (réutilisation d'un refresh token tourné)
+_REVOKE_REFRESH_FAMILY_QUERY = """
+    WITH family AS (
+        DELETE FROM rest_api_refresh_token
+         WHERE family = %(family)s OR refresh_token = %(family)s
+     RETURNING access_token
+    )
+    DELETE FROM rest_api_access_token a
+     USING family
+     WHERE a.access_token = family.access_token
+"""
+
 
 class SimpleTokenStore(object):
     
@@ -27,6 +117,7 @@ class SimpleTokenStore(object):
             'access_token': self.hash(access_token),
             'user_id':      user_id,
             'expiry_time':  current_time + refresh_expires_in,
+            'family':       self.hash(refresh_token),
         })
     
     def fetch_by_token(self, env, type, token):
@@ -85,10 +176,64 @@ class SimpleTokenStore(object):
                     'access_token': self.hash(new_access_token)
                 })
     
+    def rotate_refresh_token(self, env, refresh_token, new_access_token,
+                             expires_in, new_refresh_token, rotate=True):
+        """
+        Rotation atomique (une instruction SQL) du couple access / refresh.
+        rotate=False (clients antérieurs à la rotation) : seul l'access token est
+        remplacé, le refresh token reste valable ; new_refresh_token est ignoré.
+        La détection de réutilisation ne concerne que les familles déjà tournées.
+
+        :return: dict {'status': 'ok'|'invalid'|'concurrent'|'reused',
+                       'user_id': int, 'refresh_expires_in': int}
+          - invalid : refresh token inconnu ou expiré
+          - concurrent : refresh token tourné il y a moins de REFRESH_REUSE_GRACE_SECONDS
+          - reused : refresh token tourné réutilisé plus tard ; toute la famille est révoquée
+        """
+        current_time = time.time()
+        refresh_hash = self.hash(refresh_token)
+        env['rest.api.access.token'].flush_model()
+        env['rest.api.refresh.token'].flush_model()
+        cr = env.cr
+        cr.execute(_ROTATE_REFRESH_TOKEN_QUERY if rotate else _REFRESH_ACCESS_TOKEN_QUERY, {
+            'refresh_token': refresh_hash,
+            'new_access_token': self.hash(new_access_token),
+            'new_refresh_token': self.hash(new_refresh_token),
+            'access_expiry': current_time + expires_in,
+            'now': current_time,
+            'uid': env.uid,
+        })
+        row = cr.fetchone()
+        env['rest.api.access.token'].invalidate_model()
+        env['rest.api.refresh.token'].invalidate_model()
+        if row:
+            user_id, expiry_time = row
+            return {'status': 'ok', 'user_id': user_id, 'rotated': rotate,
+                    'refresh_expires_in': max(int(expiry_time - current_time), 0)}
+
+        cr.execute("""
+            SELECT COALESCE(family, refresh_token), rotated_at, user_id
+              FROM rest_api_refresh_token
+             WHERE refresh_token = %s AND rotated_at IS NOT NULL
+        """, (refresh_hash,))
+        row = cr.fetchone()
+        if not row:
+            return {'status': 'invalid'}
+        family, rotated_at, user_id = row
+        if current_time - rotated_at <= REFRESH_REUSE_GRACE_SECONDS:
+            return {'status': 'concurrent', 'user_id': user_id}
+        cr.execute(_REVOKE_REFRESH_FAMILY_QUERY, {'family': family})
+        _logger.warning("Refresh token réutilisé après rotation (user %s) : famille révoquée", user_id)
+        return {'status': 'reused', 'user_id': user_id}
+
     def delete_all_tokens_by_refresh_token(self, env, refresh_token):
         refresh_token_data = self.fetch_by_refresh_token(env, refresh_token)
         if refresh_token_data:
-            access_token = refresh_token_data.access_token
-            # Delete tokens
-            self.delete_access_token(env, access_token)
-            self.delete_refresh_token(env, refresh_token)
+            # Delete tokens of the whole rotation chain
+            env['rest.api.access.token'].flush_model()
+            env['rest.api.refresh.token'].flush_model()
+            env.cr.execute(_REVOKE_REFRESH_FAMILY_QUERY, {
+                'family': refresh_token_data.family or refresh_token_data.refresh_token,
+            })
+            env['rest.api.access.token'].invalidate_model()
+            env['rest.api.refresh.token'].invalidate_model()
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+# controllers/tx_events.py
+#
+# Server-Sent Events par transaction : le front ouvre un flux après la redirection
+# vers Wave / Orange Money au lieu de rappeler /api/account-move/by-transaction.
+# Un thread par worker et par base écoute le canal PostgreSQL (LISTEN, dans la
+# base applicative : NOTIFY n'est délivré qu'aux sessions de la même base) et
+# réveille les flux concernés ; un flux en attente ne tient ni cursor ni connexion.
+# Le statut est aussi revérifié à chaque heartbeat (notification perdue pendant
+# une reconnexion).
+# À servir par le worker gevent (comme /websocket) pour supporter des milliers de flux.
+
+import json
+import logging
+import select
+import threading
+import time
+
+import odoo
+from odoo import http, tools
+from odoo.http import request
+import werkzeug
+
+from ..models.rest_api_tx_notify import TX_NOTIFY_CHANNEL
+
+_logger = logging.getLogger(__name__)
+
+TX_EVENTS_DEFAULT_TIMEOUT = 60
+TX_EVENTS_MAX_TIMEOUT = 300
+TX_EVENTS_HEARTBEAT = 15
+TX_EVENTS_LISTEN_TIMEOUT = 50
+
+_TX_STATUS_QUERY = """
+    SELECT payment_state, state, amount_residual
+      FROM account_move
+     WHERE transaction_id = %s
+       AND move_type IN ('out_invoice', 'out_refund')
+     LIMIT 1
+"""
+
+
+class TxEventDispatcher(object):
+    """Écoute LISTEN rest_api_tx (une connexion par base) et réveille les abonnés (db, transaction)."""
+
+    def __init__(self):
+        self._waiters = {}
+        self._lock = threading.Lock()
+        self._threads = {}
+
+    def subscribe(self, dbname, tx):
+        self._ensure_started(dbname)
+        event = threading.Event()
+        with self._lock:
+            self._waiters.setdefault((dbname, tx), set()).add(event)
+        return event
+
+    def unsubscribe(self, dbname, tx, event):
+        with self._lock:
+            events = self._waiters.get((dbname, tx))
+            if events is not None:
+                events.discard(event)
+                if not events:
+                    del self._waiters[(dbname, tx)]
+
+    def _wake(self, key):
+        with self._lock:
+            events = list(self._waiters.get(key, ()))
+        for event in events:
+            event.set()
+
+    def _ensure_started(self, dbname):
+        if dbname not in self._threads:
+            with self._lock:
+                if dbname not in self._threads:
+                    thread = threading.Thread(target=self._run, args=(dbname,), daemon=True,
+                                              name='%s.TxEventDispatcher.%s' % (__name__, dbname))
+                    self._threads[dbname] = thread
+                    thread.start()
+
+    def _loop(self, dbname):
+        with odoo.sql_db.db_connect(dbname).cursor() as cr:
+            conn = cr._cnx
+            cr.execute('LISTEN "%s"' % TX_NOTIFY_CHANNEL)
+            cr.commit()
+            while True:
+                if select.select([conn], [], [], TX_EVENTS_LISTEN_TIMEOUT) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop()
+                    try:
+                        payload = json.loads(notify.payload)
+                        self._wake((payload['db'], payload['tx']))
+                    except (ValueError, KeyError, TypeError):
+                        _logger.warning("Notification %s invalide: %s", TX_NOTIFY_CHANNEL, notify.payload)
+
+    def _run(self, dbname):
+        while True:
+            try:
+                self._loop(dbname)
+            except Exception:
+                _logger.exception("TxEventDispatcher(%s): erreur de boucle, reconnexion dans 5s", dbname)
+                # les abonnés revérifient le statut au réveil
+                with self._lock:
+                    keys = [key for key in self._waiters if key[0] == dbname]
+                for key in keys:
+                    self._wake(key)
+                time.sleep(5)
+
+
+dispatcher = TxEventDispatcher()
+
+
+def _tx_status(dbname, tx):
+    """Statut courant de la facture `tx` via un cursor court (hors requête HTTP)."""
+    with odoo.registry(dbname).cursor() as cr:
+        cr.execute(_TX_STATUS_QUERY, (tx,))
+        row = cr.fetchone()
+        if not row:
+            return None
+        status = {'transaction': tx, 'payment_state': row[0], 'state': row[1], 'amount_residual': float(row[2] or 0.0)}
+        for gateway, table in (('wave', 'wave_transaction'), ('orange', 'orange_money_transaction')):
+            if tools.table_exists(cr, table):
+                cr.execute('SELECT status FROM "%s" WHERE transaction_id = %%s ORDER BY id DESC LIMIT 1' % table, (tx,))
+                gateway_row = cr.fetchone()
+                status[gateway] = gateway_row[0] if gateway_row else None
+        return status
+
+
+def _sse(event, data):
+    return 'event: %s\ndata: %s\n\n' % (event, json.dumps(data, ensure_ascii=False, default=str))
+
+
+def _event_stream(dbname, tx, timeout):
+    event = dispatcher.subscribe(dbname, tx)
+    try:
+        deadline = time.monotonic() + timeout
+        last = _tx_status(dbname, tx)
+        yield 'retry: 3000\n' + _sse('status', last)
+        while last and last['payment_state'] not in ('paid', 'reversed'):
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if event.wait(min(TX_EVENTS_HEARTBEAT, remaining)):
+                event.clear()
+            else:
+                yield ': keep-alive\n\n'
+            # revérifié aussi au heartbeat : filet si une notification a été manquée
+            current = _tx_status(dbname, tx)
+            if current != last:
+                last = current
+                yield _sse('status', last)
+        yield _sse('end', {'transaction': tx})
+    finally:
+        dispatcher.unsubscribe(dbname, tx, event)
+
+
+class TxEventsController(http.Controller):
+
+    @http.route('/api/account-move/by-transaction/events', type='http', auth='none', methods=['GET'], cors="*", csrf=False)
+    def transaction_events(self, **kw):
+        """
+        GET /api/account-move/by-transaction/events?transaction=<uuid>&timeout=<s, défaut 60, max 300>
+        Flux text/event-stream :
+          event: status  data: {transaction, payment_state, state, amount_residual, wave, orange}
+          event: end     (facture payée, délai écoulé)
+        Le flux est produit après la fin de la requête : aucun cursor n'est tenu pendant l'attente.
+        """
+        tx = (kw.get('transaction') or '').strip()
+        if not tx:
+            return werkzeug.wrappers.Response(status=400, content_type='application/json; charset=utf-8',
+                                              response=json.dumps({"message": "Paramètre 'transaction' requis"}))
+        try:
+            timeout = min(max(int(kw.get('timeout') or TX_EVENTS_DEFAULT_TIMEOUT), 1), TX_EVENTS_MAX_TIMEOUT)
+        except ValueError:
+            timeout = TX_EVENTS_DEFAULT_TIMEOUT
+
+        request.env.cr.execute(_TX_STATUS_QUERY, (tx,))
+        if not request.env.cr.fetchone():
+            return werkzeug.wrappers.Response(status=404, content_type='application/json; charset=utf-8',
+                                              response=json.dumps({"message": "Facture introuvable pour cette transaction"}))
+
+        return werkzeug.wrappers.Response(
+            _event_stream(request.env.cr.dbname, tx, timeout),
+            status=200,
+            content_type='text/event-stream; charset=utf-8',
+            headers=[('Cache-Control', 'no-cache'), ('X-Accel-Buffering', 'no')],
+        )
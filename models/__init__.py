@@ -5,5 +5,18 @@ from . import ir_model
 from . import partner
 
 from . import magasin_config
+from . import magasin_geo
 from . import account_move
 from . import invoice_reminder_history
+from . import rental_analytics
+from . import rental_schedule_generator
+from . import rental_invoicing_engine
+from . import rental_settlement_import
+from . import rental_search
+from . import rental_sync
+from . import rest_api_tx_notify
+from . import rest_api_webhook
+from . import rental_payment_history
+from . import rest_api_job
+from . import rest_api_otp
+from . import rental_partner_summary
@@ -1,11 +1,12 @@
 
 # models/account_move.py
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api, _ , http
+from odoo import models, fields, api, tools, _ , http
 from odoo.exceptions import ValidationError
 import logging
 import uuid
 import requests 
+from .gateway_client import get_gateway_client
 from odoo.http import request, Response
 import json
 from datetime import date, datetime, timedelta
@@ -30,6 +31,9 @@ class AccountMove(models.Model):
 
     payment_link_orange_money = fields.Char(string="Lien de paiement Orange Money", help="URL publique pour régler la facture")
 
+    rental_auto_generated = fields.Boolean(string="Facture loyer automatique", copy=False, readonly=True,
+                                           help="Facture créée par le moteur de facturation automatique des échéances")
+
     last_reminder_date = fields.Date(string="Date du dernier rappel", help="Date du dernier envoi automatique de rappel pour cette facture")
     
     reminder_history_ids = fields.One2many(
@@ -45,6 +49,25 @@ class AccountMove(models.Model):
         store=False
     )
     
+    def init(self):
+        super().init()
+        # Index unique (partiel) sur transaction_id : /api/account-move/by-transaction ne doit jamais scanner
+        cr = self.env.cr
+        if tools.index_exists(cr, 'account_move_transaction_id_uniq'):
+            return
+        try:
+            with cr.savepoint(flush=False):
+                cr.execute("""
+                    CREATE UNIQUE INDEX account_move_transaction_id_uniq
+                        ON account_move (transaction_id)
+                     WHERE transaction_id IS NOT NULL
+                """)
+        except Exception as e:
+            # Doublons historiques : index simple en attendant le nettoyage des données
+            _logger.warning("Index unique transaction_id impossible (%s), création d'un index simple", e)
+            tools.create_index(cr, 'account_move_transaction_id_idx', 'account_move', ['transaction_id'],
+                               where='transaction_id IS NOT NULL')
+
     def _compute_reminder_history_count(self):
         """Calcule le nombre d'enregistrements d'historique pour chaque facture."""
         for invoice in self:
@@ -65,29 +88,25 @@ class AccountMove(models.Model):
     # ------------------------------------------------------------------
     # CREATE / WRITE
     # ------------------------------------------------------------------
-    @api.model
-    def create(self, vals):
-        res = super().create(vals)
-        if vals.get('move_type') == 'out_invoice':
+    @api.model_create_multi
+    def create(self, vals_list):
+        # transaction_id + liens de paiement posés dès la création (pas de write supplémentaires),
+        # ce qui permet les créations en lot (create(vals_list)) des moteurs de facturation.
+        base_url = None
+        for vals in vals_list:
+            if vals.get('move_type') != 'out_invoice':
+                continue
             tid = vals.get('transaction_id') or str(uuid.uuid4())
-            res.write({'transaction_id': tid})
-            # base_url = res._compute_frontend_url()
-            # res.write({'payment_link': f"{base_url}?transaction={tid}"})
-            # res.write({'payment_link_wave': f"{base_url}/paiement?type=wave&transaction={tid}"})
-            # res.write({'payment_link_orange_money': f"{base_url}/paiement?type=orange&transaction={tid}"})
-
+            vals['transaction_id'] = tid
             try:
-                base_url = res._compute_frontend_url()
-                res.write({'payment_link': f"{base_url}?transaction={tid}"})
-                res.write({'payment_link_wave': f"{base_url}/paiement?type=wave&transaction={tid}"})
-                res.write({'payment_link_orange_money': f"{base_url}/paiement?type=orange&transaction={tid}"})
+                if base_url is None:
+                    base_url = self._compute_frontend_url()
+                vals.setdefault('payment_link', f"{base_url}?transaction={tid}")
+                vals.setdefault('payment_link_wave', f"{base_url}/paiement?type=wave&transaction={tid}")
+                vals.setdefault('payment_link_orange_money', f"{base_url}/paiement?type=orange&transaction={tid}")
             except Exception as e:
                 _logger.error(f"Erreur lors de la génération du lien de paiement Wave: {e}")
-            
-
-        return res
-
-    
+        return super().create(vals_list)
 
     def write(self, vals):
         for inv in self:
@@ -112,6 +131,30 @@ class AccountMove(models.Model):
 
         return super().write(vals)
 
+    def _post(self, soft=True):
+        posted = super()._post(soft=soft)
+        self.env['rest.api.webhook.event']._enqueue(
+            'invoice.posted', posted.filtered(lambda m: m.move_type in ('out_invoice', 'out_refund')),
+            lambda inv: inv._webhook_invoice_data())
+        return posted
+
+    def _webhook_invoice_data(self):
+        self.ensure_one()
+        return {
+            'id': self.id,
+            'name': self.name,
+            'move_type': self.move_type,
+            'partner_id': self.partner_id.id,
+            'invoice_date': self.invoice_date,
+            'invoice_date_due': self.invoice_date_due,
+            'amount_total': self.amount_total,
+            'amount_residual': self.amount_residual,
+            'payment_state': self.payment_state,
+            'currency': self.currency_id.name,
+            'transaction_id': self.transaction_id,
+            'rental_contract_id': self.rental_contract_id.id or None,
+        }
+
     # ------------------------------------------------------------------
     # UTILS
     # ------------------------------------------------------------------
@@ -239,30 +282,162 @@ class AccountMove(models.Model):
         if not bank_journal:
             raise ValidationError(_("Aucun journal bancaire trouvé pour l'encaissement."))
 
-        pay = self.env['account.payment'].create({
-            'payment_type': 'inbound',
-            'partner_type': 'customer',
-            'partner_id': self.partner_id.id,
+        result = self._register_rental_payments([{
+            'invoice_id': self.id,
             'amount': self.amount_residual,
-            'payment_method_id': self.env.ref('account.account_payment_method_manual_in').id,
             'journal_id': bank_journal.id,
-            # 'payment_date': fields.Date.context_today(self),
-            # 'communication': _("Règlement facture %s") % (self.name),
-        })
-        pay.action_post()
+        }])[0]
+        if not result.get('ok'):
+            raise ValidationError(_("Encaissement impossible: %s") % result.get('error'))
+        return True
 
-        # Affectation automatique si possible
-        for line in pay.line_ids:
-            if line.account_id.internal_type in ('receivable', 'payable'):
+    # ------------------------------------------------------------------
+    # ENCAISSEMENTS EN LOT
+    # ------------------------------------------------------------------
+    @api.model
+    def _get_rental_payment_journal(self, company):
+        """Journal d'encaissement: paramètre rental.payment_journal_id, sinon banque/caisse de la société."""
+        Journal = self.env['account.journal'].sudo()
+        journal_id = self.env['ir.config_parameter'].sudo().get_param('rental.payment_journal_id')
+        try:
+            journal = Journal.browse(int(journal_id)).exists() if journal_id else Journal
+        except (TypeError, ValueError):
+            journal = Journal
+        if journal and journal.company_id == company:
+            return journal
+        return (Journal.search([('type', '=', 'bank'), ('company_id', '=', company.id)], limit=1)
+                or Journal.search([('type', '=', 'cash'), ('company_id', '=', company.id)], limit=1))
+
+    @api.model
+    def _register_rental_payments(self, entries):
+        """
+        Enregistre et lettre les encaissements de plusieurs factures en un passage :
+        un create(vals_list) de account.payment, un action_post() commun, puis
+        un lettrage groupé des lignes clients (un groupe par paire paiement/facture).
+
+        :param entries: liste de dicts {invoice_id, amount?, journal_id?, payment_date?, ref?}
+                        (amount absent = reste à payer ; un montant nul est refusé)
+        :return: liste de résultats dans le même ordre que `entries`
+        """
+        results = [None] * len(entries)
+        invoice_ids = set()
+        for entry in entries:
+            try:
+                invoice_ids.add(int(entry.get('invoice_id')))
+            except (TypeError, ValueError):
+                pass
+        invoices = {inv.id: inv for inv in self.sudo().browse(list(invoice_ids)).exists()}
+        today = fields.Date.context_today(self)
+        journals = {}
+        vals_list, pending = [], []
+
+        for idx, entry in enumerate(entries):
+            try:
+                inv = invoices.get(int(entry.get('invoice_id')))
+            except (TypeError, ValueError):
+                inv = None
+            res = {'invoice_id': entry.get('invoice_id'), 'ok': False}
+            if not inv or inv.move_type not in ('out_invoice', 'out_refund'):
+                results[idx] = dict(res, error='invoice_not_found')
+                continue
+            if inv.state != 'posted':
+                results[idx] = dict(res, error='invoice_not_posted')
+                continue
+            try:
+                # reste dû seulement si le montant est absent ; 0 reste 0 (refusé plus bas)
+                raw_amount = entry.get('amount')
+                amount = float(inv.amount_residual or 0.0) if raw_amount in (None, '') else float(raw_amount)
+                payment_date = fields.Date.to_date(entry.get('payment_date')) or today
+                journal_id = int(entry.get('journal_id') or 0)
+            except (TypeError, ValueError):
+                results[idx] = dict(res, error='invalid_values')
+                continue
+            if amount <= 0:
+                results[idx] = dict(res, error='nothing_to_pay')
+                continue
+            if not journal_id:
+                if inv.company_id.id not in journals:
+                    journals[inv.company_id.id] = self._get_rental_payment_journal(inv.company_id).id
+                journal_id = journals[inv.company_id.id]
+            if not journal_id:
+                results[idx] = dict(res, error='no_payment_journal')
+                continue
+            vals_list.append({
+                'payment_type': 'inbound' if inv.move_type == 'out_invoice' else 'outbound',
+                'partner_type': 'customer',
+                'partner_id': inv.commercial_partner_id.id,
+                'amount': amount,
+                'currency_id': inv.currency_id.id,
+                'date': payment_date,
+                'ref': entry.get('ref') or inv.name,
+                'journal_id': journal_id,
+            })
+            pending.append((idx, inv))
+
+        if not vals_list:
+            return results
+
+        # Création + comptabilisation dans un savepoint : aucun paiement brouillon ne
+        # subsiste en cas d'échec ; si le lot échoue, reprise ligne par ligne
+        Payment = self.env['account.payment'].sudo()
+        try:
+            with self.env.cr.savepoint():
+                payments = Payment.create(vals_list)
+                payments.action_post()
+            posted = [(idx, inv, payment) for (idx, inv), payment in zip(pending, payments)]
+        except Exception as e:
+            self.env.invalidate_all()
+            _logger.warning("Encaissement en lot impossible (%s facture(s)), reprise ligne par ligne: %s", len(pending), e)
+            posted = []
+            for (idx, inv), vals in zip(pending, vals_list):
                 try:
-                    assign_line = getattr(self, 'js_assign_outstanding_line', None)
-                    if callable(assign_line):
-                        assign_line(line.id)
-                    else:
-                        _logger.warning("Méthode 'js_assign_outstanding_line' inexistante sur le modèle %s", self._name)
-                except Exception as e:
-                    _logger.warning("Affectation automatique du paiement impossible: %s", e)
-        return True
+                    with self.env.cr.savepoint():
+                        payment = Payment.create(vals)
+                        payment.action_post()
+                    posted.append((idx, inv, payment))
+                except Exception as line_error:
+                    self.env.invalidate_all()
+                    results[idx] = {'invoice_id': inv.id, 'ok': False, 'error': 'payment_failed: %s' % line_error}
+
+        # Lettrage : un seul _reconcile_plan pour toutes les paires (chaque paire
+        # reste un groupe distinct) ; si le lot échoue, reprise paire par paire
+        pairs = []
+        for idx, inv, payment in posted:
+            inv_lines = inv.line_ids.filtered(
+                lambda l: l.account_id.account_type in ('asset_receivable', 'liability_payable') and not l.reconciled)
+            pay_lines = payment.move_id.line_ids.filtered(
+                lambda l: l.account_id in inv_lines.account_id and not l.reconciled)
+            pairs.append((idx, inv, payment, inv_lines | pay_lines))
+
+        def _reconciled(idx, inv, payment):
+            results[idx] = {
+                'invoice_id': inv.id,
+                'ok': True,
+                'payment_id': payment.id,
+                'payment_state': inv.payment_state,
+                'amount_residual': float(inv.amount_residual or 0.0),
+            }
+
+        MoveLine = self.env['account.move.line'].sudo()
+        try:
+            with self.env.cr.savepoint():
+                MoveLine._reconcile_plan([lines for _idx, _inv, _payment, lines in pairs])
+            for idx, inv, payment, _lines in pairs:
+                _reconciled(idx, inv, payment)
+        except Exception as e:
+            self.env.invalidate_all()
+            _logger.warning("Lettrage en lot impossible (%s paire(s)), reprise paire par paire: %s", len(pairs), e)
+            for idx, inv, payment, lines in pairs:
+                try:
+                    with self.env.cr.savepoint():
+                        lines.reconcile()
+                    _reconciled(idx, inv, payment)
+                except Exception as pair_error:
+                    self.env.invalidate_all()
+                    _logger.warning("Lettrage impossible facture %s / paiement %s: %s", inv.name, payment.id, pair_error)
+                    results[idx] = {'invoice_id': inv.id, 'ok': False, 'payment_id': payment.id,
+                                    'error': 'reconcile_failed: %s' % pair_error}
+        return results
 
 
     def send_payment_link_sms_with_details(self):
@@ -423,11 +598,13 @@ class AccountMove(models.Model):
 
         try:
             # 4. Appeler l'API Wave pour créer une session de paiement
-            response = requests.post(
-                "https://api.wave.com/v1/checkout/sessions",
+            # Client partagé (keep-alive, délais connexion/lecture, retry borné) ;
+            # une clé d'idempotence par demande de lien : seuls les retries HTTP la rejouent
+            response = get_gateway_client('wave').post(
+                "/v1/checkout/sessions",
                 json=payload,
                 headers=headers,
-                timeout=30
+                idempotency_key=uuid.uuid4().hex,
             )
             reference = f"{self.name}_{uuid.uuid4().hex[:8].upper()}"
             description = _("Paiement de la facture %s en ligne via Wave.") % self.name
@@ -916,4 +1093,23 @@ class AccountMove(models.Model):
             raise
 
 
+class AccountMoveLine(models.Model):
+    _inherit = 'account.move.line'
 
+    def _reconcile_plan(self, reconciliation_plan):
+        # Webhook invoice.paid : factures clients qui passent à payé lors de ce lettrage.
+        # reconcile() passe par _reconcile_plan ; le lettrage groupé aussi.
+        lines = self.browse()
+        stack = list(reconciliation_plan)
+        while stack:
+            item = stack.pop()
+            if isinstance(item, models.BaseModel):
+                lines |= item
+            else:
+                stack.extend(item)
+        invoices = lines.move_id.filtered(
+            lambda m: m.move_type in ('out_invoice', 'out_refund') and m.payment_state not in ('paid', 'in_payment'))
+        res = super()._reconcile_plan(reconciliation_plan)
+        paid = invoices.filtered(lambda m: m.payment_state in ('paid', 'in_payment'))
+        self.env['rest.api.webhook.event']._enqueue('invoice.paid', paid, lambda inv: inv._webhook_invoice_data())
+        return res
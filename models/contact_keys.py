@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Normalisation des clés de recherche des contacts (téléphone E.164, email).
+# Module partagé par res.partner (champs stockés) et les contrôleurs (recherches).
+import re
+
+from odoo import tools
+
+DEFAULT_COUNTRY_CODE = '221'
+PHONE_MIN_DIGITS = 7
+
+
+def normalize_phone(raw, default_cc=DEFAULT_COUNTRY_CODE):
+    """
+    Numéro au format E.164 ('+221771234567') ou None si inexploitable.
+      - '+221 77 123 45 67', '00221771234567', '221771234567' -> '+221771234567'
+      - '77 123 45 67', '0771234567'                         -> '+221771234567'
+      - '+33 6 12 34 56 78'                                  -> '+33612345678'
+    """
+    if not raw:
+        return None
+    s = str(raw).strip()
+    international = s.startswith('+') or s.startswith('00')
+    digits = re.sub(r'\D', '', s)
+    if s.startswith('00'):
+        digits = digits[2:]
+    if not international:
+        digits = digits.lstrip('0')
+        if not (digits.startswith(default_cc) and len(digits) == len(default_cc) + 9):
+            digits = default_cc + digits
+    if len(digits) < PHONE_MIN_DIGITS:
+        return None
+    return '+' + digits
+
+
+def national_number(e164, default_cc=DEFAULT_COUNTRY_CODE):
+    """Partie nationale d'un numéro E.164 du pays par défaut ('+221771234567' -> '771234567')."""
+    prefix = '+' + default_cc
+    return e164[len(prefix):] if e164 and e164.startswith(prefix) else (e164 or '').lstrip('+')
+
+
+def normalize_email(raw):
+    """Email normalisé (minuscules, sans nom d'affichage) ou None."""
+    return (tools.email_normalize(raw) or None) if raw else None
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+# Client HTTP partagé des passerelles de paiement (Wave, Orange Money).
+#
+#  - une requests.Session par passerelle et par worker (connexions keep-alive)
+#  - délais de connexion et de lecture distincts
+#  - nouvelles tentatives bornées avec jitter, uniquement pour les appels
+#    idempotents (ou non encore émis : échec de connexion)
+#  - métriques de latence par passerelle (compteurs + histogramme)
+#
+# Surcharges (fichier de configuration Odoo, section [options]) :
+#   rest_api_gateway_<passerelle>_base_url         (ex. serveur de test local)
+#   rest_api_gateway_<passerelle>_connect_timeout  secondes
+#   rest_api_gateway_<passerelle>_read_timeout     secondes
+#   rest_api_gateway_<passerelle>_retries          tentatives supplémentaires
+#   rest_api_gateway_<passerelle>_total_timeout    budget total d'un appel, retries compris
+import contextlib
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from odoo.tools import config
+
+_logger = logging.getLogger(__name__)
+
+GATEWAYS = {
+    'wave': {
+        'base_url': 'https://api.wave.com',
+        'connect_timeout': 3.05,
+        'read_timeout': 15.0,
+        'retries': 2,
+        'total_timeout': 25.0,
+    },
+    # Les appels HTTP Orange Money sont faits par orange.money.config (module
+    # externe) : seule la latence des appels est mesurée ici via measure().
+    'orange_money': {
+        'base_url': '',
+        'connect_timeout': 3.05,
+        'read_timeout': 15.0,
+        'retries': 2,
+        'total_timeout': 25.0,
+    },
+}
+IDEMPOTENT_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'})
+RETRY_STATUSES = frozenset({429, 502, 503, 504})
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float('inf'))
+
+
+class GatewayMetrics(object):
+    """Compteurs de latence d'une passerelle (par worker)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.errors = 0
+            self.retries = 0
+            self.total_seconds = 0.0
+            self.max_seconds = 0.0
+            self.buckets = [0] * len(LATENCY_BUCKETS)
+
+    def record(self, seconds, error=False, retries=0):
+        with self._lock:
+            self.calls += 1
+            self.errors += 1 if error else 0
+            self.retries += retries
+            self.total_seconds += seconds
+            self.max_seconds = max(self.max_seconds, seconds)
+            for i, bound in enumerate(LATENCY_BUCKETS):
+                if seconds <= bound:
+                    self.buckets[i] += 1
+                    break
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'errors': self.errors,
+                'retries': self.retries,
+                'avg_ms': round(1000.0 * self.total_seconds / self.calls, 1) if self.calls else None,
+                'max_ms': round(1000.0 * self.max_seconds, 1),
+                'buckets': {('le_%s' % b if b != float('inf') else 'inf'): n
+                            for b, n in zip(LATENCY_BUCKETS, self.buckets)},
+            }
+
+
+class GatewayClient(object):
+
+    def __init__(self, name, base_url='', connect_timeout=3.05, read_timeout=15.0, retries=2,
+                 total_timeout=25.0, backoff_base=0.25, backoff_max=2.0, pool_maxsize=16, session=None):
+        self.name = name
+        self.base_url = (base_url or '').rstrip('/')
+        self.timeout = (connect_timeout, read_timeout)
+        self.total_timeout = total_timeout
+        self.retries = max(0, retries)
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.metrics = GatewayMetrics()
+        if session is None:
+            session = requests.Session()
+            # pas de retry implicite urllib3 : les tentatives sont gérées ici
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_maxsize, max_retries=0)
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+        self.session = session
+
+    def _url(self, path):
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return '%s/%s' % (self.base_url, path.lstrip('/'))
+
+    def _fits(self, deadline, delay):
+        """Une nouvelle tentative a-t-elle encore le temps d'établir une connexion ?"""
+        return time.monotonic() + delay + self.timeout[0] < deadline
+
+    def _backoff(self, attempt):
+        # full jitter : uniforme entre 0 et le plafond exponentiel
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def request(self, method, path, idempotent=None, idempotency_key=None, **kwargs):
+        """
+        requests.Session.request avec les délais et la politique de retry de la passerelle.
+
+        :param idempotent: force le caractère rejouable (défaut : méthode idempotente
+                           ou idempotency_key fourni)
+        :param idempotency_key: envoyé dans l'en-tête Idempotency-Key ; propre à une
+                                tentative d'initiation (les retries HTTP la réutilisent)
+        :return: requests.Response (la dernière reçue) ; lève requests.RequestException
+                 si aucune réponse n'a pu être obtenue
+        """
+        method = method.upper()
+        if idempotency_key:
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, **{'Idempotency-Key': str(idempotency_key)})
+        if idempotent is None:
+            idempotent = method in IDEMPOTENT_METHODS or bool(idempotency_key)
+        timeout = kwargs.pop('timeout', None) or self.timeout
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        url = self._url(path)
+
+        # Budget total (tentatives + attentes) : le délai de lecture de chaque
+        # tentative est borné par le temps restant ; pas de retry hors budget.
+        started = time.monotonic()
+        deadline = started + self.total_timeout
+        attempt = 0
+        while True:
+            remaining = deadline - time.monotonic()
+            kwargs['timeout'] = (min(timeout[0], remaining), max(min(timeout[1], remaining), 0.1))
+            try:
+                response = self.session.request(method, url, **kwargs)
+            except requests.ConnectionError as e:
+                # ConnectTimeout / refus de connexion : requête non émise, rejouable
+                retryable = idempotent or isinstance(e, requests.ConnectTimeout)
+                delay = self._backoff(attempt + 1)
+                if attempt < self.retries and retryable and self._fits(deadline, delay):
+                    attempt += 1
+                    _logger.warning("[%s] %s %s : %s, nouvelle tentative %s/%s",
+                                    self.name, method, url, e, attempt, self.retries)
+                    time.sleep(delay)
+                    continue
+                self.metrics.record(time.monotonic() - started, error=True, retries=attempt)
+                raise
+            except requests.RequestException:
+                self.metrics.record(time.monotonic() - started, error=True, retries=attempt)
+                raise
+            delay = self._backoff(attempt + 1)
+            if (response.status_code in RETRY_STATUSES and idempotent and attempt < self.retries
+                    and self._fits(deadline, delay)):
+                attempt += 1
+                _logger.warning("[%s] %s %s : HTTP %s, nouvelle tentative %s/%s",
+                                self.name, method, url, response.status_code, attempt, self.retries)
+                response.close()
+                time.sleep(delay)
+                continue
+            elapsed = time.monotonic() - started
+            self.metrics.record(elapsed, error=response.status_code >= 500, retries=attempt)
+            _logger.debug("[%s] %s %s -> %s en %.0f ms", self.name, method, url, response.status_code, 1000 * elapsed)
+            return response
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    @contextlib.contextmanager
+    def measure(self):
+        """Mesure un appel fait hors de ce client (ex. SDK / module externe)."""
+        started = time.monotonic()
+        try:
+            yield
+        except Exception:
+            self.metrics.record(time.monotonic() - started, error=True)
+            raise
+        self.metrics.record(time.monotonic() - started)
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def _gateway_settings(name):
+    settings = dict(GATEWAYS.get(name, {}))
+    for key, cast in (('base_url', str), ('connect_timeout', float), ('read_timeout', float), ('retries', int),
+                      ('total_timeout', float)):
+        value = config.get('rest_api_gateway_%s_%s' % (name, key))
+        if value not in (None, '', False):
+            try:
+                settings[key] = cast(value)
+            except ValueError:
+                _logger.warning("Valeur invalide pour rest_api_gateway_%s_%s : %r", name, key, value)
+    return settings
+
+
+def get_gateway_client(name):
+    """Client partagé (par worker) de la passerelle `name` ('wave', 'orange_money')."""
+    client = _clients.get(name)
+    if client is None:
+        with _clients_lock:
+            client = _clients.get(name)
+            if client is None:
+                client = _clients[name] = GatewayClient(name, **_gateway_settings(name))
+    return client
+
+
+def gateway_metrics():
+    """{passerelle: métriques} des clients instanciés dans ce worker."""
+    return {name: client.metrics.snapshot() for name, client in _clients.items()}
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Outils de géolocalisation (recherche de magasins à proximité).
+# Module sans modèle : utilisé par l'extension gestion.magasin (magasin_geo.py).
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Grille géographique : cellules de 0.01° (~1.1 km), geo_cell = lat_idx * GEO_GRID_COLS + lon_idx
+GEO_GRID_STEP = 0.01
+GEO_GRID_COLS = 36000
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = 111.32
+
+
+def geo_cell(latitude, longitude):
+    lat_idx = int(math.floor((latitude + 90.0) / GEO_GRID_STEP))
+    lon_idx = int(math.floor((longitude + 180.0) / GEO_GRID_STEP))
+    return lat_idx * GEO_GRID_COLS + min(max(lon_idx, 0), GEO_GRID_COLS - 1)
+
+
+def bounding_box(latitude, longitude, radius_km):
+    """(lat_min, lat_max, lon_min, lon_max) du carré englobant le cercle."""
+    dlat = radius_km / KM_PER_DEGREE
+    dlon = radius_km / (KM_PER_DEGREE * max(math.cos(math.radians(latitude)), 0.01))
+    return (max(latitude - dlat, -90.0), min(latitude + dlat, 90.0),
+            max(longitude - dlon, -180.0), min(longitude + dlon, 180.0))
+
+
+def geo_cell_ranges(latitude, longitude, radius_km):
+    """Plages [min, max] de geo_cell couvrant le carré englobant le cercle (une plage par ligne de grille)."""
+    lat_lo, lat_hi, lon_lo, lon_hi = bounding_box(latitude, longitude, radius_km)
+    lat_min = int(math.floor((lat_lo + 90.0) / GEO_GRID_STEP))
+    lat_max = int(math.floor((lat_hi + 90.0) / GEO_GRID_STEP))
+    lon_min = max(int(math.floor((lon_lo + 180.0) / GEO_GRID_STEP)), 0)
+    lon_max = min(int(math.floor((lon_hi + 180.0) / GEO_GRID_STEP)), GEO_GRID_COLS - 1)
+    return [(row * GEO_GRID_COLS + lon_min, row * GEO_GRID_COLS + lon_max) for row in range(lat_min, lat_max + 1)]
+
+
+def haversine_km(latitude, longitude, latitudes, longitudes):
+    """Distances (km) entre un point et une liste de points, vectorisé avec numpy si disponible."""
+    if numpy is not None:
+        lat1, lon1 = numpy.radians(latitude), numpy.radians(longitude)
+        lat2, lon2 = numpy.radians(numpy.asarray(latitudes, dtype=float)), numpy.radians(numpy.asarray(longitudes, dtype=float))
+        a = numpy.sin((lat2 - lat1) / 2) ** 2 + numpy.cos(lat1) * numpy.cos(lat2) * numpy.sin((lon2 - lon1) / 2) ** 2
+        return (2 * EARTH_RADIUS_KM * numpy.arcsin(numpy.sqrt(a))).tolist()
+    lat1, lon1 = math.radians(latitude), math.radians(longitude)
+    cos_lat1 = math.cos(lat1)
+    distances = []
+    for lat2, lon2 in zip(latitudes, longitudes):
+        lat2, lon2 = math.radians(lat2), math.radians(lon2)
+        a = math.sin((lat2 - lat1) / 2) ** 2 + cos_lat1 * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        distances.append(2 * EARTH_RADIUS_KM * math.asin(math.sqrt(a)))
+    return distances
+
+
+def nearest(latitude, longitude, radius_km, rows, limit):
+    """rows = [(id, lat, lon)] candidats -> [(id, distance_km)] dans le rayon, triés par distance."""
+    if not rows:
+        return []
+    ids, latitudes, longitudes = zip(*rows)
+    distances = haversine_km(latitude, longitude, latitudes, longitudes)
+    nearby = sorted((d, i) for i, d in zip(ids, distances) if d <= radius_km)
+    return [(i, d) for d, i in nearby[:limit]]
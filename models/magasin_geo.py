@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+
+from .geo import geo_cell, geo_cell_ranges, nearest
+
+
+class MagasinGeo(models.Model):
+    _inherit = 'gestion.magasin'
+
+    geo_cell = fields.Integer(string='Cellule géographique', compute='_compute_geo_cell', store=True, index=True,
+                              help="Cellule de grille 0.01° utilisée pour la recherche de proximité")
+
+    @api.depends('latitude', 'longitude')
+    def _compute_geo_cell(self):
+        for rec in self:
+            if rec.latitude or rec.longitude:
+                rec.geo_cell = geo_cell(rec.latitude, rec.longitude)
+            else:
+                rec.geo_cell = False
+
+    @api.model
+    def search_nearby(self, latitude, longitude, radius_km, limit=50):
+        """
+        Magasins actifs à moins de `radius_km` du point :
+          - candidats par plages de geo_cell (index B-tree), une plage par ligne de grille
+          - distances exactes (haversine) calculées en une passe
+        :return: liste [(id, distance_km)] triée par distance
+        """
+        ranges = geo_cell_ranges(latitude, longitude, radius_km)
+        has_active = 'active' in self._fields
+        self.flush_model(['geo_cell', 'latitude', 'longitude'] + (['active'] if has_active else []))
+        where = ' OR '.join(['geo_cell BETWEEN %s AND %s'] * len(ranges))
+        self.env.cr.execute(
+            'SELECT id, latitude, longitude FROM %s WHERE %s(%s)'
+            % (self._table, 'active AND ' if has_active else '', where),
+            [bound for cell_range in ranges for bound in cell_range])
+        return nearest(latitude, longitude, radius_km, self.env.cr.fetchall(), limit)
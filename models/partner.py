@@ -1,12 +1,16 @@
 import random
 import string
-from odoo import fields, models, api, _
+from odoo import fields, models, api, tools, _
 from odoo.exceptions import ValidationError
 import logging
 from datetime import datetime, timedelta
 import base64
+from .contact_keys import normalize_phone, national_number, normalize_email
 _logger = logging.getLogger(__name__)
 
+# Paramètre posé par le job de rattrapage une fois phone_e164 / mobile_e164 remplis
+CONTACT_KEYS_BACKFILLED_PARAM = 'rest_api.partner_keys_backfilled'
+
 class Partner(models.Model):
     _inherit = 'res.partner'
 
@@ -19,9 +23,10 @@ class Partner(models.Model):
     sexe = fields.Selection([('masculin', 'Masculin'), ('feminin', 'Feminin')], string='Sexe' , required=False)
     nationalite = fields.Char(string='Nationalite', required=False)
 
-    # OTP
-    otp_code = fields.Char(string='Code OTP', copy=False)
-    otp_expiration = fields.Datetime(string='Expiration OTP', copy=False)
+    # Clés de recherche indexées (égalité exacte, cf. contact_keys)
+    phone_e164 = fields.Char(string='Téléphone (E.164)', compute='_compute_phone_e164', store=True, index=True)
+    mobile_e164 = fields.Char(string='Mobile (E.164)', compute='_compute_phone_e164', store=True, index=True)
+    email_normalized = fields.Char(index=True)
 
     # Flag pour savoir si on attend un mot de passe envoyé via WhatsApp
     waiting_password_whatsapp = fields.Boolean(
@@ -30,6 +35,58 @@ class Partner(models.Model):
         help="Indique si l'on attend que le client envoie son mot de passe via WhatsApp."
     )
 
+    def _auto_init(self):
+        # Colonnes créées vides : remplies par le job de rattrapage (rest.api.job)
+        # plutôt que recalculées pour toute la table pendant la mise à jour du module.
+        for column in ('phone_e164', 'mobile_e164'):
+            if not tools.column_exists(self.env.cr, self._table, column):
+                tools.create_column(self.env.cr, self._table, column, 'varchar')
+        return super()._auto_init()
+
+    @api.depends('phone', 'mobile')
+    def _compute_phone_e164(self):
+        for partner in self:
+            partner.phone_e164 = normalize_phone(partner.phone)
+            partner.mobile_e164 = normalize_phone(partner.mobile)
+
+    @api.model
+    def _contact_keys_ready(self):
+        return bool(self.env['ir.config_parameter'].sudo().get_param(CONTACT_KEYS_BACKFILLED_PARAM))
+
+    @api.model
+    def _enqueue_contact_keys_backfill(self):
+        """Lance le rattrapage des clés téléphone s'il n'est ni fait ni en cours (appelé à la mise à jour)."""
+        Job = self.env['rest.api.job'].sudo()
+        if self._contact_keys_ready() or Job.search_count([
+                ('job_type', '=', 'partner_contact_keys'), ('state', 'in', ('pending', 'running'))]):
+            return
+        Job._enqueue('partner_contact_keys', "Normalisation des téléphones des contacts")
+
+    @api.model
+    def _find_by_phone(self, raw):
+        """
+        Contact dont le téléphone ou le mobile correspond à `raw` (toutes écritures).
+        Égalité sur les colonnes E.164 indexées ; tant que le rattrapage n'est pas
+        terminé, recherche historique par ilike sur phone / mobile.
+        """
+        e164 = normalize_phone(raw)
+        if not e164:
+            return self.browse()
+        if self._contact_keys_ready():
+            domain = ['|', ('phone_e164', '=', e164), ('mobile_e164', '=', e164)]
+        else:
+            national = national_number(e164)
+            domain = ['|', ('phone', 'ilike', national), ('mobile', 'ilike', national)]
+        return self.search(domain, limit=1)
+
+    @api.model
+    def _find_by_email(self, raw):
+        """Contact dont l'email normalisé correspond à `raw` (insensible à la casse)."""
+        email = normalize_email(raw)
+        if email:
+            return self.search([('email_normalized', '=', email)], limit=1)
+        return self.search([('email', '=', raw)], limit=1) if raw else self.browse()
+
     def generate_password(self, length=12):
         """Génère un mot de passe aléatoire sécurisé"""
         characters = string.ascii_letters + string.digits + "!@#$%&*"
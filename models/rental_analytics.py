@@ -0,0 +1,192 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+
+# Contrats comptés comme occupant un local sur leur période [start_date, end_date].
+# Les contrats résiliés sont exclus : leur end_date ne reflète pas forcément la
+# date de résiliation.
+OCCUPYING_CONTRACT_STATES = ('active', 'expired')
+
+# Série mensuelle par immeuble, calculée en une seule requête SQL :
+#  - occupation : locaux actifs / locaux sous contrat (OCCUPYING_CONTRACT_STATES) sur le mois
+#  - échéancier : montant des échéances (rental.payment.schedule) du mois
+#  - facturé    : factures/avoirs clients postés (montant signé, devise société)
+#  - encaissé   : rapprochements (account.partial.reconcile) des factures, par date
+#  - arriérés   : solde d'ouverture + cumul (facturé - encaissé) via fonction fenêtre
+_PORTFOLIO_SERIES_QUERY = """
+    WITH months AS (
+        SELECT generate_series(%(month_from)s::date, %(month_to)s::date, interval '1 month')::date AS month_start
+    ),
+    buildings AS (
+        SELECT b.id, b.name
+          FROM rental_building b
+         WHERE b.active IS NOT FALSE
+           AND (%(building_id)s IS NULL OR b.id = %(building_id)s)
+    ),
+    grid AS (
+        SELECT b.id AS building_id, b.name AS building_name, m.month_start,
+               (m.month_start + interval '1 month' - interval '1 day')::date AS month_end
+          FROM buildings b
+         CROSS JOIN months m
+    ),
+    occupancy AS (
+        SELECT g.building_id, g.month_start,
+               COUNT(DISTINCT p.id) AS property_count,
+               COUNT(DISTINCT rc.property_id) AS rented_count
+          FROM grid g
+          LEFT JOIN rental_property p
+                 ON p.building_id = g.building_id AND p.active IS NOT FALSE
+          LEFT JOIN rental_contract rc
+                 ON rc.property_id = p.id
+                AND rc.state IN %(occupying_states)s
+                AND rc.start_date <= g.month_end
+                AND (rc.end_date IS NULL OR rc.end_date >= g.month_start)
+         GROUP BY g.building_id, g.month_start
+    ),
+    invoices AS (
+        SELECT am.id, am.invoice_date, am.amount_total_signed, p.building_id
+          FROM account_move am
+          JOIN rental_contract rc ON rc.id = am.rental_contract_id
+          JOIN rental_property p ON p.id = rc.property_id
+          JOIN buildings b ON b.id = p.building_id
+         WHERE am.move_type IN ('out_invoice', 'out_refund')
+           AND am.state = 'posted'
+           AND am.invoice_date <= %(date_to)s
+    ),
+    billed AS (
+        SELECT building_id, date_trunc('month', invoice_date)::date AS month_start,
+               SUM(amount_total_signed) AS amount
+          FROM invoices
+         GROUP BY 1, 2
+    ),
+    collected AS (
+        SELECT inv.building_id, date_trunc('month', apr.max_date)::date AS month_start,
+               SUM(apr.amount) AS amount
+          FROM invoices inv
+          JOIN account_move_line aml ON aml.move_id = inv.id
+          JOIN account_partial_reconcile apr ON apr.debit_move_id = aml.id
+          JOIN account_move_line counterpart ON counterpart.id = apr.credit_move_id
+          JOIN account_move cm ON cm.id = counterpart.move_id
+         WHERE cm.move_type != 'out_refund'
+           AND apr.max_date <= %(date_to)s
+         GROUP BY 1, 2
+    ),
+    scheduled AS (
+        SELECT p.building_id, date_trunc('month', s.due_date)::date AS month_start,
+               SUM(s.amount) AS amount
+          FROM rental_payment_schedule s
+          JOIN rental_contract rc ON rc.id = s.contract_id
+          JOIN rental_property p ON p.id = rc.property_id
+          JOIN buildings b ON b.id = p.building_id
+         WHERE s.due_date >= %(month_from)s
+           AND s.due_date <= %(date_to)s
+         GROUP BY 1, 2
+    ),
+    opening AS (
+        SELECT building_id, SUM(amount) AS balance
+          FROM (
+                SELECT building_id, amount FROM billed WHERE month_start < %(month_from)s
+                UNION ALL
+                SELECT building_id, -amount FROM collected WHERE month_start < %(month_from)s
+               ) history
+         GROUP BY building_id
+    )
+    SELECT g.building_id, g.building_name, g.month_start,
+           o.property_count, o.rented_count,
+           COALESCE(s.amount, 0.0) AS scheduled_rent,
+           COALESCE(bi.amount, 0.0) AS billed_rent,
+           COALESCE(c.amount, 0.0) AS collected_rent,
+           COALESCE(op.balance, 0.0) + SUM(COALESCE(bi.amount, 0.0) - COALESCE(c.amount, 0.0))
+               OVER (PARTITION BY g.building_id ORDER BY g.month_start) AS arrears
+      FROM grid g
+      JOIN occupancy o ON o.building_id = g.building_id AND o.month_start = g.month_start
+      LEFT JOIN scheduled s ON s.building_id = g.building_id AND s.month_start = g.month_start
+      LEFT JOIN billed bi ON bi.building_id = g.building_id AND bi.month_start = g.month_start
+      LEFT JOIN collected c ON c.building_id = g.building_id AND c.month_start = g.month_start
+      LEFT JOIN opening op ON op.building_id = g.building_id
+     ORDER BY g.building_name, g.building_id, g.month_start
+"""
+
+
+# Empreinte des données des mois clos : change quand une facture, un lettrage ou
+# une échéance antérieurs au mois courant est saisi / modifié (écritures
+# antidatées), ou quand un contrat / local change.
+_CLOSED_MONTHS_STAMP_QUERY = """
+    SELECT (SELECT max(write_date) FROM account_move
+             WHERE rental_contract_id IS NOT NULL AND invoice_date < %(month)s),
+           (SELECT max(create_date) FROM account_partial_reconcile WHERE max_date < %(month)s),
+           (SELECT max(write_date) FROM rental_payment_schedule WHERE due_date < %(month)s),
+           (SELECT count(*) FROM rental_payment_schedule WHERE due_date < %(month)s),
+           (SELECT max(write_date) FROM rental_contract),
+           (SELECT count(*) FROM rental_contract),
+           (SELECT max(write_date) FROM rental_property),
+           (SELECT count(*) FROM rental_property)
+"""
+
+
+class RentalAnalytics(models.AbstractModel):
+    _name = 'rental.analytics'
+    _description = 'Analytique du portefeuille locatif'
+
+    @api.model
+    def _month_bounds(self, date_from, date_to):
+        """Retourne (premier jour du mois de date_from, premier jour du mois de date_to)."""
+        date_from = fields.Date.to_date(date_from)
+        date_to = fields.Date.to_date(date_to)
+        return date_from.replace(day=1), date_to.replace(day=1)
+
+    @api.model
+    def get_portfolio_series(self, date_from, date_to, building_id=None):
+        """
+        Série mensuelle (occupation, échéancier, facturé, encaissé, arriérés)
+        par immeuble entre `date_from` et `date_to` (inclus).
+
+        :return: liste de dicts, un par (immeuble, mois), triée par immeuble puis mois
+        """
+        month_from, month_to = self._month_bounds(date_from, date_to)
+        self.env['account.move'].flush_model()
+        self.env['account.move.line'].flush_model()
+        self.env['account.partial.reconcile'].flush_model()
+        for model_name in ('rental.building', 'rental.property', 'rental.contract', 'rental.payment.schedule'):
+            self.env[model_name].flush_model()
+
+        self.env.cr.execute(_PORTFOLIO_SERIES_QUERY, {
+            'month_from': month_from,
+            'month_to': month_to,
+            'date_to': fields.Date.to_date(date_to),
+            'building_id': building_id or None,
+            'occupying_states': OCCUPYING_CONTRACT_STATES,
+        })
+        rows = []
+        for (b_id, b_name, month_start, property_count, rented_count,
+             scheduled, billed, collected, arrears) in self.env.cr.fetchall():
+            rows.append({
+                'building_id': b_id,
+                'building_name': b_name,
+                'month': month_start.strftime('%Y-%m'),
+                'property_count': property_count,
+                'rented_count': rented_count,
+                'occupancy_rate': round(100.0 * rented_count / property_count, 2) if property_count else 0.0,
+                'scheduled_rent': float(scheduled or 0.0),
+                'billed_rent': float(billed or 0.0),
+                'collected_rent': float(collected or 0.0),
+                'arrears': float(arrears or 0.0),
+            })
+        return rows
+
+    @api.model
+    def _closed_months_stamp(self):
+        """Clé de revalidation du cache des mois clos (cf. _CLOSED_MONTHS_STAMP_QUERY)."""
+        for model_name in ('account.move', 'account.partial.reconcile', 'rental.payment.schedule',
+                           'rental.contract', 'rental.property'):
+            self.env[model_name].flush_model()
+        month = self.current_month_start()
+        self.env.cr.execute(_CLOSED_MONTHS_STAMP_QUERY, {'month': month})
+        return tuple(self.env.cr.fetchone()) + (month,)
+
+    @api.model
+    def current_month_start(self):
+        return fields.Date.context_today(self).replace(day=1)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, tools, _
+from datetime import timedelta
+import json
+import logging
+import time
+
+_logger = logging.getLogger(__name__)
+
+AUTO_INVOICE_CHUNK_SIZE = 200
+
+# Échéances actives sans facture dans l'horizon (index partiel *_uninvoiced_due_idx)
+_DUE_SCHEDULES_QUERY = """
+    SELECT s.id
+      FROM rental_payment_schedule s
+      JOIN rental_contract c ON c.id = s.contract_id
+     WHERE s.invoice_id IS NULL
+       AND s.due_date <= %(horizon)s
+       AND c.state = 'active'
+       AND c.auto_generate_invoices IS NOT FALSE
+       AND s.id != ALL(%(excluded)s)
+     ORDER BY s.due_date, s.id
+     LIMIT %(limit)s
+"""
+
+
+class RentalInvoicingEngine(models.AbstractModel):
+    _name = 'rental.invoicing.engine'
+    _description = 'Moteur de facturation automatique des échéances'
+
+    def init(self):
+        if tools.table_exists(self.env.cr, 'rental_payment_schedule'):
+            tools.create_index(self.env.cr, 'rental_payment_schedule_uninvoiced_due_idx',
+                               'rental_payment_schedule', ['due_date', 'id'], where='invoice_id IS NULL')
+
+    # ------------------------------------------------------------------
+    # Paramètres
+    # ------------------------------------------------------------------
+    @api.model
+    def _get_settings(self):
+        icp = self.env['ir.config_parameter'].sudo()
+        try:
+            days_before = int(icp.get_param('rental.invoice_days_before') or 0)
+        except (TypeError, ValueError):
+            days_before = 0
+        try:
+            income_account_id = int(icp.get_param('rental.income_account_id') or 0) or False
+        except (TypeError, ValueError):
+            income_account_id = False
+        return {
+            'enabled': icp.get_param('rental.auto_generate_invoices') in ('True', 'true', '1'),
+            'days_before': max(days_before, 0),
+            'income_account_id': income_account_id,
+        }
+
+    # ------------------------------------------------------------------
+    # Construction des factures
+    # ------------------------------------------------------------------
+    @api.model
+    def _prepare_invoice_vals(self, schedule, settings):
+        contract = schedule.contract_id
+        prop = contract.property_id
+        line_vals = {
+            'name': _("Loyer %(property)s - échéance du %(due)s") % {
+                'property': prop.name or contract.name,
+                'due': schedule.due_date.strftime('%d/%m/%Y'),
+            },
+            'quantity': 1.0,
+            'price_unit': schedule.amount,
+        }
+        if settings['income_account_id']:
+            line_vals['account_id'] = settings['income_account_id']
+        vals = {
+            'move_type': 'out_invoice',
+            'partner_id': contract.tenant_id.id,
+            'invoice_date': fields.Date.context_today(self),
+            'invoice_date_due': schedule.due_date,
+            'invoice_origin': contract.name,
+            'rental_contract_id': contract.id,
+            'rental_property_id': prop.id or False,
+            'rental_auto_generated': True,
+            'invoice_line_ids': [(0, 0, line_vals)],
+        }
+        if 'currency_id' in contract._fields and contract.currency_id:
+            vals['currency_id'] = contract.currency_id.id
+        return vals
+
+    @api.model
+    def _invoice_chunk(self, schedules, settings):
+        """Crée (un seul create), rattache et poste les factures d'un lot d'échéances."""
+        Move = self.env['account.move'].sudo()
+        moves = Move.create([self._prepare_invoice_vals(s, settings) for s in schedules])
+        for schedule, move in zip(schedules, moves):
+            schedule.invoice_id = move.id
+        moves.action_post()
+        return moves
+
+    # ------------------------------------------------------------------
+    # CRON
+    # ------------------------------------------------------------------
+    @api.model
+    def _cron_generate_rental_invoices(self, chunk_size=AUTO_INVOICE_CHUNK_SIZE, auto_commit=True):
+        """
+        Facture les échéances dues dans l'horizon `rental.invoice_days_before`.
+
+        - sélection par requête indexée (échéances sans facture), par lots
+        - un create(vals_list) par lot, postage du lot, commit par lot
+        - reprenable : un lot (création + postage) est atomique ; un run
+          interrompu reprend simplement les échéances encore sans facture.
+          Les brouillons existants ne sont jamais repostés (une facture remise
+          en brouillon par la comptabilité le reste).
+        """
+        settings = self._get_settings()
+        if not settings['enabled']:
+            _logger.info("[AUTO INVOICE] rental.auto_generate_invoices désactivé, aucun traitement.")
+            return {'created': 0, 'posted': 0, 'failed': 0, 'elapsed': 0.0, 'per_second': 0.0}
+
+        started = time.monotonic()
+        horizon = fields.Date.context_today(self) + timedelta(days=settings['days_before'])
+        Schedule = self.env['rental.payment.schedule'].sudo()
+        Schedule.flush_model()
+
+        created = failed = 0
+        excluded = []
+        while True:
+            self.env.cr.execute(_DUE_SCHEDULES_QUERY, {
+                'horizon': horizon,
+                'excluded': excluded,
+                'limit': chunk_size,
+            })
+            schedule_ids = [row[0] for row in self.env.cr.fetchall()]
+            if not schedule_ids:
+                break
+            schedules = Schedule.browse(schedule_ids)
+            try:
+                with self.env.cr.savepoint():
+                    moves = self._invoice_chunk(schedules, settings)
+                created += len(moves)
+            except Exception as e:
+                self.env.invalidate_all()
+                _logger.error("[AUTO INVOICE] Lot en échec (%s échéances): %s", len(schedule_ids), e)
+                excluded.extend(schedule_ids)
+                failed += len(schedule_ids)
+            if auto_commit:
+                self.env.cr.commit()
+
+        elapsed = time.monotonic() - started
+        stats = {
+            'horizon': str(horizon),
+            'created': created,
+            'posted': created,
+            'failed': failed,
+            'elapsed': round(elapsed, 3),
+            'per_second': round(created / elapsed, 2) if elapsed else 0.0,
+            'finished_at': fields.Datetime.to_string(fields.Datetime.now()),
+        }
+        self.env['ir.config_parameter'].sudo().set_param('rental.auto_invoice_last_run', json.dumps(stats))
+        _logger.info("[AUTO INVOICE] %s facture(s) créée(s), %s en échec, %.2f factures/s",
+                     created, failed, stats['per_second'])
+        return stats
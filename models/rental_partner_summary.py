@@ -0,0 +1,99 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+SUMMARY_LAST_INVOICES = 5
+SUMMARY_NEXT_SCHEDULES = 5
+
+# Empreinte des données du résumé : change à chaque écriture / suppression
+# d'un contrat, d'une facture ou d'une échéance du locataire.
+_SUMMARY_STAMP_QUERY = """
+    SELECT (SELECT max(write_date) FROM rental_contract WHERE tenant_id = %(partner_id)s),
+           (SELECT count(*) FROM rental_contract WHERE tenant_id = %(partner_id)s),
+           (SELECT max(am.write_date)
+              FROM account_move am
+              JOIN rental_contract c ON c.id = am.rental_contract_id
+             WHERE c.tenant_id = %(partner_id)s),
+           (SELECT max(s.write_date)
+              FROM rental_payment_schedule s
+              JOIN rental_contract c ON c.id = s.contract_id
+             WHERE c.tenant_id = %(partner_id)s),
+           (SELECT max(deleted_at) FROM rental_sync_tombstone WHERE partner_id = %(partner_id)s)
+"""
+
+
+class RentalPartnerSummary(models.AbstractModel):
+    _name = 'rental.partner.summary'
+    _description = 'Résumé locatif d\'un locataire (login, application mobile)'
+
+    @api.model
+    def _summary_stamp(self, partner_id):
+        """Clé de revalidation du cache : empreinte des données + date du jour (échéances à venir)."""
+        for model_name in ('rental.contract', 'account.move', 'rental.payment.schedule'):
+            self.env[model_name].flush_model()
+        self.env.cr.execute(_SUMMARY_STAMP_QUERY, {'partner_id': partner_id})
+        return tuple(self.env.cr.fetchone()) + (fields.Date.today(),)
+
+    @api.model
+    def get_summary(self, partner):
+        """
+        Compteurs, impayés, locaux en cours, dernières factures et prochaines
+        échéances du locataire ; agrégats et tris délégués à PostgreSQL.
+        """
+        contracts = self.env['rental.contract'].sudo().search([('tenant_id', '=', partner.id)])
+        active_contracts = contracts.filtered(lambda c: c.state == 'active')
+
+        AccountMove = self.env['account.move'].sudo()
+        invoice_domain = [
+            ('rental_contract_id', 'in', contracts.ids),
+            ('move_type', '=', 'out_invoice'),
+            ('state', '=', 'posted'),
+        ]
+        unpaid = AccountMove.read_group(
+            invoice_domain + [('payment_state', 'in', ('not_paid', 'partial'))],
+            ['amount_residual:sum'], [])
+        unpaid_count = unpaid[0]['__count'] if unpaid else 0
+        unpaid_total = (unpaid[0]['amount_residual'] or 0.0) if unpaid else 0.0
+        last_invoices = AccountMove.search(invoice_domain, order='invoice_date desc, date desc, id desc',
+                                           limit=SUMMARY_LAST_INVOICES)
+
+        next_schedules = self.env['rental.payment.schedule'].sudo().search([
+            ('contract_id', 'in', active_contracts.ids),
+            ('invoice_id', '=', False),
+            ('due_date', '>=', fields.Date.today()),
+        ], order='due_date, id', limit=SUMMARY_NEXT_SCHEDULES)
+
+        return {
+            "active_contract_count": len(active_contracts),
+            "total_contract_count": len(contracts),
+            "unpaid_invoice_count": unpaid_count,
+            "total_unpaid_rent": float(unpaid_total),
+            "current_properties": [{
+                "id": p.id,
+                "name": p.name,
+                "status": p.status,
+                "building_id": p.building_id.id if p.building_id else None,
+                "building_name": p.building_id.name if p.building_id else None,
+                "monthly_rent": float(p.monthly_rent or 0.0),
+            } for p in active_contracts.mapped('property_id')],
+            "last_invoices": [{
+                "id": inv.id,
+                "code": inv.name,
+                "status": inv.payment_state,  # paid / partial / not_paid / in_payment
+                "amount_total": float(inv.amount_total or 0.0),
+                "amount_residual": float(inv.amount_residual or 0.0),
+                "partner_id": inv.partner_id.id if inv.partner_id else None,
+                "due_date": str(inv.invoice_date_due) if inv.invoice_date_due else None,
+                "currency": inv.currency_id.name if inv.currency_id else None,
+            } for inv in last_invoices],
+            "next_due_schedules": [{
+                "id": s.id,
+                "contract_id": s.contract_id.id if s.contract_id else None,
+                "due_date": str(s.due_date) if s.due_date else None,
+                "amount": float(s.amount or 0.0),
+                "state": s.state,
+                "invoice_id": s.invoice_id.id if s.invoice_id else None,
+            } for s in next_schedules],
+        }
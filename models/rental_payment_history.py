@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Historique des règlements d'un partner : un rapprochement partiel par ligne.
+#  - côté facture : ligne débitrice (facture) ou créditrice (avoir) du rapprochement
+#  - contrepartie : paiement, avoir ou autre pièce ; écarts de change exclus
+#  - tri / curseur : (date de la contrepartie, id du rapprochement, id de la facture)
+#    décroissants ; un rapprochement facture / avoir donne deux lignes, d'où la facture
+_PARTNER_PAYMENTS_QUERY = """
+    WITH invoices AS (
+        SELECT am.id, am.name, COALESCE(am.currency_id, rc.currency_id) AS currency_id
+          FROM account_move am
+          JOIN res_company rc ON rc.id = am.company_id
+         WHERE am.partner_id = %(partner_id)s
+           AND am.state = 'posted'
+           AND am.move_type IN ('out_invoice', 'out_refund')
+    ),
+    parts AS (
+        SELECT apr.id AS partial_id, i.id AS invoice_id, apr.credit_move_id AS counter_line_id,
+               apr.debit_amount_currency AS amount, apr.full_reconcile_id
+          FROM invoices i
+          JOIN account_move_line aml ON aml.move_id = i.id
+          JOIN account_partial_reconcile apr ON apr.debit_move_id = aml.id
+        UNION ALL
+        SELECT apr.id, i.id, apr.debit_move_id, apr.credit_amount_currency, apr.full_reconcile_id
+          FROM invoices i
+          JOIN account_move_line aml ON aml.move_id = i.id
+          JOIN account_partial_reconcile apr ON apr.credit_move_id = aml.id
+    )
+    SELECT p.partial_id, i.id, i.name, cur.name, p.amount, counter.date,
+           counter.journal_id, counter.move_id
+      FROM parts p
+      JOIN invoices i ON i.id = p.invoice_id
+      JOIN res_currency cur ON cur.id = i.currency_id
+      JOIN account_move_line counter ON counter.id = p.counter_line_id
+      LEFT JOIN account_full_reconcile afr ON afr.id = p.full_reconcile_id
+     WHERE afr.exchange_move_id IS DISTINCT FROM counter.move_id
+       AND (%(date_from)s IS NULL OR counter.date >= %(date_from)s)
+       AND (%(date_to)s IS NULL OR counter.date <= %(date_to)s)
+       AND (%(cursor_date)s IS NULL
+            OR (counter.date, p.partial_id, i.id) < (%(cursor_date)s, %(cursor_id)s, %(cursor_invoice_id)s))
+     ORDER BY counter.date DESC, p.partial_id DESC, i.id DESC
+     LIMIT %(limit)s
+"""
+
+# Graphe facture -> paiements (lignes clients / fournisseurs des factures)
+_INVOICE_PAYMENTS_QUERY = """
+    SELECT il.move_id, pay.id
+      FROM account_move_line il
+      JOIN account_account aa ON aa.id = il.account_id
+      JOIN account_partial_reconcile apr ON apr.debit_move_id = il.id
+      JOIN account_move_line pl ON pl.id = apr.credit_move_id
+      JOIN account_payment pay ON pay.move_id = pl.move_id
+     WHERE il.move_id IN %(invoice_ids)s
+       AND aa.account_type IN ('asset_receivable', 'liability_payable')
+    UNION
+    SELECT il.move_id, pay.id
+      FROM account_move_line il
+      JOIN account_account aa ON aa.id = il.account_id
+      JOIN account_partial_reconcile apr ON apr.credit_move_id = il.id
+      JOIN account_move_line pl ON pl.id = apr.debit_move_id
+      JOIN account_payment pay ON pay.move_id = pl.move_id
+     WHERE il.move_id IN %(invoice_ids)s
+       AND aa.account_type IN ('asset_receivable', 'liability_payable')
+"""
+
+# Graphe paiement -> factures clients lettrées (toutes, pas seulement celles demandées)
+_PAYMENT_INVOICES_QUERY = """
+    SELECT pay.id, inv.id, inv.name
+      FROM account_payment pay
+      JOIN account_move_line pl ON pl.move_id = pay.move_id
+      JOIN account_partial_reconcile apr ON apr.credit_move_id = pl.id
+      JOIN account_move_line il ON il.id = apr.debit_move_id
+      JOIN account_move inv ON inv.id = il.move_id
+     WHERE pay.id IN %(payment_ids)s
+       AND inv.move_type IN ('out_invoice', 'out_refund')
+    UNION
+    SELECT pay.id, inv.id, inv.name
+      FROM account_payment pay
+      JOIN account_move_line pl ON pl.move_id = pay.move_id
+      JOIN account_partial_reconcile apr ON apr.debit_move_id = pl.id
+      JOIN account_move_line il ON il.id = apr.credit_move_id
+      JOIN account_move inv ON inv.id = il.move_id
+     WHERE pay.id IN %(payment_ids)s
+       AND inv.move_type IN ('out_invoice', 'out_refund')
+     ORDER BY 1, 2
+"""
+
+
+class RentalPaymentHistory(models.AbstractModel):
+    _name = 'rental.payment.history'
+    _description = 'Historique des règlements (requêtes SQL consolidées)'
+
+    @api.model
+    def _flush_accounting(self):
+        for model_name in ('account.move', 'account.move.line', 'account.partial.reconcile',
+                           'account.full.reconcile', 'account.payment'):
+            self.env[model_name].flush_model()
+
+    @api.model
+    def get_partner_payments(self, partner_id, date_from=None, date_to=None, cursor=None, limit=None):
+        """
+        Règlements des factures postées du partner, du plus récent au plus ancien.
+
+        :param cursor: (date, partial_id, invoice_id) de la dernière ligne de la page précédente
+        :param limit: taille de page (None = tout)
+        :return: (rows, next_cursor) ; next_cursor = None s'il n'y a plus de ligne
+        """
+        self._flush_accounting()
+        cursor_date, cursor_id, cursor_invoice_id = cursor or (None, None, None)
+        self.env.cr.execute(_PARTNER_PAYMENTS_QUERY, {
+            'partner_id': partner_id,
+            'date_from': fields.Date.to_date(date_from) if date_from else None,
+            'date_to': fields.Date.to_date(date_to) if date_to else None,
+            'cursor_date': cursor_date,
+            'cursor_id': cursor_id,
+            'cursor_invoice_id': cursor_invoice_id,
+            'limit': limit + 1 if limit else None,
+        })
+        records = self.env.cr.fetchall()
+        next_cursor = None
+        if limit and len(records) > limit:
+            records = records[:limit]
+            next_cursor = (records[-1][5], records[-1][0], records[-1][1])
+
+        journals = {j.id: j.name for j in self.env['account.journal'].sudo().browse({r[6] for r in records if r[6]})}
+        rows = [{
+            "id": counter_move_id,
+            "invoice_id": invoice_id,
+            "invoice_code": invoice_code,
+            "amount": float(amount or 0.0),
+            "currency": currency,
+            "method": journals.get(journal_id) or "PAYMENT",
+            "status": "SUCCEEDED",
+            "paid_at": paid_at,
+        } for (_partial_id, invoice_id, invoice_code, currency, amount, paid_at,
+               journal_id, counter_move_id) in records]
+        return rows, next_cursor
+
+    @api.model
+    def _load_payment_graph(self, invoices):
+        """
+        Charge en deux requêtes le graphe factures <-> paiements de `invoices`.
+
+        :return: dict {
+            'payments': recordset account.payment (préchargé en lot),
+            'payment_ids_by_invoice': {invoice_id: [payment_id, ...]},
+            'invoices_by_payment': {payment_id: [(invoice_id, invoice_name), ...]},
+        }
+        """
+        graph = {'payments': self.env['account.payment'].sudo(), 'payment_ids_by_invoice': {}, 'invoices_by_payment': {}}
+        if not invoices:
+            return graph
+        self._flush_accounting()
+        self.env.cr.execute(_INVOICE_PAYMENTS_QUERY, {'invoice_ids': tuple(invoices.ids)})
+        for invoice_id, payment_id in self.env.cr.fetchall():
+            graph['payment_ids_by_invoice'].setdefault(invoice_id, []).append(payment_id)
+        payment_ids = sorted({pid for pids in graph['payment_ids_by_invoice'].values() for pid in pids})
+        if not payment_ids:
+            return graph
+        for pids in graph['payment_ids_by_invoice'].values():
+            pids.sort()
+        self.env.cr.execute(_PAYMENT_INVOICES_QUERY, {'payment_ids': tuple(payment_ids)})
+        for payment_id, invoice_id, invoice_name in self.env.cr.fetchall():
+            graph['invoices_by_payment'].setdefault(payment_id, []).append((invoice_id, invoice_name))
+        graph['payments'] = graph['payments'].browse(payment_ids)
+        return graph
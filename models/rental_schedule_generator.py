@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api
+from odoo.tools import float_compare
+from datetime import date
+from functools import lru_cache
+import calendar
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# payment_frequency -> nombre de mois par échéance (valeurs inconnues : contrat ignoré et signalé)
+FREQUENCY_MONTHS = {
+    'monthly': 1,
+    'mensuel': 1,
+    'bimonthly': 2,
+    'quarterly': 3,
+    'trimestriel': 3,
+    'semi_annual': 6,
+    'semiannual': 6,
+    'biannual': 6,
+    'semestriel': 6,
+    'annual': 12,
+    'yearly': 12,
+    'annuel': 12,
+}
+DEFAULT_DURATION_MONTHS = 12
+
+# Champs du contrat recopiés sur les lignes créées, s'ils existent des deux côtés
+_MIRRORED_FIELDS = ('currency_id', 'company_id', 'tenant_id', 'property_id')
+
+# Lignes jamais modifiées ni supprimées par la régénération
+LOCKED_SCHEDULE_STATES = ('paid',)
+
+
+@lru_cache(maxsize=4096)
+def _days_in_month(year, month):
+    return calendar.monthrange(year, month)[1]
+
+
+def _due_date(base, day):
+    year, month0 = divmod(base, 12)
+    return date(year, month0 + 1, min(day, _days_in_month(year, month0 + 1)))
+
+
+def _due_dates(start_date, end_date, payment_day, step, periods):
+    """
+    Échéances d'un contrat par arithmétique entière sur les mois (sans relativedelta).
+    La première échéance n'est jamais antérieure à start_date : si le jour de
+    paiement est déjà passé dans le mois de début, la série commence le mois suivant.
+    """
+    base = start_date.year * 12 + start_date.month - 1
+    day = payment_day or start_date.day
+    if _due_date(base, day) < start_date:
+        base += 1
+    dates = []
+    for k in range(periods):
+        due = _due_date(base + k * step, day)
+        if end_date and due > end_date:
+            break
+        dates.append(due)
+    return dates
+
+
+class RentalScheduleGenerator(models.AbstractModel):
+    _name = 'rental.schedule.generator'
+    _description = "Génération d'échéanciers en masse"
+
+    @api.model
+    def _expected_lines(self, contract_rows):
+        """
+        Calcule en une passe toutes les échéances attendues.
+
+        :param contract_rows: résultat de read() sur rental.contract
+        :return: (dict {(contract_id, due_date): amount}, dict {contract_id: erreur})
+        """
+        expected, errors = {}, {}
+        for row in contract_rows:
+            start_date = row.get('start_date')
+            if not start_date:
+                errors[row['id']] = 'missing_start_date'
+                continue
+            frequency = row.get('payment_frequency')
+            step = FREQUENCY_MONTHS.get(frequency)
+            if not step:
+                errors[row['id']] = 'unknown_payment_frequency: %s' % (frequency or '')
+                continue
+            end_date = row.get('end_date')
+            duration = row.get('duration_months') or 0
+            if end_date:
+                months = (end_date.year - start_date.year) * 12 + end_date.month - start_date.month + 1
+            else:
+                months = duration or DEFAULT_DURATION_MONTHS
+            periods = max(-(-months // step), 0)
+            amount = (row.get('monthly_rent') or 0.0) * step
+            for due in _due_dates(start_date, end_date, row.get('payment_day'), step, periods):
+                expected[(row['id'], due)] = amount
+        return expected, errors
+
+    @api.model
+    def generate(self, contracts, dry_run=False):
+        """
+        Régénère les échéanciers de `contracts` en lot :
+          - une lecture des contrats et une lecture des échéances existantes
+          - calcul de l'écart ; création des nouvelles lignes en un seul
+            create(vals_list), mise à jour des montants groupée par montant,
+            un seul unlink des lignes obsolètes
+        Les lignes inchangées, facturées ou payées sont conservées (pas de
+        recréation, donc pas de webhook schedule.created parasite).
+        Un contrat sans date de début ou à fréquence inconnue est ignoré et
+        signalé ; ses lignes ne sont pas touchées.
+        En dry_run, seul l'écart est calculé : aucune écriture.
+
+        :return: dict {contract_id: {'created', 'updated', 'deleted', 'unchanged'}
+                       ou {'error': message}}
+        """
+        Schedule = self.env['rental.payment.schedule'].sudo()
+        contracts = contracts.sudo().exists()
+        if not contracts:
+            return {}
+
+        fnames = ['start_date', 'end_date', 'duration_months', 'payment_day', 'payment_frequency', 'monthly_rent']
+        mirrored = [f for f in _MIRRORED_FIELDS if f in contracts._fields and f in Schedule._fields]
+        rows = contracts.read(fnames + mirrored, load=False)
+        expected, errors = self._expected_lines(rows)
+        stats = {cid: {'error': error} for cid, error in errors.items()}
+        for row in rows:
+            if row['id'] not in errors:
+                stats[row['id']] = {'created': 0, 'updated': 0, 'deleted': 0, 'unchanged': 0}
+        valid_ids = [row['id'] for row in rows if row['id'] not in errors]
+        currency = contracts[:1].currency_id if 'currency_id' in contracts._fields else False
+        digits = currency.decimal_places if currency else 2
+
+        to_create, to_delete, to_update = [], [], {}
+        for line in Schedule.search_read([('contract_id', 'in', valid_ids)],
+                                         ['contract_id', 'due_date', 'amount', 'invoice_id', 'state'], load=False):
+            key = (line['contract_id'], line['due_date'])
+            contract_stats = stats[line['contract_id']]
+            locked = line['invoice_id'] or line['state'] in LOCKED_SCHEDULE_STATES
+            amount = expected.pop(key, None)
+            if locked or (amount is not None
+                          and float_compare(line['amount'] or 0.0, amount, precision_digits=digits) == 0):
+                contract_stats['unchanged'] += 1
+            elif amount is None:
+                to_delete.append(line['id'])
+                contract_stats['deleted'] += 1
+            else:
+                to_update.setdefault(amount, []).append(line['id'])
+                contract_stats['updated'] += 1
+
+        extra = {row['id']: {f: row[f] for f in mirrored if row[f]} for row in rows}
+        for (contract_id, due_date), amount in sorted(expected.items()):
+            to_create.append(dict(extra[contract_id], contract_id=contract_id, due_date=due_date, amount=amount))
+            stats[contract_id]['created'] += 1
+
+        if errors:
+            _logger.warning("Échéanciers non régénérés pour %s contrat(s): %s", len(errors), errors)
+        if not dry_run:
+            if to_delete:
+                Schedule.browse(to_delete).unlink()
+            for amount, line_ids in to_update.items():
+                Schedule.browse(line_ids).write({'amount': amount})
+            if to_create:
+                Schedule.create(to_create)
+            _logger.info("Échéanciers régénérés pour %s contrat(s): %s créée(s), %s modifiée(s), %s supprimée(s)",
+                         len(valid_ids), len(to_create), sum(len(v) for v in to_update.values()), len(to_delete))
+        return stats
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+from odoo import models, api, tools
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Colonnes interrogées par le paramètre q (index GIN pg_trgm)
+TRGM_SEARCH_FIELDS = {
+    'rental.building': ('name', 'code'),
+    'rental.property': ('name', 'description'),
+}
+# Facettes renvoyées avec la recherche des locaux
+PROPERTY_FACETS = ('status', 'property_type', 'building_id')
+
+# dbname -> bool (extension pg_trgm disponible)
+_trgm_available = {}
+
+
+class RentalSearch(models.AbstractModel):
+    _name = 'rental.search'
+    _description = 'Recherche plein texte (trigrammes) immeubles / locaux'
+
+    def init(self):
+        cr = self.env.cr
+        try:
+            with cr.savepoint(flush=False):
+                cr.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
+        except Exception as e:
+            _logger.warning("Extension pg_trgm indisponible (%s) : recherche q en ILIKE simple", e)
+            return
+        for model_name, field_names in TRGM_SEARCH_FIELDS.items():
+            table = model_name.replace('.', '_')
+            if not tools.table_exists(cr, table):
+                continue
+            for field_name in field_names:
+                if tools.column_exists(cr, table, field_name) and \
+                        tools.column_type(cr, table, field_name) in ('varchar', 'text'):
+                    cr.execute('CREATE INDEX IF NOT EXISTS "%s_%s_trgm_idx" ON "%s" USING gin ("%s" gin_trgm_ops)'
+                               % (table, field_name, table, field_name))
+        _trgm_available.pop(cr.dbname, None)
+
+    @api.model
+    def _has_trgm(self):
+        dbname = self.env.cr.dbname
+        if dbname not in _trgm_available:
+            self.env.cr.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+            _trgm_available[dbname] = bool(self.env.cr.fetchone())
+        return _trgm_available[dbname]
+
+    @api.model
+    def search_ranked(self, model_name, q, domain=None, limit=None):
+        """
+        Recherche `q` sur les colonnes TRGM_SEARCH_FIELDS[model_name] :
+          - correspondance ILIKE (servie par l'index GIN) ou similarité trigramme (fautes de frappe)
+          - tri par similarité décroissante puis nom
+        Sans pg_trgm : domaine ILIKE classique trié par nom.
+
+        :return: recordset trié
+        """
+        Model = self.env[model_name].sudo()
+        field_names = [f for f in TRGM_SEARCH_FIELDS[model_name] if f in Model._fields]
+        domain = list(domain or [])
+        if not self._has_trgm():
+            q_domain = ['|'] * (len(field_names) - 1) + [(f, 'ilike', q) for f in field_names]
+            return Model.search(q_domain + domain, order='name asc', limit=limit)
+
+        Model.flush_model()
+        query = Model._where_calc(domain)
+        table = Model._table
+        # colonnes nues (pas de COALESCE) pour que les index GIN restent utilisables
+        columns = ['"%s"."%s"' % (table, f) for f in field_names]
+        pattern = '%%%s%%' % q
+        query.add_where('(%s)' % ' OR '.join('%s ILIKE %%s OR %s %%%% %%s' % (c, c) for c in columns),
+                        [p for _c in columns for p in (pattern, q)])
+        # ORDER BY sans paramètres : q est échappé via mogrify (GREATEST ignore les NULL)
+        literal = self.env.cr.mogrify('%s', (q,)).decode().replace('%', '%%')
+        query.order = 'GREATEST(%s) DESC, "%s"."name", "%s"."id"' % (
+            ', '.join('similarity(%s, %s)' % (c, literal) for c in columns), table, table)
+        query.limit = limit
+        query_str, params = query.select('"%s"."id"' % table)
+        self.env.cr.execute(query_str, params)
+        return Model.browse([row[0] for row in self.env.cr.fetchall()])
+
+    @api.model
+    def facets(self, model_name, records, groupbys=PROPERTY_FACETS):
+        """Compte par valeur de chaque facette sur `records` (un read_group par facette)."""
+        Model = self.env[model_name].sudo()
+        result = {}
+        if not records:
+            return {g: [] for g in groupbys}
+        domain = [('id', 'in', records.ids)]
+        for groupby in groupbys:
+            if groupby not in Model._fields:
+                continue
+            buckets = []
+            for group in Model.read_group(domain, [groupby], [groupby], orderby=groupby):
+                value = group[groupby]
+                bucket = {'count': group['%s_count' % groupby]}
+                if isinstance(value, tuple):
+                    bucket['value'], bucket['label'] = value[0], value[1]
+                else:
+                    bucket['value'] = value if value is not False else None
+                buckets.append(bucket)
+            result[groupby] = buckets
+        return result
@@ -0,0 +1,243 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, tools
+import base64
+import csv
+import io
+import logging
+import tempfile
+import time
+
+_logger = logging.getLogger(__name__)
+
+SETTLEMENT_BATCH_SIZE = 500
+SETTLEMENT_REPORT_PREVIEW = 100
+
+# Colonnes acceptées (en-têtes normalisés : minuscules, espaces -> '_')
+SETTLEMENT_COLUMNS = {
+    'transaction_id': ('transaction_id', 'client_reference', 'merchant_reference', 'order_id', 'txn_id'),
+    'reference': ('reference', 'ref', 'payment_reference', 'id', 'wave_id', 'pay_token'),
+    'amount': ('amount', 'montant', 'net_amount', 'gross_amount'),
+    'date': ('date', 'timestamp', 'when', 'transaction_date', 'paid_at'),
+    'status': ('status', 'statut', 'payment_status'),
+}
+SETTLEMENT_SUCCESS_STATUSES = ('', 'succeeded', 'success', 'successful', 'completed', 'paid', 'sucess', 'ok')
+
+# Table des transactions passerelle par fournisseur
+SETTLEMENT_PROVIDERS = {
+    'wave': ('wave_transaction', ('transaction_id', 'reference', 'wave_id')),
+    'orange': ('orange_money_transaction', ('transaction_id', 'reference', 'pay_token')),
+}
+
+# Factures clients ouvertes (index par transaction_id)
+_OPEN_INVOICES_QUERY = """
+    SELECT transaction_id, id
+      FROM account_move
+     WHERE transaction_id IS NOT NULL
+       AND move_type = 'out_invoice'
+       AND state = 'posted'
+       AND payment_state IN ('not_paid', 'partial')
+"""
+
+
+class RentalSettlementImport(models.AbstractModel):
+    _name = 'rental.settlement.import'
+    _description = 'Import des relevés de règlement Wave / Orange Money'
+
+    # ------------------------------------------------------------------
+    # Index mémoire
+    # ------------------------------------------------------------------
+    @api.model
+    def _build_index(self, provider):
+        """
+        Construit en SQL un dict {clé -> account_move_id} :
+          - transaction_id des factures ouvertes
+          - transaction_id / référence des transactions passerelle rattachées
+        Seules les clés (chaînes) et les ids sont chargés, pas les enregistrements.
+        """
+        cr = self.env.cr
+        self.env['account.move'].flush_model()
+        index = {}
+        cr.execute(_OPEN_INVOICES_QUERY)
+        open_moves = set()
+        for tx, move_id in cr.fetchall():
+            index[tx.strip()] = move_id
+            open_moves.add(move_id)
+
+        table, columns = SETTLEMENT_PROVIDERS[provider]
+        if tools.table_exists(cr, table) and tools.column_exists(cr, table, 'account_move_id'):
+            model_name = table.replace('_', '.')
+            if model_name in self.env:
+                self.env[model_name].flush_model()
+            existing = [c for c in columns if tools.column_exists(cr, table, c)]
+            for column in existing:
+                cr.execute('SELECT "%s", account_move_id FROM "%s" WHERE "%s" IS NOT NULL AND account_move_id IS NOT NULL'
+                           % (column, table, column))
+                for key, move_id in cr.fetchall():
+                    # seules les factures encore ouvertes sont candidates
+                    if move_id in open_moves:
+                        index.setdefault(str(key).strip(), move_id)
+        return index
+
+    # ------------------------------------------------------------------
+    # Lecture du relevé
+    # ------------------------------------------------------------------
+    @api.model
+    def _resolve_columns(self, fieldnames):
+        normalized = {(name or '').strip().lower().replace(' ', '_'): name for name in fieldnames or []}
+        mapping = {}
+        for key, aliases in SETTLEMENT_COLUMNS.items():
+            for alias in aliases:
+                if alias in normalized:
+                    mapping[key] = normalized[alias]
+                    break
+        return mapping
+
+    @api.model
+    def _parse_amount(self, value):
+        value = (value or '').strip().replace(' ', '').replace('\u00a0', '')
+        if ',' in value and '.' not in value:
+            value = value.replace(',', '.')
+        else:
+            value = value.replace(',', '')
+        if not value:
+            raise ValueError("Montant vide")
+        return float(value)
+
+    # ------------------------------------------------------------------
+    # Import
+    # ------------------------------------------------------------------
+    @api.model
+    def import_statement(self, stream, provider, journal_id=None, batch_size=SETTLEMENT_BATCH_SIZE,
+                         auto_commit=True, dry_run=False):
+        """
+        Importe un relevé CSV ligne à ligne (mémoire constante) :
+          - correspondance transaction_id / référence via l'index mémoire
+          - encaissement + lettrage par lots (account.move._register_rental_payments)
+          - commit après chaque lot
+        Les lignes non rapprochées sont écrites dans un rapport CSV (pièce jointe).
+
+        :param stream: flux texte du fichier CSV
+        :return: dict de statistiques + aperçu des lignes non rapprochées
+        """
+        if provider not in SETTLEMENT_PROVIDERS:
+            raise ValueError("Fournisseur inconnu: %s" % provider)
+
+        started = time.monotonic()
+        index = self._build_index(provider)
+        Move = self.env['account.move'].sudo()
+
+        sample = stream.read(4096)
+        try:
+            dialect = csv.Sniffer().sniff(sample, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        reader = csv.DictReader(_chain(sample, stream), dialect=dialect)
+        columns = self._resolve_columns(reader.fieldnames)
+        if 'amount' not in columns or not ({'transaction_id', 'reference'} & set(columns)):
+            raise ValueError("Colonnes requises absentes (montant et transaction_id/référence)")
+
+        stats = {'provider': provider, 'rows': 0, 'matched': 0, 'paid': 0, 'failed': 0,
+                 'unmatched': 0, 'skipped': 0, 'dry_run': bool(dry_run)}
+        preview = []
+        report = tempfile.TemporaryFile(mode='w+', newline='', encoding='utf-8')
+        writer = csv.writer(report)
+        writer.writerow(['line', 'transaction_id', 'reference', 'amount', 'reason'])
+        seen_moves = set()
+        batch = []
+
+        def _unmatched(line_no, tx, ref, amount, reason, counter='unmatched'):
+            stats[counter] += 1
+            writer.writerow([line_no, tx, ref, amount, reason])
+            if len(preview) < SETTLEMENT_REPORT_PREVIEW:
+                preview.append({'line': line_no, 'transaction_id': tx, 'reference': ref,
+                                'amount': amount, 'reason': reason})
+
+        def _flush():
+            if not batch:
+                return
+            if not dry_run:
+                results = Move._register_rental_payments([entry for _line, _tx, _ref, entry in batch])
+                for (line_no, tx, ref, entry), result in zip(batch, results):
+                    if result.get('ok'):
+                        stats['paid'] += 1
+                    else:
+                        _unmatched(line_no, tx, ref, entry['amount'], result.get('error'), 'failed')
+                if auto_commit:
+                    self.env.cr.commit()
+                self.env.invalidate_all()
+            batch[:] = []
+
+        for line_no, row in enumerate(reader, start=2):
+            stats['rows'] += 1
+            tx = (row.get(columns.get('transaction_id')) or '').strip()
+            ref = (row.get(columns.get('reference')) or '').strip()
+            status = (row.get(columns.get('status')) or '').strip().lower()
+            raw_amount = row.get(columns['amount'])
+            if status not in SETTLEMENT_SUCCESS_STATUSES:
+                _unmatched(line_no, tx, ref, raw_amount, 'not_succeeded', 'skipped')
+                continue
+            try:
+                amount = abs(self._parse_amount(raw_amount))
+            except ValueError:
+                amount = 0.0
+            if amount <= 0:
+                # jamais de montant implicite : un montant vide / nul n'encaisse pas le reste dû
+                _unmatched(line_no, tx, ref, raw_amount, 'invalid_amount')
+                continue
+            move_id = index.get(tx) if tx else None
+            if not move_id and ref:
+                move_id = index.get(ref)
+            if not move_id:
+                _unmatched(line_no, tx, ref, amount, 'no_open_invoice')
+                continue
+            if move_id in seen_moves:
+                _unmatched(line_no, tx, ref, amount, 'duplicate')
+                continue
+            seen_moves.add(move_id)
+            stats['matched'] += 1
+            try:
+                payment_date = fields.Date.to_date((row.get(columns.get('date')) or '')[:10] or None)
+            except ValueError:
+                payment_date = None
+            batch.append((line_no, tx, ref, {
+                'invoice_id': move_id,
+                'amount': amount,
+                'journal_id': journal_id,
+                'payment_date': payment_date,
+                'ref': tx or ref,
+            }))
+            if len(batch) >= batch_size:
+                _flush()
+        _flush()
+
+        attachment = False
+        if stats['unmatched'] or stats['failed'] or stats['skipped']:
+            report.seek(0)
+            attachment = self.env['ir.attachment'].sudo().create({
+                'name': 'rapprochement_%s_%s.csv' % (provider, fields.Datetime.now().strftime('%Y%m%d_%H%M%S')),
+                'type': 'binary',
+                'datas': base64.b64encode(report.read().encode('utf-8')),
+                'mimetype': 'text/csv',
+            })
+            if auto_commit:
+                self.env.cr.commit()
+        report.close()
+
+        stats['elapsed'] = round(time.monotonic() - started, 3)
+        stats['report_attachment_id'] = attachment.id if attachment else None
+        stats['unmatched_preview'] = preview
+        _logger.info("[SETTLEMENT] %s: %s ligne(s), %s encaissée(s), %s non rapprochée(s) en %.2fs",
+                     provider, stats['rows'], stats['paid'], stats['unmatched'], stats['elapsed'])
+        return stats
+
+
+def _chain(head, stream):
+    """Relit l'échantillon utilisé pour détecter le format puis le reste du flux, ligne à ligne."""
+    for line in io.StringIO(head):
+        if line.endswith('\n'):
+            yield line
+        else:
+            # ligne coupée par l'échantillon : compléter avec la suite du flux
+            yield line + stream.readline()
+    for line in stream:
+        yield line
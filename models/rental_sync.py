@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Conservation des tombstones : un jeton plus ancien impose une synchro complète
+SYNC_TOMBSTONE_RETENTION_DAYS = 90
+
+
+class RentalSyncTombstone(models.Model):
+    _name = 'rental.sync.tombstone'
+    _description = 'Suppressions à propager aux applications mobiles'
+    _order = 'deleted_at, id'
+    _log_access = False
+
+    model = fields.Char(string='Modèle', required=True, index=True)
+    res_id = fields.Integer(string='ID supprimé', required=True)
+    partner_id = fields.Many2one('res.partner', string='Locataire', required=True, index=True, ondelete='cascade')
+    # Horloge PostgreSQL (début de transaction), comme write_date et le jeton de synchro
+    deleted_at = fields.Datetime(string='Supprimé le', required=True, index=True,
+                                 default=lambda self: self.env.cr.now())
+
+    @api.model
+    def _record(self, model_name, partner_by_id):
+        """Enregistre les tombstones {res_id: partner_id} d'un modèle (ignore les ids sans locataire)."""
+        vals_list = [{'model': model_name, 'res_id': res_id, 'partner_id': partner_id}
+                     for res_id, partner_id in partner_by_id.items() if partner_id]
+        if vals_list:
+            self.sudo().create(vals_list)
+
+    @api.autovacuum
+    def _gc_tombstones(self):
+        limit = fields.Datetime.now() - timedelta(days=SYNC_TOMBSTONE_RETENTION_DAYS)
+        self.sudo().search([('deleted_at', '<', limit)]).unlink()
+
+
+class RentalContractSync(models.Model):
+    _inherit = 'rental.contract'
+
+    def unlink(self):
+        Tombstone = self.env['rental.sync.tombstone']
+        tenants = {c.id: c.tenant_id.id for c in self}
+        Tombstone._record('rental.contract', tenants)
+        # Échéances supprimées par ON DELETE CASCADE et factures détachées
+        # (rental_contract_id ondelete='set null') : invisibles des unlink() du
+        # modèle, elles sortent pourtant du périmètre de synchro du locataire
+        Tombstone._record('rental.payment.schedule', {
+            s['id']: tenants.get(s['contract_id'])
+            for s in self.env['rental.payment.schedule'].sudo().search_read(
+                [('contract_id', 'in', self.ids)], ['contract_id'], load=False)})
+        Tombstone._record('account.move', {
+            m['id']: tenants.get(m['rental_contract_id'])
+            for m in self.env['account.move'].sudo().search_read(
+                [('rental_contract_id', 'in', self.ids), ('move_type', '=', 'out_invoice')],
+                ['rental_contract_id'], load=False)})
+        return super().unlink()
+
+
+class AccountMoveSync(models.Model):
+    _inherit = 'account.move'
+
+    def unlink(self):
+        self.env['rental.sync.tombstone']._record('account.move', {
+            m.id: m.rental_contract_id.tenant_id.id
+            for m in self if m.rental_contract_id and m.move_type == 'out_invoice'})
+        return super().unlink()
+
+
+class RentalPaymentScheduleSync(models.Model):
+    _inherit = 'rental.payment.schedule'
+
+    def unlink(self):
+        self.env['rental.sync.tombstone']._record(
+            'rental.payment.schedule', {s.id: s.contract_id.tenant_id.id for s in self})
+        return super().unlink()
+
+
+class RentalPropertySync(models.Model):
+    _inherit = 'rental.property'
+
+    def unlink(self):
+        self.env['rental.sync.tombstone']._record(
+            'rental.property', {p.id: p.current_tenant_id.id for p in self})
+        return super().unlink()
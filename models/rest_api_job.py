@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from psycopg2.extras import execute_values
+from datetime import timedelta
+import json
+import logging
+import time
+
+from .contact_keys import normalize_phone
+from .partner import CONTACT_KEYS_BACKFILLED_PARAM
+from .rest_api_otp import OTP_TTL
+
+_logger = logging.getLogger(__name__)
+
+JOB_CHUNK_SIZE = 5000
+JOB_TIME_BUDGET = 240  # secondes par passage du cron ; le job reprend au passage suivant
+
+# Jobs courts et urgents : cron dédié, jamais derrière un traitement de masse
+URGENT_JOB_TYPES = ('send_otp',)
+URGENT_JOB_TIME_BUDGET = 30
+# Jobs dont les paramètres contiennent un secret (code OTP en clair) : effacés en fin de job
+SENSITIVE_JOB_TYPES = ('send_otp',)
+# Conservation des jobs terminés / en échec (jours)
+JOB_RETENTION_DAYS = 30
+SENSITIVE_JOB_RETENTION_DAYS = 1
+
+
+class RestApiJob(models.Model):
+    _name = 'rest.api.job'
+    _description = 'Traitement de maintenance en arrière-plan'
+    _order = 'id desc'
+
+    name = fields.Char(string='Libellé', required=True)
+    job_type = fields.Selection([
+        ('partner_verify_children', 'Vérification des contacts enfants'),
+        ('send_otp', 'Envoi de code OTP'),
+        ('partner_contact_keys', 'Normalisation des téléphones des contacts'),
+    ], string='Type', required=True)
+    params = fields.Text(string='Paramètres (JSON)')
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('running', 'En cours'),
+        ('done', 'Terminé'),
+        ('failed', 'En échec'),
+    ], default='pending', required=True, index=True)
+    total = fields.Integer(string='Total')
+    processed = fields.Integer(string='Traités')
+    progress = fields.Float(string='Progression (%)', compute='_compute_progress')
+    started_at = fields.Datetime(string='Démarré le')
+    finished_at = fields.Datetime(string='Terminé le')
+    error = fields.Text(string='Erreur')
+
+    @api.depends('total', 'processed', 'state')
+    def _compute_progress(self):
+        for job in self:
+            job.progress = round(100.0 * job.processed / job.total, 2) if job.total else (100.0 if job.state == 'done' else 0.0)
+
+    @api.model
+    def _enqueue(self, job_type, name, params=None):
+        """Crée le job et réveille le cron ; retourne immédiatement."""
+        job = self.sudo().create({
+            'name': name,
+            'job_type': job_type,
+            'params': json.dumps(params or {}),
+        })
+        cron = self.env.ref(self._cron_xmlid(job_type), raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return job
+
+    @api.model
+    def _cron_xmlid(self, job_type):
+        if job_type in URGENT_JOB_TYPES:
+            return 'res_api_magasin.rest_api_job_runner_urgent'
+        return 'res_api_magasin.rest_api_job_runner'
+
+    def _status_payload(self):
+        self.ensure_one()
+        return {
+            'job_id': self.id,
+            'name': self.name,
+            'type': self.job_type,
+            'state': self.state,
+            'total': self.total,
+            'processed': self.processed,
+            'progress': self.progress,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'error': self.error,
+        }
+
+    # ------------------------------------------------------------------
+    # CRON
+    # ------------------------------------------------------------------
+    @api.model
+    def _cron_run_jobs(self, auto_commit=True, urgent=False):
+        """
+        Exécute les jobs en attente / interrompus, un par un, dans un budget de temps.
+        urgent=True : uniquement URGENT_JOB_TYPES (cron dédié) ; sinon tous les autres.
+        """
+        deadline = time.monotonic() + (URGENT_JOB_TIME_BUDGET if urgent else JOB_TIME_BUDGET)
+        domain = [('state', 'in', ('pending', 'running')),
+                  ('job_type', 'in' if urgent else 'not in', URGENT_JOB_TYPES)]
+        for job in self.search(domain, order='id'):
+            if time.monotonic() >= deadline:
+                break
+            job._run(deadline, auto_commit=auto_commit)
+        if self.search_count(domain):
+            self.env.ref('res_api_magasin.rest_api_job_runner_urgent' if urgent
+                         else 'res_api_magasin.rest_api_job_runner')._trigger()
+
+    @api.autovacuum
+    def _gc_finished_jobs(self):
+        now = fields.Datetime.now()
+        self.env.cr.execute("""
+            DELETE FROM rest_api_job
+             WHERE state IN ('done', 'failed')
+               AND COALESCE(finished_at, create_date) < CASE WHEN job_type IN %s THEN %s ELSE %s END
+        """, (URGENT_JOB_TYPES, now - timedelta(days=SENSITIVE_JOB_RETENTION_DAYS),
+              now - timedelta(days=JOB_RETENTION_DAYS)))
+
+    def _run(self, deadline, auto_commit=True):
+        self.ensure_one()
+        if self.state == 'pending':
+            self.write({'state': 'running', 'started_at': fields.Datetime.now()})
+            if auto_commit:
+                self.env.cr.commit()
+        try:
+            finished = getattr(self, '_run_%s' % self.job_type)(json.loads(self.params or '{}'), deadline, auto_commit)
+        except Exception as e:
+            self.env.cr.rollback()
+            _logger.exception("[JOB %s] %s en échec", self.id, self.name)
+            vals = {'state': 'failed', 'error': str(e), 'finished_at': fields.Datetime.now()}
+            if self.job_type in SENSITIVE_JOB_TYPES:
+                vals['params'] = False
+            self.write(vals)
+        else:
+            if finished:
+                self.write({'state': 'done', 'finished_at': fields.Datetime.now()})
+                _logger.info("[JOB %s] %s terminé : %s enregistrement(s)", self.id, self.name, self.processed)
+        if auto_commit:
+            self.env.cr.commit()
+
+    # ------------------------------------------------------------------
+    # Jobs
+    # ------------------------------------------------------------------
+    def _run_partner_verify_children(self, params, deadline, auto_commit):
+        """
+        Marque is_verified sur les contacts enfants, par UPDATE ensemblistes de
+        JOB_CHUNK_SIZE lignes (un commit par lot). Reprenable : seuls les contacts
+        pas encore vérifiés sont sélectionnés.
+        :return: True si terminé, False si le budget de temps est épuisé
+        """
+        cr = self.env.cr
+        Partner = self.env['res.partner']
+        Partner.flush_model(['parent_id', 'is_verified'])
+        cr.execute("SELECT id FROM res_partner WHERE parent_id IS NOT NULL AND is_verified IS NOT TRUE ORDER BY id")
+        ids = [row[0] for row in cr.fetchall()]
+        if not self.total:
+            self.total = len(ids)
+        for start in range(0, len(ids), JOB_CHUNK_SIZE):
+            if time.monotonic() >= deadline:
+                return False
+            chunk = ids[start:start + JOB_CHUNK_SIZE]
+            cr.execute("""
+                UPDATE res_partner
+                   SET is_verified = TRUE, write_uid = %s, write_date = (now() AT TIME ZONE 'UTC')
+                 WHERE id = ANY(%s)
+            """, (self.env.uid, chunk))
+            Partner.invalidate_model(['is_verified', 'write_uid', 'write_date'])
+            self.processed += len(chunk)
+            if auto_commit:
+                cr.commit()
+        return True
+
+    def _run_partner_contact_keys(self, params, deadline, auto_commit):
+        """
+        Remplit phone_e164 / mobile_e164 par lots de JOB_CHUNK_SIZE contacts (un commit
+        par lot), puis active les recherches exactes. Reprenable : le dernier id traité
+        est conservé dans les paramètres.
+        """
+        cr = self.env.cr
+        Partner = self.env['res.partner']
+        Partner.flush_model(['phone', 'mobile'])
+        last_id = params.get('last_id', 0)
+        if not self.total:
+            cr.execute("SELECT count(*) FROM res_partner WHERE id > %s AND (phone IS NOT NULL OR mobile IS NOT NULL)", (last_id,))
+            self.total = cr.fetchone()[0]
+        while True:
+            if time.monotonic() >= deadline:
+                return False
+            cr.execute("""
+                SELECT id, phone, mobile
+                  FROM res_partner
+                 WHERE id > %s AND (phone IS NOT NULL OR mobile IS NOT NULL)
+                 ORDER BY id
+                 LIMIT %s
+            """, (last_id, JOB_CHUNK_SIZE))
+            rows = cr.fetchall()
+            if not rows:
+                break
+            execute_values(cr._obj, """
+                UPDATE res_partner p
+                   SET phone_e164 = v.phone_e164, mobile_e164 = v.mobile_e164
+                  FROM (VALUES %s) AS v(id, phone_e164, mobile_e164)
+                 WHERE p.id = v.id
+            """, [(pid, normalize_phone(phone), normalize_phone(mobile)) for pid, phone, mobile in rows])
+            Partner.invalidate_model(['phone_e164', 'mobile_e164'])
+            last_id = rows[-1][0]
+            self.write({'processed': self.processed + len(rows), 'params': json.dumps({'last_id': last_id})})
+            if auto_commit:
+                cr.commit()
+        self.env['ir.config_parameter'].sudo().set_param(CONTACT_KEYS_BACKFILLED_PARAM, 'True')
+        return True
+
+    def _run_send_otp(self, params, deadline, auto_commit):
+        """
+        Envoie un code OTP par SMS (à défaut par email, via la file mail.mail).
+        Le message contient le code en clair : les paramètres sont effacés en fin de
+        job (succès ou échec, cf. _run). Un code déjà expiré n'est pas envoyé.
+        """
+        self.total = 1
+        if self.create_date < fields.Datetime.now() - timedelta(seconds=OTP_TTL):
+            _logger.warning("[JOB %s] code OTP expiré avant envoi, ignoré", self.id)
+            self.write({'params': False, 'error': "Code expiré avant envoi"})
+            return True
+        if params.get('phone'):
+            self.env['send.sms'].sudo().create({
+                'recipient': params['phone'],
+                'message': params['message'],
+            }).send_sms()
+        elif params.get('email'):
+            self.env['mail.mail'].sudo().create({
+                'email_to': params['email'],
+                'subject': "Code de vérification",
+                'body_html': '<p>%s</p>' % params['message'],
+                'auto_delete': True,
+            })
+        self.write({'processed': 1, 'params': False})
+        return True
@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from datetime import timedelta
+import hashlib
+import hmac
+import logging
+import secrets
+
+_logger = logging.getLogger(__name__)
+
+OTP_LENGTH = 4                # le front saisit 4 chiffres (zfill côté contrôleur)
+OTP_TTL = 300                 # secondes de validité d'un code
+OTP_MAX_ATTEMPTS = 5          # vérifications ratées avant invalidation du code
+OTP_RESEND_INTERVAL = 60      # secondes minimum entre deux envois
+OTP_MAX_SENDS_PER_HOUR = 5
+
+# Émission atomique : crée ou remplace le code de l'identité, sauf si l'identité
+# est encore dans l'intervalle de renvoi ou a épuisé son quota horaire.
+_OTP_ISSUE_QUERY = """
+    INSERT INTO rest_api_otp (identity, partner_id, code_hash, expires_at, attempts,
+                              last_sent_at, window_start, window_sends)
+    VALUES (%(identity)s, %(partner_id)s, %(code_hash)s, %(now)s + make_interval(secs => %(ttl)s), 0,
+            %(now)s, %(now)s, 1)
+    ON CONFLICT (identity) DO UPDATE SET
+        partner_id = EXCLUDED.partner_id,
+        code_hash = EXCLUDED.code_hash,
+        expires_at = EXCLUDED.expires_at,
+        attempts = 0,
+        last_sent_at = EXCLUDED.last_sent_at,
+        window_start = CASE WHEN rest_api_otp.window_start <= %(now)s - interval '1 hour'
+                            THEN EXCLUDED.window_start ELSE rest_api_otp.window_start END,
+        window_sends = CASE WHEN rest_api_otp.window_start <= %(now)s - interval '1 hour'
+                            THEN 1 ELSE rest_api_otp.window_sends + 1 END
+    WHERE rest_api_otp.last_sent_at <= %(now)s - make_interval(secs => %(resend)s)
+      AND (rest_api_otp.window_start <= %(now)s - interval '1 hour'
+           OR rest_api_otp.window_sends < %(max_sends)s)
+    RETURNING id
+"""
+
+# Vérification : la tentative est comptée avant la comparaison, dans la même requête
+_OTP_ATTEMPT_QUERY = """
+    UPDATE rest_api_otp
+       SET attempts = attempts + 1
+     WHERE identity = %(identity)s
+       AND code_hash IS NOT NULL
+       AND expires_at > %(now)s
+       AND attempts < %(max_attempts)s
+ RETURNING code_hash, attempts
+"""
+
+
+class RestApiOtp(models.Model):
+    """
+    Codes OTP hors de res.partner : une ligne par identité, code haché (HMAC),
+    durée de vie courte, tentatives et envois limités. L'envoi SMS / email est
+    délégué à la file rest.api.job : la requête HTTP ne fait qu'un INSERT.
+    """
+    _name = 'rest.api.otp'
+    _description = 'Codes OTP (API REST)'
+    _log_access = False
+
+    identity = fields.Char(string='Identité', required=True)
+    partner_id = fields.Many2one('res.partner', string='Client', ondelete='cascade')
+    code_hash = fields.Char(string='Empreinte du code')
+    expires_at = fields.Datetime(string='Expire le', index=True)
+    attempts = fields.Integer(string='Tentatives', default=0)
+    last_sent_at = fields.Datetime(string='Dernier envoi')
+    window_start = fields.Datetime(string='Début de la fenêtre d\'envoi')
+    window_sends = fields.Integer(string='Envois dans la fenêtre', default=0)
+
+    _sql_constraints = [
+        ('identity_uniq', 'unique(identity)', "Un seul code OTP actif par identité."),
+    ]
+
+    # ------------------------------------------------------------------
+    # Helpers
+    # ------------------------------------------------------------------
+    @api.model
+    def _identity(self, partner):
+        return 'partner:%s' % partner.id
+
+    @api.model
+    def _hash_code(self, identity, code):
+        secret = self.env['ir.config_parameter'].sudo().get_param('database.secret') or ''
+        message = ('%s:%s' % (identity, code)).encode()
+        return hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+
+    @api.model
+    def _generate_code(self):
+        return str(secrets.randbelow(10 ** OTP_LENGTH)).zfill(OTP_LENGTH)
+
+    # ------------------------------------------------------------------
+    # API
+    # ------------------------------------------------------------------
+    @api.model
+    def send_code(self, partner):
+        """
+        Génère un code pour `partner` et met son envoi en file d'attente.
+
+        :return: 'sent', 'rate_limited' ou 'no_channel' (ni téléphone ni email)
+        """
+        phone = partner.mobile or partner.phone
+        if not phone and not partner.email:
+            return 'no_channel'
+        identity = self._identity(partner)
+        code = self._generate_code()
+        self.env.cr.execute(_OTP_ISSUE_QUERY, {
+            'identity': identity,
+            'partner_id': partner.id,
+            'code_hash': self._hash_code(identity, code),
+            'now': fields.Datetime.now(),
+            'ttl': OTP_TTL,
+            'resend': OTP_RESEND_INTERVAL,
+            'max_sends': OTP_MAX_SENDS_PER_HOUR,
+        })
+        if not self.env.cr.fetchone():
+            _logger.info("[OTP] envoi refusé (limite) pour %s", identity)
+            return 'rate_limited'
+        self.invalidate_model()
+
+        message = "Votre code de vérification Touba Sandaga est : %s (valable %s minutes)" % (code, OTP_TTL // 60)
+        self.env['rest.api.job']._enqueue('send_otp', "Envoi OTP %s" % identity, {
+            'partner_id': partner.id,
+            'phone': phone or False,
+            'email': partner.email or False,
+            'message': message,
+        })
+        return 'sent'
+
+    @api.model
+    def verify_code(self, partner, code):
+        """
+        Vérifie `code` en temps constant ; le code est consommé en cas de succès.
+
+        :return: 'ok', 'invalid' (mauvais code, tentatives restantes)
+                 ou 'expired' (absent, expiré ou tentatives épuisées)
+        """
+        identity = self._identity(partner)
+        self.env.cr.execute(_OTP_ATTEMPT_QUERY, {
+            'identity': identity,
+            'now': fields.Datetime.now(),
+            'max_attempts': OTP_MAX_ATTEMPTS,
+        })
+        row = self.env.cr.fetchone()
+        if not row:
+            return 'expired'
+        code_hash, attempts = row
+        if not hmac.compare_digest(code_hash, self._hash_code(identity, str(code or '').strip())):
+            _logger.info("[OTP] code erroné pour %s (tentative %s/%s)", identity, attempts, OTP_MAX_ATTEMPTS)
+            return 'invalid' if attempts < OTP_MAX_ATTEMPTS else 'expired'
+        # consommé : la ligne est conservée pour les limites d'envoi
+        self.env.cr.execute("UPDATE rest_api_otp SET code_hash = NULL, expires_at = NULL WHERE identity = %s", (identity,))
+        self.invalidate_model()
+        return 'ok'
+
+    @api.autovacuum
+    def _gc_expired_codes(self):
+        limit = fields.Datetime.now() - timedelta(days=1)
+        self.env.cr.execute("DELETE FROM rest_api_otp WHERE last_sent_at < %s", (limit,))
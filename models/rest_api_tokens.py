@@ -50,3 +50,7 @@ class RestApiRefreshToken(models.Model):
     user_id = fields.Integer()
     # absolute expiry time of 'refresh_token' (in global seconds)
     expiry_time = fields.Float(index=True)
+    # first 'refresh_token' (hashed) of the rotation chain
+    family = fields.Char(index=True)
+    # time the token was rotated (in global seconds); kept until expiry for reuse detection
+    rotated_at = fields.Float()
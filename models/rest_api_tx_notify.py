@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+from odoo import models, tools
+import logging
+
+_logger = logging.getLogger(__name__)
+
+# Canal PostgreSQL écouté par controllers/tx_events.py
+TX_NOTIFY_CHANNEL = 'rest_api_tx'
+
+# table -> colonnes de statut surveillées
+TX_NOTIFY_TABLES = {
+    'account_move': ('payment_state', 'state'),
+    'wave_transaction': ('status', 'payment_status', 'checkout_status'),
+    'orange_money_transaction': ('status',),
+}
+
+_NOTIFY_FUNCTION = """
+    CREATE OR REPLACE FUNCTION rest_api_notify_tx() RETURNS trigger AS $$
+    BEGIN
+        PERFORM pg_notify('%s', json_build_object('db', current_database(), 'tx', NEW.transaction_id)::text);
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+""" % TX_NOTIFY_CHANNEL
+
+
+class RestApiTxNotify(models.AbstractModel):
+    _name = 'rest.api.tx.notify'
+    _description = 'Notifications PostgreSQL des changements de statut de paiement'
+
+    def init(self):
+        """
+        Triggers NOTIFY (envoyés au commit) sur les changements de statut des
+        factures et des transactions Wave / Orange Money ayant un transaction_id.
+        """
+        cr = self.env.cr
+        cr.execute(_NOTIFY_FUNCTION)
+        for table, columns in TX_NOTIFY_TABLES.items():
+            if not tools.table_exists(cr, table) or not tools.column_exists(cr, table, 'transaction_id'):
+                continue
+            columns = [c for c in columns if tools.column_exists(cr, table, c)]
+            if not columns:
+                continue
+            changed = ' OR '.join('OLD."%s" IS DISTINCT FROM NEW."%s"' % (c, c) for c in columns)
+            trigger = '%s_rest_api_notify_tx' % table
+            cr.execute('DROP TRIGGER IF EXISTS "%s" ON "%s"' % (trigger, table))
+            cr.execute("""
+                CREATE TRIGGER "%s"
+                 AFTER UPDATE OF %s ON "%s"
+                   FOR EACH ROW
+                  WHEN (NEW.transaction_id IS NOT NULL AND (%s))
+                EXECUTE PROCEDURE rest_api_notify_tx()
+            """ % (trigger, ', '.join('"%s"' % c for c in columns), table, changed))
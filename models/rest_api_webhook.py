@@ -0,0 +1,299 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from datetime import timedelta
+from requests.adapters import HTTPAdapter
+import hashlib
+import hmac
+import json
+import logging
+import random
+import requests
+import secrets
+import time
+
+_logger = logging.getLogger(__name__)
+
+WEBHOOK_EVENT_TYPES = [
+    ('invoice.posted', 'Facture validée'),
+    ('invoice.paid', 'Facture payée'),
+    ('contract.state_changed', 'Changement d\'état de contrat'),
+    ('schedule.created', 'Échéance créée'),
+]
+# event_type -> champ booléen d'abonnement
+WEBHOOK_EVENT_FIELDS = {
+    'invoice.posted': 'on_invoice_posted',
+    'invoice.paid': 'on_invoice_paid',
+    'contract.state_changed': 'on_contract_state',
+    'schedule.created': 'on_schedule_created',
+}
+WEBHOOK_BACKOFF_BASE = 30          # secondes, doublé à chaque tentative
+WEBHOOK_BACKOFF_MAX = 6 * 3600
+WEBHOOK_DISPATCH_TIME_BUDGET = 240  # secondes par passage du cron
+
+# Session HTTP partagée par worker (connexions keep-alive réutilisées)
+_webhook_session = None
+
+
+def _get_webhook_session():
+    global _webhook_session
+    if _webhook_session is None:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=16, pool_maxsize=32)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        session.headers.update({'Content-Type': 'application/json', 'User-Agent': 'res_api_magasin-webhooks'})
+        _webhook_session = session
+    return _webhook_session
+
+
+def webhook_signature(secret, timestamp, body):
+    """HMAC-SHA256 hex de '<timestamp>.<body>' (en-tête X-Webhook-Signature: sha256=...)."""
+    message = b'%s.%s' % (str(timestamp).encode(), body)
+    return hmac.new((secret or '').encode(), message, hashlib.sha256).hexdigest()
+
+
+class RestApiWebhook(models.Model):
+    _name = 'rest.api.webhook'
+    _description = 'Abonnement webhook sortant'
+    _order = 'name'
+
+    name = fields.Char(string='Nom', required=True)
+    url = fields.Char(string='URL', required=True)
+    secret = fields.Char(string='Secret HMAC', required=True, copy=False,
+                         default=lambda self: secrets.token_hex(32))
+    active = fields.Boolean(default=True)
+    on_invoice_posted = fields.Boolean(string='Facture validée', default=True)
+    on_invoice_paid = fields.Boolean(string='Facture payée', default=True)
+    on_contract_state = fields.Boolean(string='Changement d\'état de contrat', default=True)
+    on_schedule_created = fields.Boolean(string='Échéance créée', default=False)
+    batch_size = fields.Integer(string='Événements par envoi', default=50)
+    max_attempts = fields.Integer(string='Tentatives max', default=8)
+    timeout = fields.Integer(string='Timeout (s)', default=10)
+    event_ids = fields.One2many('rest.api.webhook.event', 'webhook_id', string='Événements')
+    pending_count = fields.Integer(string='En attente', compute='_compute_counts')
+    dead_count = fields.Integer(string='En échec définitif', compute='_compute_counts')
+
+    def _compute_counts(self):
+        Event = self.env['rest.api.webhook.event']
+        counts = {(g['webhook_id'][0], g['state']): g['__count'] for g in Event.read_group(
+            [('webhook_id', 'in', self.ids), ('state', 'in', ('pending', 'dead'))],
+            ['webhook_id', 'state'], ['webhook_id', 'state'], lazy=False)}
+        for webhook in self:
+            webhook.pending_count = counts.get((webhook.id, 'pending'), 0)
+            webhook.dead_count = counts.get((webhook.id, 'dead'), 0)
+
+    def action_retry_dead(self):
+        self.env['rest.api.webhook.event'].search([('webhook_id', 'in', self.ids), ('state', '=', 'dead')]).action_retry()
+
+
+class RestApiWebhookEvent(models.Model):
+    _name = 'rest.api.webhook.event'
+    _description = 'Outbox des webhooks sortants'
+    _order = 'id'
+
+    webhook_id = fields.Many2one('rest.api.webhook', string='Webhook', required=True, ondelete='cascade', index=True)
+    event_type = fields.Selection(WEBHOOK_EVENT_TYPES, string='Événement', required=True)
+    res_model = fields.Char(string='Modèle')
+    res_id = fields.Integer(string='ID')
+    payload = fields.Text(string='Données (JSON)')
+    state = fields.Selection([
+        ('pending', 'En attente'),
+        ('done', 'Livré'),
+        ('dead', 'Échec définitif'),
+    ], default='pending', required=True)
+    attempts = fields.Integer(string='Tentatives', default=0)
+    next_attempt_at = fields.Datetime(string='Prochaine tentative', default=fields.Datetime.now)
+    sent_at = fields.Datetime(string='Livré le')
+    last_error = fields.Text(string='Dernière erreur')
+
+    def init(self):
+        self.env.cr.execute("""
+            CREATE INDEX IF NOT EXISTS rest_api_webhook_event_pending_idx
+                ON rest_api_webhook_event (next_attempt_at, id)
+             WHERE state = 'pending'
+        """)
+
+    # ------------------------------------------------------------------
+    # Outbox
+    # ------------------------------------------------------------------
+    @api.model
+    def _enqueue(self, event_type, records, serialize):
+        """
+        Écrit les événements dans l'outbox (même transaction que le changement métier)
+        pour chaque abonnement actif, puis déclenche le cron de livraison.
+
+        :param records: enregistrements concernés par l'événement
+        :param serialize: fonction record -> dict sérialisable en JSON ; appelée
+                          seulement s'il existe un abonnement actif à l'événement
+        """
+        if not records:
+            return self.browse()
+        webhooks = self.env['rest.api.webhook'].sudo().search([(WEBHOOK_EVENT_FIELDS[event_type], '=', True)])
+        if not webhooks:
+            return self.browse()
+        vals_list = []
+        for record in records:
+            payload = json.dumps(serialize(record), ensure_ascii=False, default=str)
+            for webhook in webhooks:
+                vals_list.append({
+                    'webhook_id': webhook.id,
+                    'event_type': event_type,
+                    'res_model': record._name,
+                    'res_id': record.id,
+                    'payload': payload,
+                })
+        events = self.sudo().create(vals_list)
+        cron = self.env.ref('res_api_magasin.rest_api_webhook_dispatch', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+        return events
+
+    def action_retry(self):
+        self.write({'state': 'pending', 'attempts': 0, 'next_attempt_at': fields.Datetime.now(), 'last_error': False})
+
+    # ------------------------------------------------------------------
+    # Livraison
+    # ------------------------------------------------------------------
+    @api.model
+    def _backoff_delay(self, attempts):
+        delay = min(WEBHOOK_BACKOFF_BASE * (2 ** max(attempts - 1, 0)), WEBHOOK_BACKOFF_MAX)
+        return delay + random.uniform(0, delay / 10.0)
+
+    @api.model
+    def _send_batch(self, webhook, events, session):
+        """POST d'un lot signé ; retourne None si livré, sinon le message d'erreur."""
+        body = json.dumps({'events': [{
+            'id': event.id,
+            'type': event.event_type,
+            'created_at': fields.Datetime.to_string(event.create_date),
+            'attempt': event.attempts + 1,
+            'data': json.loads(event.payload or 'null'),
+        } for event in events]}, ensure_ascii=False).encode('utf-8')
+        timestamp = int(time.time())
+        headers = {
+            'Content-Type': 'application/json',
+            'X-Webhook-Id': str(webhook.id),
+            'X-Webhook-Timestamp': str(timestamp),
+            'X-Webhook-Signature': 'sha256=%s' % webhook_signature(webhook.secret, timestamp, body),
+        }
+        try:
+            response = session.post(webhook.url, data=body, headers=headers, timeout=(5, webhook.timeout or 10))
+        except requests.RequestException as e:
+            return str(e)
+        if 200 <= response.status_code < 300:
+            return None
+        return 'HTTP %s: %s' % (response.status_code, (response.text or '')[:500])
+
+    @api.model
+    def _cron_dispatch(self, session=None, auto_commit=True, time_budget=WEBHOOK_DISPATCH_TIME_BUDGET):
+        """
+        Livre les événements dus, par lot et par abonnement :
+          - sélection FOR UPDATE SKIP LOCKED (plusieurs workers possibles)
+          - un POST signé par lot, commit par lot
+          - échec : backoff exponentiel (+ jitter), 'dead' après max_attempts
+        :param session: objet compatible requests.Session (tests : serveur HTTP local)
+        """
+        session = session or _get_webhook_session()
+        started = time.monotonic()
+        stats = {'sent': 0, 'retried': 0, 'dead': 0}
+        cr = self.env.cr
+        while time.monotonic() - started < time_budget:
+            cr.execute("""
+                SELECT e.webhook_id
+                  FROM rest_api_webhook_event e
+                  JOIN rest_api_webhook w ON w.id = e.webhook_id AND w.active
+                 WHERE e.state = 'pending' AND e.next_attempt_at <= (now() AT TIME ZONE 'UTC')
+                 ORDER BY e.next_attempt_at, e.id
+                 LIMIT 1
+                   FOR UPDATE OF e SKIP LOCKED
+            """)
+            row = cr.fetchone()
+            if not row:
+                break
+            webhook = self.env['rest.api.webhook'].sudo().browse(row[0])
+            cr.execute("""
+                SELECT id
+                  FROM rest_api_webhook_event
+                 WHERE webhook_id = %s AND state = 'pending' AND next_attempt_at <= (now() AT TIME ZONE 'UTC')
+                 ORDER BY id
+                 LIMIT %s
+                   FOR UPDATE SKIP LOCKED
+            """, (webhook.id, max(webhook.batch_size, 1)))
+            events = self.sudo().browse([r[0] for r in cr.fetchall()])
+
+            error = self._send_batch(webhook, events, session)
+            now = fields.Datetime.now()
+            if error is None:
+                events.write({'state': 'done', 'sent_at': now, 'last_error': False})
+                stats['sent'] += len(events)
+            else:
+                attempts = max(events.mapped('attempts')) + 1
+                if attempts >= webhook.max_attempts:
+                    events.write({'state': 'dead', 'attempts': attempts, 'last_error': error})
+                    stats['dead'] += len(events)
+                    _logger.error("[WEBHOOK] %s: %s événement(s) en échec définitif: %s", webhook.name, len(events), error)
+                else:
+                    events.write({
+                        'attempts': attempts,
+                        'last_error': error,
+                        'next_attempt_at': now + timedelta(seconds=self._backoff_delay(attempts)),
+                    })
+                    stats['retried'] += len(events)
+                    _logger.warning("[WEBHOOK] %s: échec d'envoi (tentative %s): %s", webhook.name, attempts, error)
+            # la sélection suivante est en SQL : sans commit, le lot traité doit être écrit en base
+            self.flush_model()
+            if auto_commit:
+                cr.commit()
+        else:
+            # budget épuisé : reprendre immédiatement dans un nouveau passage
+            cron = self.env.ref('res_api_magasin.rest_api_webhook_dispatch', raise_if_not_found=False)
+            if cron:
+                cron.sudo()._trigger()
+        if any(stats.values()):
+            _logger.info("[WEBHOOK] %s livré(s), %s reporté(s), %s en échec définitif",
+                         stats['sent'], stats['retried'], stats['dead'])
+        return stats
+
+    @api.autovacuum
+    def _gc_delivered_events(self):
+        limit = fields.Datetime.now() - timedelta(days=30)
+        self.sudo().search([('state', '=', 'done'), ('sent_at', '<', limit)]).unlink()
+
+
+# ----------------------------------------------------------------------
+# Émission des événements métier
+# ----------------------------------------------------------------------
+class RentalContractWebhook(models.Model):
+    _inherit = 'rental.contract'
+
+    def write(self, vals):
+        if 'state' not in vals:
+            return super().write(vals)
+        old_states = {c.id: c.state for c in self}
+        res = super().write(vals)
+        changed = self.filtered(lambda c: c.state != old_states.get(c.id))
+        self.env['rest.api.webhook.event']._enqueue('contract.state_changed', changed, lambda c: {
+            'id': c.id,
+            'name': c.name,
+            'tenant_id': c.tenant_id.id,
+            'property_id': c.property_id.id,
+            'old_state': old_states.get(c.id),
+            'state': c.state,
+        })
+        return res
+
+
+class RentalPaymentScheduleWebhook(models.Model):
+    _inherit = 'rental.payment.schedule'
+
+    @api.model_create_multi
+    def create(self, vals_list):
+        schedules = super().create(vals_list)
+        self.env['rest.api.webhook.event']._enqueue('schedule.created', schedules, lambda s: {
+            'id': s.id,
+            'contract_id': s.contract_id.id,
+            'tenant_id': s.contract_id.tenant_id.id,
+            'due_date': s.due_date,
+            'amount': s.amount,
+        })
+        return schedules